@@ -0,0 +1,144 @@
+"""Persistent catalog of announcements accumulated across runs in an SQLite database.
+
+Notes:
+    1. Announcements are unique on symbol, date and time, and link.  Adding a known announcement updates its
+    file path, outcome and result.
+    2. Titles are full-text indexed with an FTS5 external content table kept in step by triggers.
+    3. Date and times are stored as ISO 8601 text, "YYYY-MM-DD HH:MM:SS", so they compare and sort as text.
+"""
+from datetime import date, datetime
+import logging
+from pathlib import Path
+import sqlite3
+import threading
+from typing import Iterable, List
+
+from announcements.annTypes import Announcement, Outcome, Result
+
+_logger = logging.getLogger(__name__)
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS announcement (
+    id INTEGER PRIMARY KEY,
+    symbol TEXT NOT NULL,
+    date_time TEXT NOT NULL,
+    title TEXT NOT NULL,
+    is_price_sensitive INTEGER NOT NULL,
+    num_pages INTEGER,
+    file_size TEXT,
+    href TEXT NOT NULL,
+    filepath TEXT,
+    file_type TEXT,
+    outcome TEXT,
+    result TEXT,
+    UNIQUE (symbol, date_time, href)
+);
+CREATE INDEX IF NOT EXISTS announcement_date ON announcement (date_time);
+CREATE INDEX IF NOT EXISTS announcement_sensitive_date ON announcement (is_price_sensitive, date_time);
+CREATE VIRTUAL TABLE IF NOT EXISTS announcement_title USING fts5 (
+    title, content='announcement', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS announcement_ai AFTER INSERT ON announcement BEGIN
+    INSERT INTO announcement_title (rowid, title) VALUES (new.id, new.title);
+END;
+CREATE TRIGGER IF NOT EXISTS announcement_ad AFTER DELETE ON announcement BEGIN
+    INSERT INTO announcement_title (announcement_title, rowid, title) VALUES ('delete', old.id, old.title);
+END;
+CREATE TRIGGER IF NOT EXISTS announcement_au AFTER UPDATE OF title ON announcement BEGIN
+    INSERT INTO announcement_title (announcement_title, rowid, title) VALUES ('delete', old.id, old.title);
+    INSERT INTO announcement_title (rowid, title) VALUES (new.id, new.title);
+END;
+'''
+
+_UPSERT = '''
+INSERT INTO announcement (symbol, date_time, title, is_price_sensitive, num_pages, file_size, href, filepath,
+    file_type, outcome, result)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (symbol, date_time, href) DO UPDATE SET
+    filepath = excluded.filepath, outcome = excluded.outcome, result = excluded.result
+'''
+
+_COLUMNS = 'a.symbol, a.date_time, a.title, a.is_price_sensitive, a.num_pages, a.file_size, a.href, a.filepath, ' \
+           'a.file_type, a.outcome, a.result'
+
+
+# _____________________________________________________________________________
+class Catalog:
+
+    # _____________________________________________________________________________
+    def __init__(self, catalog_fp: Path):
+        catalog_fp.parent.mkdir(parents=True, exist_ok=True)
+        self._catalog_fp = catalog_fp
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(catalog_fp), check_same_thread=False)
+        with self._conn:
+            self._conn.executescript(_SCHEMA)
+
+    # _____________________________________________________________________________
+    def __enter__(self):
+        return self
+
+    # _____________________________________________________________________________
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    # _____________________________________________________________________________
+    def close(self):
+        self._conn.close()
+
+    # _____________________________________________________________________________
+    def add(self, announcements: Iterable[Announcement]) -> int:
+        """Adds announcements, or updates their outcome if already in the catalog
+
+        :return: number of announcements added or updated
+        """
+        rows = [(a.symbol, a.date_time.isoformat(sep=' '), a.title, int(bool(a.is_price_sensitive)),
+                 int(a.num_pages) if str(a.num_pages).isdigit() else None, a.file_size, a.href,
+                 str(a.filepath) if a.filepath else None, a.file_type, a.outcome.name, a.result.name)
+                for a in announcements]
+        with self._lock, self._conn:
+            self._conn.executemany(_UPSERT, rows)
+        _logger.debug(f'Catalog added {len(rows)} announcements')
+        return len(rows)
+
+    # _____________________________________________________________________________
+    def query(self, symbols: Iterable[str] = None, since: date = None, until: date = None,
+                is_price_sensitive: bool = None, text: str = None, limit: int = None) -> List[Announcement]:
+        """Returns announcements matching all the given criteria, newest first
+
+        :param symbols: symbols, or None for all symbols
+        :param since: first date, inclusive
+        :param until: last date, inclusive
+        :param is_price_sensitive: if not None, price sensitivity to match
+        :param text: full-text query on titles, with words matched as a phrase
+        :param limit: maximum number of announcements
+        """
+        sql, where, params = [f'SELECT {_COLUMNS} FROM announcement a'], [], []
+        if text:
+            sql.append('JOIN announcement_title t ON t.rowid = a.id')
+            where.append('announcement_title MATCH ?')
+            params.append('"' + text.replace('"', '""') + '"')
+        if symbols:
+            symbols = [s.upper() for s in symbols]
+            where.append(f'a.symbol IN ({",".join("?" * len(symbols))})')
+            params.extend(symbols)
+        if since:
+            where.append('a.date_time >= ?')
+            params.append(since.isoformat())
+        if until:
+            where.append('a.date_time < ?')
+            params.append(date.fromordinal(until.toordinal() + 1).isoformat())
+        if is_price_sensitive is not None:
+            where.append('a.is_price_sensitive = ?')
+            params.append(int(is_price_sensitive))
+        if where:
+            sql.append('WHERE ' + ' AND '.join(where))
+        sql.append('ORDER BY a.date_time DESC, a.symbol')
+        if limit:
+            sql.append('LIMIT ?')
+            params.append(limit)
+
+        with self._lock:
+            rows = self._conn.execute(' '.join(sql), params).fetchall()
+        return [Announcement(r[0], datetime.fromisoformat(r[1]), r[2], bool(r[3]), r[4], r[5], r[6],
+                    Path(r[7]) if r[7] else None, r[8], Outcome[r[9]], Result[r[10]]) for r in rows]
@@ -4,57 +4,72 @@ import os
 from pathlib import Path
 from typing import List, Set
 
+from common.pathTools import DirectoryIndex, FileEntry, sweep_tree
+
 import announcements.annTypes as typ
 import announcements.annConfig as config
 
 _logger = logging.getLogger(__name__)
 
+_PART_SUFFIX = '.part'
+
 
 # _____________________________________________________________________________
 class CleanOutput:
 
     # _____________________________________________________________________________
-    def __init__(self, app_config: config.AppConfig):
+    def __init__(self, app_config: config.AppConfig, dry_run: bool = False):
         _logger.debug('__init__')
         self._app_config = app_config
+        self._dry_run = dry_run
+
+    # _____________________________________________________________________________
+    def __archive_for(self, entry: FileEntry) -> str:
+        """Returns the per-symbol, per-month archive for an announcement file, or None if not to be archived"""
+        parent = os.path.dirname(entry.path)
+        if entry.name.endswith(_PART_SUFFIX) or parent == str(self._app_config.output_path):
+            return None
+        symbol = os.path.basename(parent)
+        month = datetime.fromtimestamp(entry.mtime, config.asx_tz).strftime('%Y-%m')
+        return os.path.join(self._app_config.archive_path, symbol, f'{symbol}-{month}.zip')
 
     # _____________________________________________________________________________
-    @staticmethod
-    def __delete_old_empty_files(path: os.PathLike, age: timedelta) -> List[typ.Deleted]:
+    def __delete_old_empty_files(self, path: os.PathLike, age: timedelta, index: DirectoryIndex) -> List[typ.Deleted]:
         cutoff = (datetime.now() - age).replace(hour=0, minute=0, second=0).timestamp() if age else None
 
         delete_records = []
-        for parent, dirs, files in os.walk(str(path), topdown=False):
-            # Delete empty and old files
-            for file in [os.path.join(parent, f) for f in files]:
-                if (mtime := os.path.getmtime(file)) < cutoff or os.path.getsize(file) == 0:
-                    result = typ.Result.error
-                    try:
-                        os.remove(file)
-                        result = typ.Result.success
-                        _logger.debug(f'Deleted file "{file}"')
-                    except PermissionError:
-                        _logger.warning(f'Cannot delete file "{file}"')
-                    finally:
-                        symbol = os.path.basename(os.path.dirname(path))
-                        file_date_time = datetime.fromtimestamp(mtime, config.asx_tz)
-                        delete_records.append(typ.Deleted(symbol, file_date_time, os.path.basename(file),
-                                    Path(file), typ.Outcome.deleted, result))
-
-            # Delete empty directories
-            for dir in [os.path.join(parent, d) for d in dirs]:
-                with os.scandir(dir) as it:
-                    if next(it, None) is None:
-                        try:
-                            os.rmdir(dir)
-                            _logger.debug(f'Deleted directory "{dir}"')
-                        except PermissionError:
-                            _logger.warning(f'Cannot delete directory "{dir}"')
+        for record in sweep_tree(path, cutoff, self._dry_run, index=index, archive_for=self.__archive_for):
+            if record.is_dir:
+                if record.error:
+                    _logger.warning(f'Cannot delete directory "{record.path}"')
+                else:
+                    _logger.debug(f'Deleted directory "{record.path}"')
+                continue
+
+            outcome = typ.Outcome.archived if record.archive else typ.Outcome.deleted
+            if self._dry_run:
+                outcome, result = typ.Outcome.nil, typ.Result.nil
+                _logger.info(f'Would {"archive" if record.archive else "delete"} file "{record.path}"')
+            elif record.error:
+                result = typ.Result.error
+                _logger.warning(f'Cannot {outcome.name[:-1]} file "{record.path}": {record.error}')
+            else:
+                result = typ.Result.success
+                _logger.debug(f'{outcome.name.capitalize()} file "{record.path}"')
+            symbol = os.path.basename(os.path.dirname(record.path))
+            file_date_time = datetime.fromtimestamp(record.mtime, config.asx_tz)
+            delete_records.append(typ.Deleted(symbol, file_date_time, os.path.basename(record.path),
+                        Path(record.path), outcome, result))
 
         return delete_records
 
     # _____________________________________________________________________________
-    def process(self) -> List[typ.Deleted]:
+    def process(self, index: DirectoryIndex = None) -> List[typ.Deleted]:
+        """Archives old files, deletes empty files, and deletes empty directories, in the output directory
+
+        :param index: index of output directory, as built for fetching, to avoid walking the directory again
+        """
         _logger.debug('process')
 
-        return self.__delete_old_empty_files(self._app_config.output_path, self._app_config.announcement_age_days)
+        return self.__delete_old_empty_files(self._app_config.output_path, self._app_config.announcement_age_days,
+                    index)
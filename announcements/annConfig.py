@@ -1,5 +1,6 @@
 from datetime import datetime, timedelta
 import logging.handlers
+import os
 from pathlib import Path
 import pytz
 import tzlocal
@@ -8,6 +9,7 @@ _logger = logging.getLogger(__name__)
 
 local_tz = tzlocal.get_localzone()
 asx_tz = pytz.timezone('Australia/Sydney')
+asx_host = 'www.asx.com.au'
 today = datetime.now(local_tz)
 
 
@@ -28,9 +30,24 @@ class AppConfig:
 
         # Output
         self._output_path = Path(base_dp, 'output').resolve()
+        self._blobs_path = Path(base_dp, 'blobs').resolve()  # Same file system as output for hardlinks
+        self._archive_path = Path(base_dp, 'archive').resolve()
+
+        # Persisted state between runs
+        self._data_path = Path(base_dp, 'data').resolve()
+        self._watermarks_fp = Path(self._data_path, 'watermarks.json')
+        self._catalog_fp = Path(self._data_path, 'catalog.sqlite')
 
         self._announcement_age_days = timedelta(days=35)
 
+        # Pipeline, with requests in flight per host limited by the HTTP layer
+        self._scrape_workers = 8
+        self._fetch_workers = 8
+        self._parse_workers = os.cpu_count() or 1
+        self._queue_size = 32
+        self._pool_size = 16
+        self._prewarm_connections = 2
+
     # _____________________________________________________________________________
     @property
     def name(self):
@@ -51,7 +68,62 @@ class AppConfig:
     def output_path(self):
         return self._output_path
 
+    # _____________________________________________________________________________
+    @property
+    def archive_path(self):
+        return self._archive_path
+
+    # _____________________________________________________________________________
+    @property
+    def blobs_path(self):
+        return self._blobs_path
+
+    # _____________________________________________________________________________
+    @property
+    def data_path(self):
+        return self._data_path
+
+    # _____________________________________________________________________________
+    @property
+    def catalog_fp(self):
+        return self._catalog_fp
+
+    # _____________________________________________________________________________
+    @property
+    def watermarks_fp(self):
+        return self._watermarks_fp
+
     # _____________________________________________________________________________
     @property
     def announcement_age_days(self):
         return self._announcement_age_days
+
+    # _____________________________________________________________________________
+    @property
+    def scrape_workers(self):
+        return self._scrape_workers
+
+    # _____________________________________________________________________________
+    @property
+    def fetch_workers(self):
+        return self._fetch_workers
+
+    # _____________________________________________________________________________
+    @property
+    def parse_workers(self):
+        return self._parse_workers
+
+    # _____________________________________________________________________________
+    @property
+    def queue_size(self):
+        return self._queue_size
+
+    # _____________________________________________________________________________
+    @property
+    def pool_size(self):
+        return self._pool_size
+
+    # _____________________________________________________________________________
+    @property
+    def prewarm_connections(self):
+        return self._prewarm_connections
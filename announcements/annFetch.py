@@ -3,14 +3,19 @@ import concurrent.futures
 import logging.config
 import os
 from pathlib import Path
+import re
+import threading
 import time
 from typing import List
 import urllib.parse
 import urllib3
 
-from common.common import url_client, sleep
-from common.metricPrefix import to_decimal_units
-from common.pathTools import sanitize_filename
+from common.blobStore import BlobStore, new_hash
+from common.common import url_headers, sleep
+import common.httpClient as httpClient
+from common.logTools import log_task
+from common.metricPrefix import from_file_size, to_decimal_units
+from common.pathTools import DirectoryIndex, sanitize_filename
 
 import announcements.annConfig as config
 import announcements.annTypes as typ
@@ -19,15 +24,74 @@ _logger = logging.getLogger(__name__)
 
 _URL = 'https://www.asx.com.au/'
 _URL_PATH = '/asx/statistics/announcementTerms.do'
+_CHUNK_SIZE = 64 * 1024
+_PART_SUFFIX = '.part'
+
+_re_content_range = re.compile(r'bytes\s+(\d+)-(\d+)/(\d+|\*)', re.IGNORECASE)
+
+
+# _____________________________________________________________________________
+class FetchBudget:
+    """Wall-clock and byte limits on starting document downloads.  Downloads already started are not interrupted.
+    """
+
+    # _____________________________________________________________________________
+    def __init__(self, seconds: float = None, max_bytes: int = None):
+        self._deadline = time.monotonic() + seconds if seconds else None
+        self._max_bytes = max_bytes
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    # _____________________________________________________________________________
+    def is_expired(self) -> bool:
+        return self._deadline is not None and time.monotonic() >= self._deadline
+
+    # _____________________________________________________________________________
+    def reserve(self, size: int) -> bool:
+        """Reserves bytes for a download of estimated size, if the download fits in the budget"""
+        with self._lock:
+            if self.is_expired():
+                return False
+            if self._max_bytes is not None and self._bytes + (size or 0) > self._max_bytes:
+                return False
+            self._bytes += size or 0
+            return True
 
 
 # _____________________________________________________________________________
 class FetchFile:
 
     # _____________________________________________________________________________
-    def __init__(self, app_config: config.AppConfig):
+    def __init__(self, app_config: config.AppConfig, blobs: BlobStore = None, budget: FetchBudget = None):
         _logger.debug('__init__')
         self._app_config = app_config
+        self._blobs = blobs
+        self._budget = budget if budget is not None else FetchBudget()
+        self._index = None
+        self._path_locks = dict()
+        self._skipped: List[typ.Skipped] = []
+        self._lock = threading.Lock()
+
+    # _____________________________________________________________________________
+    @property
+    def skipped(self) -> List[typ.Skipped]:
+        """Announcements deferred because of an open circuit or the run deadline"""
+        with self._lock:
+            return list(self._skipped)
+
+    # _____________________________________________________________________________
+    @staticmethod
+    def priority(ann: typ.Announcement) -> tuple:
+        """Returns sort key ordering downloads by price sensitive first, then newest, then smallest"""
+        size = from_file_size(ann.file_size)
+        num_pages = int(ann.num_pages) if str(ann.num_pages).isdigit() else None
+        return (not ann.is_price_sensitive, -ann.date_time.timestamp(),
+                size if size is not None else float('inf'), num_pages if num_pages is not None else float('inf'))
+
+    # _____________________________________________________________________________
+    @property
+    def budget(self) -> FetchBudget:
+        return self._budget
 
     # _____________________________________________________________________________
     def __fetch_announcements(self, anns: List[typ.Announcement]):
@@ -38,74 +102,207 @@ class FetchFile:
             for future in concurrent.futures.as_completed(future_entry):
                 ann, id = future.result()
 
+    # _____________________________________________________________________________
+    def fetch(self, ann: typ.Announcement, id: int):
+        """Fetches an announcement document, once prepared, setting its outcome and result.  Announcements with the
+        same file path are fetched one at a time so later ones find the file cached.
+        """
+        with self._lock:
+            path_lock = self._path_locks.setdefault(ann.filepath, threading.Lock())
+        with path_lock, log_task(id):
+            return self.__fetch_announcement(ann, id)
+
     # _____________________________________________________________________________
     def __fetch_announcement(self, ann: typ.Announcement, id: int):
-        _logger.debug(f'> {id:4d} __fetch_item')
-        _logger.debug(f'> {id:4d} symbol {ann.symbol:6s} : {ann.title}')
+        _logger.debug('> %4d __fetch_item', id)
+        _logger.debug('> %4d symbol %-6s : %s', id, ann.symbol, ann.title)
         ann.result = typ.Result.error
         ann.outcome = typ.Outcome.nil
 
         # Check file exists and, if so, if old
-        is_file_exists = ann.filepath.exists()
-        _logger.debug(f'> {id:4d} exists:     {str(is_file_exists):<5s}: "{ann.filepath.name}"')
+        is_file_exists = ann.filepath in self._index
+        _logger.debug('> %4d exists:     %-5s: "%s"', id, is_file_exists, ann.filepath.name)
         if is_file_exists:
             ann.result, ann.outcome = typ.Result.success, typ.Outcome.cached
-            _logger.debug(f'> {id:4d} cached:     "{ann.filepath.name}"')
+            _logger.debug('> %4d cached:     "%s"', id, ann.filepath.name)
             return ann, id
 
-        # Fetch file
-        self.__fetch_file(ann, is_file_exists, id)
+        # Link known document from blob store, otherwise fetch file
+        key, suffix = self.__document_key(ann), ann.filepath.suffix
+        if self._blobs and (blob_fp := self._blobs.lookup(key, suffix)):
+            self._blobs.link(blob_fp, ann.filepath, self.__publish_timestamp(ann))
+            ann.result, ann.outcome = typ.Result.success, typ.Outcome.cached
+            _logger.debug('> %4d linked:     "%s" to "%s"', id, ann.filepath.name, blob_fp.name)
+        elif not self._budget.reserve(from_file_size(ann.file_size)):
+            ann.result, ann.outcome = typ.Result.nil, typ.Outcome.deferred
+            _logger.info('> %4d deferred:   %-6s "%s"', id, ann.symbol, ann.filepath.name)
+        else:
+            self.__fetch_file(ann, key, id)
 
-        # Update file datetime stamp
-        pub_timestamp = time.mktime(ann.date_time.timetuple())
-        file_path_str = str(ann.filepath)
-        os.utime(file_path_str, (pub_timestamp, pub_timestamp))
+        # Update file datetime stamp, already set on files linked from the blob store
+        if ann.result == typ.Result.success:
+            if not self._blobs:
+                pub_timestamp = self.__publish_timestamp(ann)
+                os.utime(str(ann.filepath), (pub_timestamp, pub_timestamp))
+            self._index.add(ann.filepath)
 
         return ann, id
 
     # _____________________________________________________________________________
-    def __fetch_file(self, ann: typ.Announcement, is_file_exists: bool, id: int):
-        _logger.debug(f'> {id:4d} __fetch_file')
+    @staticmethod
+    def __publish_timestamp(ann: typ.Announcement) -> float:
+        return time.mktime(ann.date_time.timetuple())
+
+    # _____________________________________________________________________________
+    @staticmethod
+    def __document_key(ann: typ.Announcement) -> str:
+        """Returns the ASX document ID from the announcement link, or the link if it has no ID"""
+        params = urllib.parse.parse_qs(urllib.parse.urlparse(ann.href).query)
+        if (ids_id := params.get('idsId', None)) and len(ids_id):
+            return ids_id[0]
+        return ann.href
+
+    # _____________________________________________________________________________
+    @staticmethod
+    def __make_headers(offset: int, headers: dict = None) -> dict:
+        """Returns request headers for a document download, with a byte range when resuming from offset.
+
+        Content encoding is disabled so that byte ranges and Content-Length refer to the file bytes.
+        """
+        result = url_headers.copy()
+        result['Accept-Encoding'] = 'identity'
+        if offset:
+            result['Range'] = f'bytes={offset}-'
+        if headers:
+            result.update(headers)
+        return result
+
+    # _____________________________________________________________________________
+    @staticmethod
+    def __write_stream(rsp: urllib3.HTTPResponse, part_path: Path, offset: int, id: int) -> str:
+        """Streams response body to the partial file, appending if the server honoured the range request, and
+        hashing the file content.
+
+        :return: SHA-256 hex digest if the partial file is complete, otherwise None
+        """
+        total = None
+        if rsp.status == 206:
+            match = _re_content_range.match(rsp.headers.get('Content-Range', ''))
+            if not match or int(match.group(1)) != offset:
+                _logger.warning(f'> {id:4d} bad range:  "{rsp.headers.get("Content-Range")}" for offset {offset}')
+                part_path.unlink()
+                return None
+            total = int(match.group(3)) if match.group(3) != '*' else None
+        else:
+            if offset:
+                _logger.debug('> %4d range ignored, restarting download', id)
+            offset = 0
+            if (length := rsp.headers.get('Content-Length')) and length.isdigit():
+                total = int(length)
+        if rsp.headers.get('Content-Encoding', 'identity').lower() != 'identity':
+            total = None
+
+        # Hash content already downloaded when resuming
+        hasher = new_hash()
+        if offset:
+            with part_path.open(mode='rb') as fp:
+                while chunk := fp.read(_CHUNK_SIZE):
+                    hasher.update(chunk)
+
+        size = offset
+        with part_path.open(mode='ab' if offset else 'wb') as fp:
+            for chunk in rsp.stream(_CHUNK_SIZE):
+                fp.write(chunk)
+                hasher.update(chunk)
+                size += len(chunk)
+
+        if total is not None and size != total:
+            _logger.warning(f'> {id:4d} incomplete: {size} of {total} bytes "{part_path.name}"')
+            return None
+        _logger.debug('> %4d written:    %sB "%s"', id, to_decimal_units(size), part_path.name)
+        return hasher.hexdigest()
+
+    # _____________________________________________________________________________
+    def __fetch_file(self, ann: typ.Announcement, key: str, id: int):
+        """Downloads the announcement document by streaming it to a partial file then renaming it into place, or
+        into the blob store and linking it into place.
+
+        A partial file left by an interrupted download is resumed using an HTTP range request.
+        """
+        _logger.debug('> %4d __fetch_file', id)
 
         try:
             url = urllib.parse.urljoin(_URL, ann.href)
             rel_path = ann.filepath.relative_to(self._app_config.output_path)
-            _logger.info(f'> {id:4d} fetching:   {ann.symbol:6s} "{rel_path.name}"')
+            part_path = ann.filepath.with_name(ann.filepath.name + _PART_SUFFIX)
+            offset = part_path.stat().st_size if part_path.exists() else 0
+            if offset:
+                _logger.info('> %4d resuming:   %-6s "%s" from %d', id, ann.symbol, rel_path.name, offset)
+            else:
+                _logger.info('> %4d fetching:   %-6s "%s"', id, ann.symbol, rel_path.name)
 
             rsp = None
             try:
-                _logger.debug(f'> {id:4d} GET:        {url}')
+                _logger.debug('> %4d GET:        %s', id, url)
                 sleep(0.05, 0.2)
-                rsp = url_client.request('GET', url)
-                _logger.debug(f'> {id:4d} GET status:  {rsp.status}')
-                if rsp.status == 200 and ((content_type := rsp.headers.get('Content-Type', ''))
-                                          and content_type.find('text/html') >= 0):
+                rsp = httpClient.request('GET', url, headers=self.__make_headers(offset), preload_content=False)
+                _logger.debug('> %4d GET status:  %d', id, rsp.status)
+                if rsp.status in (200, 206) and ((content_type := rsp.headers.get('Content-Type', ''))
+                                                 and content_type.find('text/html') >= 0):
                     # Process "Agree and continue" page for document link
-                    url = urllib.parse.urljoin(_URL, _URL_PATH)
                     soup = BeautifulSoup(rsp.data, 'lxml')
+                    httpClient.release(rsp)
+                    url = urllib.parse.urljoin(_URL, _URL_PATH)
                     href = soup.find('input', {'name': 'pdfURL'})['value']
-                    headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+                    headers = self.__make_headers(offset, {'Content-Type': 'application/x-www-form-urlencoded'})
                     fields = {'pdfURL': href}
-                    _logger.debug(f'> {id:4d} POST:       {url}')
+                    _logger.debug('> %4d POST:       %s', id, url)
 
                     sleep(0.05, 0.2)
-                    rsp = url_client.request('POST', url, headers=headers, fields=fields, encode_multipart=False)
-                    _logger.debug(f'> {id:4d} POST status:  {rsp.status}')
-                if rsp.status == 200 and ((content_type := rsp.headers.get('Content-Type', ''))
-                                          and content_type.find('application/pdf') >= 0):
+                    rsp = httpClient.request('POST', url, headers=headers, fields=fields, encode_multipart=False,
+                                preload_content=False)
+                    _logger.debug('> %4d POST status:  %d', id, rsp.status)
+                if rsp.status in (200, 206) and ((content_type := rsp.headers.get('Content-Type', ''))
+                                                 and content_type.find('application/pdf') >= 0):
                     # Save file
-                    ann.filepath.write_bytes(rsp.data)
-                    ann.result, ann.outcome = typ.Result.success, typ.Outcome.created
+                    if digest := self.__write_stream(rsp, part_path, offset, id):
+                        if self._blobs:
+                            blob_fp = self._blobs.add(part_path, digest, key, ann.filepath.suffix)
+                            self._blobs.link(blob_fp, ann.filepath, self.__publish_timestamp(ann))
+                        else:
+                            os.replace(part_path, ann.filepath)
+                        ann.result, ann.outcome = typ.Result.success, typ.Outcome.created
+                elif rsp.status == 416:
+                    # Partial file does not match remote document so restart on next run
+                    _logger.warning(f'> {id:4d} range not satisfiable, discarding "{part_path.name}"')
+                    part_path.unlink()
+            except (httpClient.CircuitOpenError, httpClient.DeadlineExceededError) as ex:
+                # Not attempted so retry on next run
+                _logger.warning(f'> {id:4d} deferred: {ex}')
+                ann.result, ann.outcome = typ.Result.nil, typ.Outcome.deferred
+                with self._lock:
+                    self._skipped.append(typ.Skipped(ann.symbol, 'document', httpClient.skip_reason(ex)))
             except urllib3.exceptions.HTTPError as ex:
                 _logger.exception(f'> {id:4d} HTTP error')
+            finally:
+                if rsp is not None:
+                    httpClient.release(rsp)
 
-            return rsp.status
+            return rsp.status if rsp is not None else None
         except Exception as ex:
             _logger.exception(f'> {id:4d} exception fetching file')
 
     # _____________________________________________________________________________
-    def process(self, announcements: List[typ.Announcement]):
-        _logger.debug('process')
+    def prepare(self, announcements: List[typ.Announcement], index: DirectoryIndex = None):
+        """Sets announcement file paths and creates output directories
+
+        :param announcements:
+        :param index: index of output directory, updated with files created
+        """
+        if index is not None:
+            self._index = index
+        elif self._index is None:
+            self._index = DirectoryIndex(self._app_config.output_path)
 
         # Prepare record data for fetching
         dirs = set()
@@ -113,12 +310,21 @@ class FetchFile:
             filename = f'{ann.title}-{ann.date_time.strftime("%Y-%m-%d")}'
             if ann.file_type:
                 filename = f'{filename}.{ann.file_type}'
-            ann.filepath = Path(self._app_config.output_path, ann.symbol.lower(), sanitize_filename(filename)).resolve()
+            ann.filepath = Path(self._app_config.output_path, ann.symbol.lower(), sanitize_filename(filename))
             dirs.add(ann.filepath.parent)
 
         # Create output directories
-        for dir in dirs:
-            dir.mkdir(parents=True, exist_ok=True)
+        self._index.make_dirs(dirs)
+
+    # _____________________________________________________________________________
+    def process(self, announcements: List[typ.Announcement], index: DirectoryIndex = None):
+        """Fetches announcement documents not already in the output directory
+
+        :param announcements:
+        :param index: index of output directory, updated with files created
+        """
+        _logger.debug('process')
+        self.prepare(announcements, index)
 
-        # Fetch announcements
-        self.__fetch_announcements(announcements)
+        # Fetch announcements in priority order
+        self.__fetch_announcements(sorted(announcements, key=self.priority))
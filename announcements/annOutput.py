@@ -1,5 +1,6 @@
 from collections import Counter
 import csv
+from datetime import datetime
 from decimal import Decimal, getcontext, InvalidOperation
 from io import StringIO
 import logging
@@ -11,7 +12,7 @@ from common.common import multisort, today
 from common.metricPrefix import to_decimal_units
 
 from announcements.annLoader import SharesAnnouncement
-from announcements.annTypes import Announcement, Deleted, Result, Outcome
+from announcements.annTypes import Announcement, Deleted, Result, Outcome, Skipped
 
 _logger = logging.getLogger(__name__)
 
@@ -68,16 +69,30 @@ def output_symbols(share_codes: List[SharesAnnouncement]):
 def output_shares_announcements(share_codes: List[SharesAnnouncement]):
     _logger.debug('output_shares_announcements')
 
-    recs = sorted(share_codes, key=lambda x: x.most_recent, reverse=True)
+    recs = sorted(share_codes, key=lambda x: x.most_recent or datetime.min, reverse=True)
     with StringIO() as buf:
         buf.write(f'\n {"symbol":^6s}  |  {"most recent":^24s}  |  {"count":^5s}\n')
 
         for r in recs:
-            date_time = r.most_recent.strftime('%a  %d-%b-%y  %I:%M %p')
+            date_time = r.most_recent.strftime('%a  %d-%b-%y  %I:%M %p') if r.most_recent else f'{"":24s}'
             buf.write(f' {_outsym(r.symbol)}  |  {date_time}  |  {r.count:5d}\n')
         print(buf.getvalue())
 
 
+# _____________________________________________________________________________
+def output_catalog_query(recs: List[Announcement]):
+    _logger.debug('output_catalog_query')
+
+    with StringIO() as buf:
+        buf.write(f'\n {"symbol":^6s}  |  {"date":^18s}  |  {"ps":^2s}  |  title\n')
+        for r in recs:
+            date_time = r.date_time.strftime('%a  %d-%b-%y %H:%M')
+            buf.write(f' {_outsym(r.symbol)}  |  {date_time}  |  {"*" if r.is_price_sensitive else " ":^2s}  |  '
+                      f'{r.title}\n')
+        buf.write(f'\nFound: {len(recs)}\n')
+        print(buf.getvalue())
+
+
 # _____________________________________________________________________________
 def output_announcements_summary(recs: List[Announcement], deleted: List[Deleted]):
     _logger.debug('output_announcements_summary')
@@ -92,13 +107,37 @@ def output_announcements_summary(recs: List[Announcement], deleted: List[Deleted
         buf.write('- Cached:   %5d\n' % counter_outcome[Outcome.cached])
         buf.write('- Created:  %5d\n' % counter_outcome[Outcome.created])
         buf.write('- Nil:      %5d\n' % counter_outcome[Outcome.nil])
+        buf.write('- Deferred: %5d\n' % counter_outcome[Outcome.deferred])
         buf.write('- Deleted:  %5d\n' % counter_outcome[Outcome.deleted])
+        buf.write('- Archived: %5d\n' % counter_outcome[Outcome.archived])
         buf.write('Results\n')
         buf.write('- Warnings: %5d\n' % counter_result[Result.warning])
         buf.write('- Errors:   %5d\n' % counter_result[Result.error])
         print(buf.getvalue())
 
 
+# _____________________________________________________________________________
+def output_skipped(skipped: List[Skipped]):
+    """Outputs symbols skipped because of an open circuit or the run deadline, with pages and documents skipped"""
+    _logger.debug('output_skipped')
+
+    if not skipped:
+        return
+    counter = Counter((s.symbol, s.stage) for s in skipped)
+    reasons = dict()
+    for s in skipped:
+        reasons.setdefault(s.symbol, set()).add(s.reason)
+
+    with StringIO() as buf:
+        buf.write(f'\nSkipped symbols: {len(reasons)}\n')
+        buf.write(f' {"symbol":^6s}  |  {"page":^7s}  |  {"documents":^9s}  |  reason\n')
+        for symbol in sorted(reasons):
+            page = 'skipped' if counter[(symbol, 'page')] else ''
+            buf.write(f' {_outsym(symbol)}  |  {page:7s}  |  {_outn(counter[(symbol, "document")])}  |  '
+                      f'{", ".join(sorted(reasons[symbol]))}\n')
+        print(buf.getvalue())
+
+
 # _____________________________________________________________________________
 def write_report(recs: List[Announcement], deleted: List[Deleted]):
     report_fp = Path(_output_base_path, 'report.csv').resolve()
@@ -0,0 +1,90 @@
+"""Runs announcement scraping and document fetching as concurrent stages.
+
+Notes:
+    1. A producer thread scrapes symbol pages, through the scraper's worker pool, and queues their announcements.
+    Fetch worker threads take announcements from the queue so documents for one symbol are downloaded while the next
+    page is fetched.
+    2. The queue is bounded so scraping is held back when fetching falls behind.
+    3. The queue is a priority queue so, of the announcements scraped so far, the highest priority is fetched first.
+    Scraping stops once the fetch budget has expired, and remaining announcements are deferred by the fetcher.
+    4. Run returns only once both stages have finished, so cleanup and reporting see the complete run.
+"""
+import logging
+import queue
+import threading
+from typing import List
+
+from common.pathTools import DirectoryIndex
+
+import announcements.annTypes as typ
+import announcements.annFetch as fetch
+import announcements.scrapeAnn as scrape
+
+_logger = logging.getLogger(__name__)
+
+_END = ((True,), 0, None, None)  # Queue sentinel ending a fetch worker, ordered after all announcements
+
+
+# _____________________________________________________________________________
+class AnnPipeline:
+
+    # _____________________________________________________________________________
+    def __init__(self, scraper: scrape.AnnPageScraper, fetcher: fetch.FetchFile, fetch_workers: int = 2,
+                queue_size: int = 32):
+        _logger.debug('__init__')
+        self._scraper = scraper
+        self._fetcher = fetcher
+        self._fetch_workers = max(1, fetch_workers)
+        self._queue = queue.PriorityQueue(maxsize=max(1, queue_size))
+        self._announcements: List[typ.Announcement] = []
+
+    # _____________________________________________________________________________
+    def __scrape(self, shares_anns: List[typ.SharesAnnouncement], index: DirectoryIndex):
+        _logger.debug('__scrape')
+
+        id = 0
+        try:
+            for i, lst in enumerate(self._scraper.iter_announcements(shares_anns), 1):
+                self._fetcher.prepare(lst, index)
+                self._announcements.extend(lst)
+                for ann in lst:
+                    self._queue.put(((False, self._fetcher.priority(ann)), id, ann, id))  # Blocks while queue full
+                    id += 1
+                if self._fetcher.budget.is_expired():
+                    _logger.warning(f'Fetch budget expired, {len(shares_anns) - i} symbols not scraped')
+                    break
+        except Exception as ex:
+            _logger.exception('Exception scraping announcements')
+        finally:
+            for _ in range(self._fetch_workers):
+                self._queue.put(_END)
+
+    # _____________________________________________________________________________
+    def __fetch(self):
+        _logger.debug('__fetch')
+
+        while (item := self._queue.get()) is not _END:
+            _, _, ann, id = item
+            try:
+                self._fetcher.fetch(ann, id)
+            except Exception as ex:
+                _logger.exception(f'> {id:4d} exception fetching announcement')
+
+    # _____________________________________________________________________________
+    def run(self, shares_anns: List[typ.SharesAnnouncement], index: DirectoryIndex) -> List[typ.Announcement]:
+        """Scrapes and fetches announcements for the symbols
+
+        :return: List of announcements in scraped order
+        """
+        _logger.debug('run')
+
+        threads = [threading.Thread(target=self.__scrape, args=(shares_anns, index), name='scrape')]
+        threads.extend(threading.Thread(target=self.__fetch, name=f'fetch-{i}') for i in range(self._fetch_workers))
+        for thread in threads:
+            thread.start()
+
+        # Barrier for both stages
+        for thread in threads:
+            thread.join()
+
+        return self._announcements
@@ -12,7 +12,8 @@ class Outcome(Enum):
     created = 'Created',
     updated = 'Updated',
     deleted = 'Deleted',
-    archived = 'Archived'
+    archived = 'Archived',
+    deferred = 'Deferred'
 
 
 class Result(Enum):
@@ -51,6 +52,16 @@ class Announcement:
     result: Result
 
 
+# _____________________________________________________________________________
+@dataclass
+class Skipped:
+    """Request not made because the host's circuit was open or the run deadline had passed"""
+    __slots__ = ['symbol', 'stage', 'reason']
+    symbol: str
+    stage: str
+    reason: str
+
+
 # _____________________________________________________________________________
 @dataclass
 class Deleted:
@@ -0,0 +1,72 @@
+"""Persists, per symbol, the date and time of the newest announcement fetched.
+
+Notes:
+    1. Watermarks only advance.  A symbol's watermark is advanced only when all its announcements in a run were
+    fetched successfully, so failed downloads are scraped again on the next run.
+    2. Announcement date and times are naive ASX (Sydney) local times, as scraped.
+"""
+from collections import defaultdict
+from datetime import datetime
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, Iterable
+
+from announcements.annTypes import Announcement, Result
+
+_logger = logging.getLogger(__name__)
+
+
+# _____________________________________________________________________________
+class Watermarks:
+
+    # _____________________________________________________________________________
+    def __init__(self, watermarks_fp: Path):
+        self._watermarks: Dict[str, datetime] = dict()
+
+        self._watermarks_fp = watermarks_fp
+        self.__read()
+
+    # _____________________________________________________________________________
+    def __read(self):
+        if not self._watermarks_fp.exists():
+            return
+        try:
+            data = json.loads(self._watermarks_fp.read_text())
+            self._watermarks = {k: datetime.fromisoformat(v) for k, v in data.items()}
+        except (OSError, ValueError, AttributeError):
+            _logger.exception(f'Ignoring unreadable watermarks "{self._watermarks_fp.name}"')
+
+    # _____________________________________________________________________________
+    def get(self, symbol: str) -> datetime:
+        return self._watermarks.get(symbol, None)
+
+    # _____________________________________________________________________________
+    def advance(self, announcements: Iterable[Announcement]):
+        """Advances watermarks for symbols whose announcements were all fetched successfully"""
+        newest, failed = defaultdict(lambda: None), set()
+        for ann in announcements:
+            if ann.result != Result.success:
+                failed.add(ann.symbol)
+            elif newest[ann.symbol] is None or ann.date_time > newest[ann.symbol]:
+                newest[ann.symbol] = ann.date_time
+
+        for symbol, date_time in newest.items():
+            if symbol in failed:
+                _logger.debug(f'symbol: {symbol:6s} watermark held at {self.get(symbol)}')
+            elif (current := self.get(symbol)) is None or date_time > current:
+                self._watermarks[symbol] = date_time
+                _logger.debug(f'symbol: {symbol:6s} watermark advanced to {date_time}')
+
+    # _____________________________________________________________________________
+    def write(self):
+        self._watermarks_fp.parent.mkdir(parents=True, exist_ok=True)
+        data = {k: v.isoformat() for k, v in sorted(self._watermarks.items())}
+        tmp_fp = self._watermarks_fp.with_suffix('.tmp')
+        try:
+            tmp_fp.write_text(json.dumps(data, indent=2))
+            os.replace(tmp_fp, self._watermarks_fp)
+        except PermissionError:
+            _logger.error(f'Cannot write to "{self._watermarks_fp.name}"')
+            raise
@@ -1,23 +1,38 @@
 import argparse
-from datetime import datetime
+from datetime import date, datetime
 import logging
 from pathlib import Path
+import threading
 from typing import List
 
+from common.blobStore import BlobStore
 from common.common import local_tz
-from common.logTools import initialize_logger
+import common.httpClient as httpClient
+from common.logTools import flush_logger, initialize_logger
+from common.metricPrefix import from_file_size
+from common.pathTools import DirectoryIndex
 
 import announcements.annTypes as typ
 import announcements.annConfig as config
 import announcements.annLoader as loader
 import announcements.scrapeAnn as scrape
 import announcements.annFetch as fetch
+import announcements.annPipeline as pipeline
 import announcements.annOutput as output
+import announcements.annCatalog as catalog
 import announcements.annCleanup as cleanup
+import announcements.annWatermark as watermark
 
 _logger = logging.getLogger(__name__)
 
 
+# _____________________________________________________________________________
+def _file_size(text: str) -> int:
+    if (size := from_file_size(text)) is None:
+        raise argparse.ArgumentTypeError(f'invalid size: {text}')
+    return size
+
+
 # _____________________________________________________________________________
 def load_symbols(symbols_fp: Path) -> List[typ.SharesAnnouncement]:
     _logger.debug(f'Loading symbols from "{symbols_fp}"')
@@ -26,53 +41,146 @@ def load_symbols(symbols_fp: Path) -> List[typ.SharesAnnouncement]:
 
 
 # _____________________________________________________________________________
-def process_symbols(share_codes: List[typ.SharesAnnouncement], app_config: config.AppConfig) -> List[typ.Announcement]:
+def process_symbols(share_codes: List[typ.SharesAnnouncement], app_config: config.AppConfig,
+            is_full: bool = False, dry_run: bool = False, budget: fetch.FetchBudget = None,
+            parse_workers: int = None) -> List[typ.Announcement]:
     _logger.debug('process_symbols')
 
-    # Scrape list of announcements
-    scraper = scrape.AnnPageScraper(app_config)
-    announcements = scraper.get_announcements(share_codes)
+    # Load watermarks of newest announcements fetched by previous runs
+    watermarks = watermark.Watermarks(app_config.watermarks_fp)
+
+    # Size connection pool and open connections while the output directory is indexed
+    httpClient.configure_host(config.asx_host, app_config.pool_size)
+    if app_config.prewarm_connections:
+        prewarm = threading.Thread(target=httpClient.prewarm, name='prewarm',
+                    args=(f'https://{config.asx_host}/', app_config.prewarm_connections))
+        prewarm.start()
+
+    # Index output directory once for both fetching and cleanup
+    index = DirectoryIndex(app_config.output_path)
+
+    # Scrape list of announcements while fetching announcements, storing document content once
+    blobs = BlobStore(app_config.blobs_path)
+    scraper = scrape.AnnPageScraper(app_config, None if is_full else watermarks, parse_workers)
+    fetcher = fetch.FetchFile(app_config, blobs, budget)
+    stages = pipeline.AnnPipeline(scraper, fetcher, app_config.fetch_workers, app_config.queue_size)
+    announcements = stages.run(share_codes, index)
+    flush_logger()
     output.output_shares_announcements(share_codes)
 
-    # Fetch announcements
-    fetcher = fetch.FetchFile(app_config)
-    fetcher.process(announcements)
+    watermarks.advance(announcements)
+    watermarks.write()
+    with catalog.Catalog(app_config.catalog_fp) as cat:
+        cat.add(announcements)
 
-    clean = cleanup.CleanOutput(app_config)
-    deleted = clean.process()
+    clean = cleanup.CleanOutput(app_config, dry_run)
+    deleted = clean.process(index)
+    blobs.prune(dry_run)
+    blobs.write()
 
     output.output_announcements_summary(announcements, deleted)
+    output.output_skipped(scraper.skipped + fetcher.skipped)
     output.write_report(announcements, deleted)
 
     return announcements
 
 
 # _____________________________________________________________________________
-def main():
-    start_datetime = datetime.now(tz=local_tz)
-    current_dp = Path(__file__).parent
-    base_dp = current_dp.parent
-    initialize_logger(Path(base_dp, 'logs'), current_dp.stem)
-    _logger.info(f'Now: {start_datetime.strftime("%a  %d-%b-%y  %I:%M:%S %p")}')
+def query_catalog(args: argparse.Namespace, app_config: config.AppConfig, symbols_fp: Path):
+    _logger.debug('query_catalog')
 
-    # Configure commandline parser
+    symbols = [s.upper() for s in args.symbol]
+    if args.watchlist:
+        symbols.extend(s.symbol for s in load_symbols(symbols_fp))
+    since = args.since
+    if args.quarter:
+        today = datetime.now(config.asx_tz).date()
+        since = date(today.year, 3 * ((today.month - 1) // 3) + 1, 1)
+
+    with catalog.Catalog(app_config.catalog_fp) as cat:
+        recs = cat.query(symbols, since, args.until, True if args.price_sensitive else None, args.text, args.limit)
+    output.output_catalog_query(recs)
+
+
+# _____________________________________________________________________________
+def create_parser() -> argparse.ArgumentParser:
     argp = argparse.ArgumentParser(description='Retrieve stock prices from Yahoo Finance website')
     argp.add_argument('-s', '--symbols', action='store_true', help='Output symbols to be processed and exit')
     argp.add_argument('-f', '--file', action='store', nargs=1, default=['symbols.csv'],
                 help='Input file name for symbols')
+    argp.add_argument('--full', action='store_true',
+                help='Ignore watermarks and scrape the full period of announcements')
+    argp.add_argument('-n', '--dry-run', action='store_true', help='Report output files to delete but do not delete')
+    argp.add_argument('--budget', action='store', type=float, metavar='SECONDS',
+                help='Defer downloads not started within time limit')
+    argp.add_argument('--byte-budget', action='store', type=_file_size, metavar='SIZE',
+                help='Defer downloads beyond size limit, such as 200MB')
+    argp.add_argument('--parse-workers', action='store', type=int, metavar='N',
+                help='Processes parsing announcement pages, default CPU count, 0 to parse in fetching threads')
+    argp.add_argument('--deadline', action='store', type=float, metavar='SECONDS',
+                help='Stop retrying and making requests after time limit')
+    argp.add_argument('--debug-full', action='store_true',
+                help='Write all debug log records, not only those before warnings and errors')
+
+    subparsers = argp.add_subparsers(dest='command', metavar='command')
+    query_argp = subparsers.add_parser('query', help='Query catalog of announcements from all runs')
+    query_argp.add_argument('symbol', nargs='*', help='Symbols to query, default all symbols')
+    query_argp.add_argument('-w', '--watchlist', action='store_true', help='Query symbols in symbols file')
+    query_argp.add_argument('-t', '--text', action='store', help='Phrase to find in titles')
+    query_argp.add_argument('-p', '--price-sensitive', action='store_true', help='Only price sensitive')
+    query_argp.add_argument('--since', action='store', type=date.fromisoformat, help='From date YYYY-MM-DD')
+    query_argp.add_argument('--until', action='store', type=date.fromisoformat, help='To date YYYY-MM-DD')
+    query_argp.add_argument('-q', '--quarter', action='store_true', help='From start of this quarter')
+    query_argp.add_argument('-l', '--limit', action='store', type=int, default=200, help='Maximum to output')
+
+    return argp
+
+
+# _____________________________________________________________________________
+def run(args: argparse.Namespace, base_dp: Path,
+        share_codes: List[typ.SharesAnnouncement] = None) -> List[typ.Announcement]:
+    """Scrapes and fetches announcements, or runs the command, for the parsed arguments
+
+    :param base_dp: directory of cache, output and data directories
+    :param share_codes: symbols already loaded, otherwise loaded from the symbols file
+    :return: announcements scraped
+    """
+    _logger.debug('run')
+
+    app_config = config.AppConfig(base_dp)
+    symbols_fp = Path(Path(__file__).parent, args.file[0])  # Expecting exactly 1 filename in list
+    if args.command == 'query':
+        query_catalog(args, app_config, symbols_fp)
+        return []
+
+    if share_codes is None:
+        share_codes = load_symbols(symbols_fp)
+    if args.symbols:
+        output.output_symbols(share_codes)
+        return []
+
+    httpClient.set_run_deadline(args.deadline)
+    budget = fetch.FetchBudget(args.budget, args.byte_budget)
+    return process_symbols(share_codes, app_config, args.full, args.dry_run, budget, args.parse_workers)
+
+
+# _____________________________________________________________________________
+def main():
+    start_datetime = datetime.now(tz=local_tz)
+    current_dp = Path(__file__).parent
+    base_dp = current_dp.parent
+    # Configure commandline parser
+    argp = create_parser()
 
     try:
         args = argp.parse_args()
-        app_config = config.AppConfig(base_dp)
-
-        share_codes = load_symbols(Path(current_dp, args.file[0]))  # Expecting exactly 1 filename in list
-        if args.symbols:
-            output.output_symbols(share_codes)
-        else:
-            process_symbols(share_codes, app_config)
+        initialize_logger(Path(base_dp, 'logs'), current_dp.stem, is_debug_full=args.debug_full)
+        _logger.info(f'Now: {start_datetime.strftime("%a  %d-%b-%y  %I:%M:%S %p")}')
+        run(args, base_dp)
     except Exception as ex:
         _logger.exception('Catch all exception')
     finally:
+        httpClient.output_metrics()
         _logger.debug("done")
 
 
@@ -1,14 +1,21 @@
 from bs4 import BeautifulSoup
+import concurrent.futures
+import contextlib
+from datetime import datetime, timedelta
 from dateutil.parser import parse
 import logging
+import threading
 from operator import itemgetter, attrgetter
-from typing import List, Dict
+from typing import Dict, Iterator, List, Optional, Tuple
 import urllib.parse
 
-from common.common import sleep
+from common.common import pool_context, sleep
+import common.httpClient as httpClient
+from common.logTools import log_task
 from common.urlCache import UrlCache
-from announcements.annTypes import Announcement, SharesAnnouncement, Outcome, Result
-from announcements.annConfig import AppConfig
+from announcements.annTypes import Announcement, SharesAnnouncement, Skipped, Outcome, Result
+from announcements.annConfig import AppConfig, asx_tz
+from announcements.annWatermark import Watermarks
 
 _logger = logging.getLogger(__name__)
 
@@ -18,96 +25,218 @@ _fields = {
     'timeframe': 'D',
     'period': 'M'
 }
+_PERIOD_TODAY, _PERIOD_WEEK, _PERIOD_MONTH = 'T', 'W', 'M'
+_WEEK_AGE = timedelta(days=6)
+
+# Announcement table row: date_time, is_price_sensitive, title, num_pages, file_size, href, file_type
+Row = Tuple[datetime, bool, str, str, str, str, str]
+
+
+# _____________________________________________________________________________
+def extract_rows(data: BeautifulSoup, watermark: datetime = None) -> Optional[List[Row]]:
+    """Returns the rows of the page's announcements table, newest first, stopping at the first row older than the
+    watermark, or None if the page has no announcements table"""
+    if (data_tag := data.find('announcement_data')) is None:
+        return None
+    rows = data_tag.find('table').find('tbody').find_all('tr')
+
+    # Extract data
+    result = []
+    for row in rows:
+        num_pages, file_size, file_type = None, None, None
+
+        cells = row.find_all('td')
+        assert len(cells) == 3
+
+        text = ' '.join(cells[0].text.split())
+        date_time = parse(text, dayfirst=True)
+        if watermark and date_time < watermark:
+            break
+
+        is_price_sensitive = cells[1].find('img') is not None
+
+        link = cells[2].find('a')
+        if tag := cells[2].find('span', attrs={'class': 'page'}):
+            num_pages = tag.text.split()[0]
+        if tag := cells[2].find('span', attrs={'class': 'filesize'}):
+            file_size = ' '.join(tag.text.split())
+        href = link.get('href')
+        title = ' '.join(link.contents[0].split())
+
+        # Derive
+        params = urllib.parse.parse_qs(urllib.parse.urlparse(href).query)
+        if (display := params.get('display', None)) and len(display):
+            file_type = display[0]
+
+        result.append((date_time, is_price_sensitive, title, num_pages, file_size, href, file_type))
+
+    return result
+
+
+# _____________________________________________________________________________
+def parse_rows(page: bytes, watermark: datetime = None) -> Optional[List[Row]]:
+    """Returns the rows of a page's announcements table, as for extract_rows, parsed from the bytes of the page.
+    Run in pool worker processes, so returns row tuples rather than parsed pages."""
+    return extract_rows(BeautifulSoup(page, 'lxml'), watermark)
 
 
 # _____________________________________________________________________________
 class AnnPageScraper:
 
     # _____________________________________________________________________________
-    def __init__(self, app_config: AppConfig):
+    def __init__(self, app_config: AppConfig, watermarks: Watermarks = None, parse_workers: int = None):
+        """
+        :param parse_workers: processes parsing pages, default from app_config, or 0 to parse in the fetching
+        threads
+        """
         _logger.debug('__init__')
         self._app_config = app_config
+        self._watermarks = watermarks
+        self._parse_workers = app_config.parse_workers if parse_workers is None else parse_workers
+        self._skipped: List[Skipped] = []
+        self._lock = threading.Lock()
         UrlCache.set_cache_path(app_config.cache_path)
 
+    # _____________________________________________________________________________
+    @property
+    def skipped(self) -> List[Skipped]:
+        """Symbols whose pages were not fetched because of an open circuit or the run deadline"""
+        with self._lock:
+            return list(self._skipped)
+
     # _____________________________________________________________________________
     @staticmethod
-    def __build_url(asx_code: str) -> (str, Dict[str, str]):
+    def __build_url(asx_code: str, period: str) -> (str, Dict[str, str]):
         fields = _fields.copy()
         fields['asxCode'] = asx_code.upper()
+        fields['period'] = period
         return _URL, fields
 
     # _____________________________________________________________________________
     @staticmethod
-    def __extract_announcements(shares_ann: SharesAnnouncement, data: BeautifulSoup) -> List[Announcement]:
-        _logger.debug('__extract_announcements')
+    def __query_period(watermark: datetime) -> str:
+        """Returns the narrowest announcements query period covering announcements newer than the watermark"""
+        if watermark is None:
+            return _PERIOD_MONTH
+        now = datetime.now(asx_tz).replace(tzinfo=None)
+        if watermark.date() == now.date():
+            return _PERIOD_TODAY
+        return _PERIOD_WEEK if now - watermark < _WEEK_AGE else _PERIOD_MONTH
 
-        # Find data
-        if (data_tag := data.find('announcement_data')) is None:
+    # _____________________________________________________________________________
+    @staticmethod
+    def __to_announcements(shares_ann: SharesAnnouncement, rows: Optional[List[Row]]) -> List[Announcement]:
+        if rows is None:
             _logger.error(f'Error parsing announcements for {shares_ann.symbol}')
             return []
-        rows = data_tag.find('table').find('tbody').find_all('tr')
-
-        # Extract data
-        announcements = []
-        for row in rows:
-            num_pages, file_size, file_type = None, None, None
-
-            cells = row.find_all('td')
-            assert len(cells) == 3
-
-            text = ' '.join(cells[0].text.split())
-            date_time = parse(text, dayfirst=True)
+        return [Announcement(shares_ann.symbol, date_time, title, is_price_sensitive, num_pages, file_size, href,
+                    None, file_type, Outcome.nil, Result.nil)
+                for date_time, is_price_sensitive, title, num_pages, file_size, href, file_type in rows]
 
-            is_price_sensitive = cells[1].find('img') is not None
-
-            link = cells[2].find('a')
-            if tag := cells[2].find('span', attrs={'class': 'page'}):
-                num_pages = tag.text.split()[0]
-            if tag := cells[2].find('span', attrs={'class': 'filesize'}):
-                file_size = ' '.join(tag.text.split())
-            href = link.get('href')
-            title = ' '.join(link.contents[0].split())
+    # _____________________________________________________________________________
+    @staticmethod
+    def __extract_announcements(shares_ann: SharesAnnouncement, data: BeautifulSoup,
+                watermark: datetime = None) -> List[Announcement]:
+        """Extracts announcements from the page rows, newest first, stopping at the first row older than the
+        watermark"""
+        _logger.debug('__extract_announcements')
+        return AnnPageScraper.__to_announcements(shares_ann, extract_rows(data, watermark))
 
-            # Derive
-            params = urllib.parse.parse_qs(urllib.parse.urlparse(href).query)
-            if (display := params.get('display', None)) and len(display):
-                file_type = display[0]
+    # _____________________________________________________________________________
+    def __parse_announcements(self, shares_ann: SharesAnnouncement, page: bytes,
+                parse_pool: concurrent.futures.Executor, watermark: datetime = None) -> List[Announcement]:
+        """Parses announcements from the bytes of a page in the parse pool, or in this thread if the pool fails"""
+        try:
+            rows = parse_pool.submit(parse_rows, page, watermark).result()
+        except concurrent.futures.process.BrokenProcessPool:
+            _logger.warning(f'Parse pool failed, parsing {shares_ann.symbol} in process')
+            rows = parse_rows(page, watermark)
+        return self.__to_announcements(shares_ann, rows)
 
-            ann = Announcement(shares_ann.symbol, date_time, title, is_price_sensitive,
-                        num_pages, file_size, href, None, file_type, Outcome.nil, Result.nil)
-            announcements.append(ann)
+    # _____________________________________________________________________________
+    def get_symbol_announcements(self, shares_ann: SharesAnnouncement, url_cache: UrlCache,
+                parse_pool: concurrent.futures.Executor = None) -> (List[Announcement], bool):
+        """Returns announcements for a symbol, updating its count and most recent, and if the page was cached
+
+        :param parse_pool: process pool parsing the page, or None to parse in this thread
+        """
+        symbol = shares_ann.symbol
+        watermark = self._watermarks.get(symbol) if self._watermarks else None
+        period = self.__query_period(watermark)
+        _logger.debug('Getting announcements for %s period %s since %s', symbol, period, watermark)
+        url, fields = self.__build_url(symbol, period)
+        cache_tag = f'{symbol.lower()}-{period.lower()}-webpage.html'
+        is_pooled = parse_pool is not None
+        try:
+            data, suffix, is_cached = url_cache.get(url, fields, cache_tag, is_raw=is_pooled)
+        except (httpClient.CircuitOpenError, httpClient.DeadlineExceededError) as ex:
+            _logger.warning(f'Skipped announcements for {symbol}: {ex}')
+            with self._lock:
+                self._skipped.append(Skipped(symbol, 'page', httpClient.skip_reason(ex)))
+            return [], False
+        if data is None:
+            _logger.error(f'Could not fetch data for {shares_ann}')
+            return [], is_cached
+
+        shares_ann.most_recent = watermark
+        if is_pooled:
+            lst = self.__parse_announcements(shares_ann, data, parse_pool, watermark)
+        else:
+            lst = self.__extract_announcements(shares_ann, data, watermark)
+        if lst:
+            rec = max(lst, key=attrgetter('date_time'))
+            shares_ann.most_recent = rec.date_time
+            shares_ann.count = len(lst)
+            _logger.debug('symbol: %-6s most recent %s, found %d', symbol, rec.date_time, len(lst))
+        else:
+            _logger.debug('symbol: %-6s has no announcements', symbol)
+
+        return lst, is_cached
 
+    # _____________________________________________________________________________
+    def __get_symbol_announcements(self, shares_ann: SharesAnnouncement, url_cache: UrlCache,
+                parse_pool: Optional[concurrent.futures.Executor]) -> List[Announcement]:
+        with log_task(shares_ann.symbol):
+            announcements, is_cached = self.get_symbol_announcements(shares_ann, url_cache, parse_pool)
+        if not is_cached:
+            sleep(0.1, 0.2)
         return announcements
 
     # _____________________________________________________________________________
-    def get_announcements(self, shares_anns: List[SharesAnnouncement]) -> List[Announcement]:
-        _logger.debug('get_announcements')
+    def iter_announcements(self, shares_anns: List[SharesAnnouncement]) -> Iterator[List[Announcement]]:
+        """Yields the announcements for each symbol as its page is scraped.  Pages are fetched by a pool of
+        workers, with requests in flight limited by the HTTP layer's adaptive concurrency, and parsed by a pool of
+        processes unless parse workers is 0.
+        """
+        _logger.debug('iter_announcements')
 
         # Initialise cache
         url_cache = UrlCache(self._app_config.cache_age_sec)
 
         # Fetch Service landing page xml
+        with contextlib.ExitStack() as stack:
+            # Pool is passed to each fetch, not kept on the scraper, as it is shut down after the fetch threads
+            parse_pool = None
+            if self._parse_workers:
+                parse_pool = stack.enter_context(concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self._parse_workers, mp_context=pool_context()))
+            executor = stack.enter_context(
+                concurrent.futures.ThreadPoolExecutor(max_workers=self._app_config.scrape_workers))
+            futures = [executor.submit(self.__get_symbol_announcements, shares_ann, url_cache, parse_pool)
+                       for shares_ann in shares_anns]
+            try:
+                for future in concurrent.futures.as_completed(futures):
+                    yield future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    # _____________________________________________________________________________
+    def get_announcements(self, shares_anns: List[SharesAnnouncement]) -> List[Announcement]:
+        _logger.debug('get_announcements')
+
         announcements = []
-        for shares_ann in shares_anns:
-            symbol = shares_ann.symbol
-            _logger.debug(f'Getting announcements for {symbol}')
-            url, fields = self.__build_url(symbol)
-            cache_tag = f'{symbol.lower()}-webpage.html'
-            data, suffix, is_cached = url_cache.get(url, fields, cache_tag)
-            if data is None:
-                _logger.error(f'Could not fetch data for {shares_ann}')
-                continue
-
-            if lst := self.__extract_announcements(shares_ann, data):
-                announcements.extend(lst)
-                rec = max(lst, key=attrgetter('date_time'))
-                shares_ann.most_recent = rec.date_time
-                shares_ann.count = len(lst)
-                _logger.debug(f'symbol: {symbol:6s} most recent {rec.date_time}, found {len(lst)}')
-            else:
-                _logger.debug(f'symbol: {symbol:6s} has no announcements')
-
-            if not is_cached:
-                sleep(0.1, 0.2)
+        for lst in self.iter_announcements(shares_anns):
+            announcements.extend(lst)
 
         return announcements
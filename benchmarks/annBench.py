@@ -0,0 +1,255 @@
+"""Benchmarks the announcements pipeline against a local stand-in for the ASX site, and saves or compares results
+as baselines.
+
+Run from the repository directory:
+    python -m benchmarks.annBench [--rows 20 200 1000] [--pages 32] [--parse-workers N] [--pdf-size 200KB]
+        [--docs 64] [--concurrency 1 2 4 8] [--tree 50 200] [--save NAME] [--compare NAME]
+
+Notes:
+    1. Scraper and fetcher URLs are pointed at the stub, and the random sleeps between document requests are
+    disabled, so timings measure the code rather than the politeness delays.  Requests in flight are still limited
+    by the HTTP layer's adaptive concurrency.
+    2. Parsing, extraction, cache and cleanup cases report the best of repeated runs.  Fetch cases fetch each
+    document once into an empty output directory.
+    3. Baselines are JSON files in benchmarks/baselines.  Comparing prints the ratio of each case's time to the
+    baseline's, so less than 1.0 is faster.
+"""
+import argparse
+from bs4 import BeautifulSoup
+import concurrent.futures
+from datetime import datetime, timedelta
+import json
+import logging
+import math
+import os
+from pathlib import Path
+import platform
+import tempfile
+import time
+from typing import Dict, List
+from urllib import parse
+
+import common.httpClient as httpClient
+from common.metricPrefix import from_file_size
+from common.pathTools import DirectoryIndex
+from common.urlCache import UrlCache
+
+import announcements.annCleanup as cleanup
+import announcements.annConfig as config
+import announcements.annFetch as fetch
+import announcements.annTypes as typ
+import announcements.scrapeAnn as scrape
+
+from benchmarks.asxStub import ANNOUNCEMENTS_PATH, AsxStub, make_page
+
+_logger = logging.getLogger(__name__)
+
+_REPEATS = 3
+_CACHE_GETS = 20
+_baselines_path = Path(Path(__file__).parent, 'baselines')
+
+_extract = scrape.AnnPageScraper._AnnPageScraper__extract_announcements
+
+
+# _____________________________________________________________________________
+def best_of(func, repeats: int = _REPEATS) -> (float, object):
+    best, result = None, None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+# _____________________________________________________________________________
+def result(case: str, seconds: float, count: int, unit: str, **params) -> Dict:
+    return {'case': case, 'seconds': round(seconds, 6), 'rate': round(count / seconds, 3) if seconds else None,
+            'unit': unit, 'params': params}
+
+
+# _____________________________________________________________________________
+def bench_pages(rows_list: List[int]) -> List[Dict]:
+    """Times parsing announcement pages and extracting their announcements"""
+    results = []
+    for rows in rows_list:
+        page = make_page('AAA', rows)
+        seconds, soup = best_of(lambda: BeautifulSoup(page, 'lxml'))
+        results.append(result(f'page parse {rows} rows', seconds, rows, 'rows/s', rows=rows, bytes=len(page)))
+        seconds, anns = best_of(lambda: _extract(typ.SharesAnnouncement('AAA', 0, None), soup))
+        assert len(anns) == rows
+        results.append(result(f'extract {rows} rows', seconds, rows, 'rows/s', rows=rows))
+    return results
+
+
+# _____________________________________________________________________________
+def bench_cache(stub: AsxStub, base_dp: Path) -> List[Dict]:
+    """Times cache misses, which fetch, format and write pages, and cache hits, which read and parse pages"""
+    UrlCache.set_cache_path(Path(base_dp, 'cache'))
+    url = stub.base_url + ANNOUNCEMENTS_PATH
+    fields = {'by': 'asxCode', 'asxCode': 'AAA', 'timeframe': 'D', 'period': 'M'}
+
+    results = []
+    for case, max_age in (('cache miss', 0), ('cache hit', 3600)):
+        url_cache = UrlCache(max_age)
+        url_cache.get(url, fields, 'aaa-m-webpage.html')
+        seconds, _ = best_of(lambda: [url_cache.get(url, fields, 'aaa-m-webpage.html') for _ in range(_CACHE_GETS)])
+        results.append(result(f'{case} {stub.rows} rows', seconds / _CACHE_GETS, 1, 'gets/s', rows=stub.rows))
+    return results
+
+
+# _____________________________________________________________________________
+def bench_scrape(stub: AsxStub, base_dp: Path, pages: int, parse_workers: int) -> List[Dict]:
+    """Times scraping pages, parsed in the fetching threads and in a pool of processes"""
+    results, scraped = [], dict()
+    for case, workers in (('threads', 0), (f'pool x{parse_workers}', parse_workers)):
+        app_config = config.AppConfig(Path(base_dp, f'scrape-{workers}'))
+        scraper = scrape.AnnPageScraper(app_config, None, workers)
+        shares_anns = [typ.SharesAnnouncement(f'S{i:02d}', 0, None) for i in range(pages)]
+        start = time.perf_counter()
+        anns = scraper.get_announcements(shares_anns)
+        seconds = time.perf_counter() - start
+        scraped[case] = sorted((a.symbol, a.href) for a in anns)
+        results.append(result(f'scrape {pages} pages {case}', seconds, pages, 'pages/s', pages=pages,
+                              rows=stub.rows, parse_workers=workers))
+    if len(set(map(tuple, scraped.values()))) != 1:
+        _logger.warning('Scraped announcements differ between threads and pool')
+    return results
+
+
+# _____________________________________________________________________________
+def make_announcements(stub: AsxStub, docs: int) -> List[typ.Announcement]:
+    anns = []
+    for i in range(math.ceil(docs / stub.rows)):
+        symbol = f'B{i:02d}'
+        anns.extend(_extract(typ.SharesAnnouncement(symbol, 0, None), BeautifulSoup(stub.page(symbol), 'lxml')))
+    return anns[:docs]
+
+
+# _____________________________________________________________________________
+def bench_fetch(stub: AsxStub, base_dp: Path, docs: int, concurrency_list: List[int]) -> List[Dict]:
+    """Times fetching documents through the "Agree and continue" page at each concurrency"""
+    results = []
+    for concurrency in concurrency_list:
+        app_config = config.AppConfig(Path(base_dp, f'fetch-{concurrency}'))
+        app_config.output_path.mkdir(parents=True)
+        anns = make_announcements(stub, docs)
+        fetcher = fetch.FetchFile(app_config)
+        fetcher.prepare(anns, DirectoryIndex(app_config.output_path))
+
+        start = time.perf_counter()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(fetcher.fetch, anns, range(len(anns))))
+        seconds = time.perf_counter() - start
+
+        created = sum(1 for a in anns if a.outcome == typ.Outcome.created)
+        if created != len(anns):
+            _logger.warning(f'Fetched {created} of {len(anns)} documents at concurrency {concurrency}')
+        results.append(result(f'fetch x{concurrency}', seconds, created, 'docs/s', docs=len(anns),
+                              concurrency=concurrency, mb_per_sec=round(created * len(stub.pdf) / seconds / 2**20, 3)))
+    return results
+
+
+# _____________________________________________________________________________
+def make_tree(output_dp: Path, dirs: int, files: int):
+    """Creates dirs symbol directories of files each, a tenth empty and half older than the announcement age"""
+    old = (datetime.now() - timedelta(days=60)).timestamp()
+    content = b'%PDF-1.4\n' + b'x' * 1024
+    for d in range(dirs):
+        dp = Path(output_dp, f'c{d:03d}')
+        dp.mkdir(parents=True)
+        for f in range(files):
+            fp = Path(dp, f'Announcement {f}-2026-01-01.pdf')
+            fp.write_bytes(b'' if f % 10 == 0 else content)
+            if f % 2:
+                os.utime(fp, (old, old))
+
+
+# _____________________________________________________________________________
+def bench_cleanup(base_dp: Path, dirs: int, files: int) -> List[Dict]:
+    """Times a dry run of output cleanup over a tree, scanned by the sweep, and scanned into an index first as by
+    getAnn"""
+    app_config = config.AppConfig(Path(base_dp, 'cleanup'))
+    make_tree(app_config.output_path, dirs, files)
+    clean = cleanup.CleanOutput(app_config, dry_run=True)
+    count = dirs * files
+
+    seconds, deleted = best_of(lambda: clean.process())
+    results = [result(f'cleanup {count} files', seconds, count, 'files/s', dirs=dirs, files=files,
+                      matched=len(deleted))]
+    seconds, _ = best_of(lambda: clean.process(DirectoryIndex(app_config.output_path)))
+    results.append(result(f'cleanup indexed {count} files', seconds, count, 'files/s', dirs=dirs, files=files))
+    return results
+
+
+# _____________________________________________________________________________
+def save_baseline(results: List[Dict], name: str) -> Path:
+    _baselines_path.mkdir(parents=True, exist_ok=True)
+    baseline_fp = Path(_baselines_path, f'{name}.json')
+    baseline = {'created': datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version(),
+                'platform': platform.platform(), 'cpus': os.cpu_count(), 'results': results}
+    baseline_fp.write_text(json.dumps(baseline, indent=2))
+    return baseline_fp
+
+
+# _____________________________________________________________________________
+def read_baseline(name: str) -> Dict[str, Dict]:
+    baseline_fp = Path(_baselines_path, f'{name}.json')
+    return {r['case']: r for r in json.loads(baseline_fp.read_text())['results']}
+
+
+# _____________________________________________________________________________
+def output_results(results: List[Dict], baseline: Dict[str, Dict] = None):
+    print(f'\n {"case":28s} | {"seconds":>9s} | {"rate":>11s} {"":7s}' + (' | baseline' if baseline else ''))
+    for r in results:
+        line = f' {r["case"]:28s} | {r["seconds"]:9.4f} | {r["rate"] or 0:11.1f} {r["unit"]:7s}'
+        if baseline:
+            if (b := baseline.get(r['case'], None)) and b['seconds']:
+                line += f' | {r["seconds"] / b["seconds"]:8.2f}'
+            else:
+                line += f' | {"-":>8s}'
+        print(line)
+
+
+# _____________________________________________________________________________
+def main():
+    argp = argparse.ArgumentParser(description='Benchmark the announcements pipeline against a local ASX stand-in')
+    argp.add_argument('--rows', action='store', type=int, nargs='+', default=[20, 200, 1000],
+                help='Announcements per page for page cases')
+    argp.add_argument('--pages', action='store', type=int, default=32, help='Pages scraped for scrape cases')
+    argp.add_argument('--parse-workers', action='store', type=int, default=os.cpu_count(),
+                help='Processes parsing pages for pooled scrape case')
+    argp.add_argument('--pdf-size', action='store', type=from_file_size, default=200 * 1024, metavar='SIZE',
+                help='Size of documents, such as 200KB')
+    argp.add_argument('--docs', action='store', type=int, default=64, help='Documents fetched for fetch cases')
+    argp.add_argument('--concurrency', action='store', type=int, nargs='+', default=[1, 2, 4, 8],
+                help='Concurrent fetches for fetch cases')
+    argp.add_argument('--tree', action='store', type=int, nargs=2, default=[50, 200], metavar=('DIRS', 'FILES'),
+                help='Directories and files in each for cleanup cases')
+    argp.add_argument('--save', action='store', metavar='NAME', help='Save results as baseline')
+    argp.add_argument('--compare', action='store', metavar='NAME', help='Compare results with baseline')
+    args = argp.parse_args()
+
+    baseline = read_baseline(args.compare) if args.compare else None
+    with tempfile.TemporaryDirectory(prefix='annBench-') as tmp, AsxStub(args.rows[0], args.pdf_size) as stub:
+        base_dp = Path(tmp)
+        scrape._URL = stub.base_url + ANNOUNCEMENTS_PATH
+        fetch._URL = stub.base_url + '/'
+        scrape.sleep = fetch.sleep = lambda *args: None
+        httpClient.configure_host(parse.urlsplit(stub.base_url).hostname, max(args.concurrency))
+
+        results = bench_pages(args.rows)
+        results += bench_cache(stub, base_dp)
+        results += bench_scrape(stub, base_dp, args.pages, args.parse_workers)
+        results += bench_fetch(stub, base_dp, args.docs, args.concurrency)
+        results += bench_cleanup(base_dp, *args.tree)
+        _logger.debug(f'Stub requests: {stub.counts}')
+
+    output_results(results, baseline)
+    if args.save:
+        print(f'\nSaved baseline "{save_baseline(results, args.save)}"')
+
+
+# _____________________________________________________________________________
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""Local stand-in for the ASX announcements site, serving synthetic announcement pages and PDF documents.
+
+Notes:
+    1. Pages have the markup scraped by announcements.scrapeAnn: an announcement_data table with date, price
+    sensitive and headline cells, wrapped in page furniture so pages are of realistic size.
+    2. Document links return the "Agree and continue" page, with the document path in a pdfURL input.  Posting
+    pdfURL to the terms path returns the PDF, as for the ASX site.
+    3. Documents are PDF files of a chosen size, generated once and served from memory.
+"""
+from datetime import datetime, timedelta
+import http.server
+import random
+import threading
+import urllib.parse
+
+ANNOUNCEMENTS_PATH = '/asx/statistics/announcements.do'
+DISPLAY_PATH = '/asx/statistics/displayAnnouncement.do'
+TERMS_PATH = '/asx/statistics/announcementTerms.do'
+PDF_PATH = '/asxpdf/'
+
+_TITLES = ['Quarterly Activities Report', 'Appendix 4C - Quarterly', 'Change of Director\'s Interest Notice',
+           'Becoming a substantial holder', 'Ceasing to be a substantial holder', 'Investor Presentation',
+           'Application for quotation of securities', 'Notice of Annual General Meeting/Proxy Form',
+           'Results of Meeting', 'Trading Halt', 'Half Year Accounts', 'Drilling Update']
+_FURNITURE = ''.join(f'<li><a href="/about/section-{i}.htm" class="nav-link">Section {i}</a></li>\n'
+                     for i in range(120))
+
+
+# _____________________________________________________________________________
+def make_page(symbol: str, rows: int, seed: int = 0) -> bytes:
+    """Returns an announcements page for symbol with rows announcements, newest first"""
+    ran = random.Random(seed)
+    when = datetime(2026, 10, 19, 16, 0)
+    lines = [f'<!DOCTYPE html>\n<html lang="en"><head><title>ASX - Announcements - {symbol}</title>\n'
+             f'<script src="/js/vendor.js"></script><link rel="stylesheet" href="/css/asx.css"></head>\n'
+             f'<body><header><nav><ul>\n{_FURNITURE}</ul></nav></header>\n<main><h2>{symbol} announcements</h2>\n'
+             f'<announcement_data>\n<table class="contenttable" cellspacing="0">\n'
+             f'<thead><tr><th>Date</th><th class="pricesens">Price sens.</th><th>Headline</th></tr></thead>\n'
+             f'<tbody>\n']
+    for i in range(rows):
+        when -= timedelta(minutes=ran.randint(30, 3000))
+        sensitive = ('<img src="/images/icon-price-sensitive.svg" class="pricesens" alt="asterix" '
+                     'title="price sensitive">' if ran.random() < 0.3 else '')
+        lines.append(f'<tr class="{"altrow" if i % 2 else ""}">\n'
+                     f'<td>{when.strftime("%d/%m/%Y")}<br>\n<span class="dates-time">{when.strftime("%I:%M %p")}'
+                     f'</span></td>\n<td class="pricesens">{sensitive}</td>\n'
+                     f'<td><a href="{DISPLAY_PATH}?display=pdf&amp;idsId={seed:04d}{i:06d}" target="_blank">\n'
+                     f'{ran.choice(_TITLES)} {i}\n<br>\n<span class="page">{ran.randint(1, 40)} pages</span>\n'
+                     f'<span class="filesize">{ran.randint(20, 2000)}KB</span></a></td>\n</tr>\n')
+    lines.append('</tbody>\n</table>\n</announcement_data>\n</main><footer><p>Copyright ASX</p></footer>'
+                 '</body></html>\n')
+    return ''.join(lines).encode('utf-8')
+
+
+# _____________________________________________________________________________
+def make_pdf(size: int) -> bytes:
+    """Returns a PDF of size bytes, padded with a comment"""
+    head = b'%PDF-1.4\n1 0 obj << /Type /Catalog >> endobj\n'
+    tail = b'\ntrailer << /Root 1 0 R >>\n%%EOF\n'
+    padding = max(0, size - len(head) - len(tail) - 2)
+    return head + b'%' + bytes(random.Random(size).choices(b'abcdefghijklmnopqrstuvwxyz', k=padding)) + b'\n' + tail
+
+
+# _____________________________________________________________________________
+def make_interstitial(pdf_path: str) -> bytes:
+    return (f'<!DOCTYPE html>\n<html><head><title>ASX - Access to Company Announcements</title></head><body>\n'
+            f'<form name="showAnnouncementPDFForm" method="post" action="{TERMS_PATH}">\n'
+            f'<p>Agree to the terms of use to continue.</p>\n'
+            f'<input value="Agree and proceed" type="submit">\n'
+            f'<input type="hidden" name="pdfURL" value="{pdf_path}">\n</form>\n</body></html>\n').encode('utf-8')
+
+
+# _____________________________________________________________________________
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    # _____________________________________________________________________________
+    def log_message(self, format, *args):
+        pass
+
+    # _____________________________________________________________________________
+    def __send(self, status: int, content_type: str, body: bytes):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # _____________________________________________________________________________
+    def do_GET(self):
+        stub: AsxStub = self.server.stub
+        url = urllib.parse.urlsplit(self.path)
+        params = urllib.parse.parse_qs(url.query)
+        stub.count(url.path)
+        if url.path == ANNOUNCEMENTS_PATH:
+            symbol = params.get('asxCode', ['XXX'])[0]
+            self.__send(200, 'text/html; charset=utf-8', stub.page(symbol))
+        elif url.path == DISPLAY_PATH:
+            ids_id = params.get('idsId', ['0'])[0]
+            self.__send(200, 'text/html; charset=utf-8', make_interstitial(f'{PDF_PATH}{ids_id}.pdf'))
+        elif url.path.startswith(PDF_PATH):
+            self.__send(200, 'application/pdf', stub.pdf)
+        else:
+            self.__send(404, 'text/plain', b'Not found')
+
+    # _____________________________________________________________________________
+    def do_POST(self):
+        stub: AsxStub = self.server.stub
+        url = urllib.parse.urlsplit(self.path)
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0) or 0)).decode('utf-8')
+        stub.count(url.path)
+        if url.path == TERMS_PATH and urllib.parse.parse_qs(body).get('pdfURL', [''])[0].startswith(PDF_PATH):
+            self.__send(200, 'application/pdf', stub.pdf)
+        else:
+            self.__send(404, 'text/plain', b'Not found')
+
+
+# _____________________________________________________________________________
+class AsxStub:
+    """Serves pages of rows announcements and PDFs of pdf_size bytes on a local port, in a background thread
+
+    :param rows: announcements on each page
+    :param pdf_size: bytes of each document
+    """
+
+    # _____________________________________________________________________________
+    def __init__(self, rows: int = 20, pdf_size: int = 200 * 1024):
+        self.rows = rows
+        self.pdf = make_pdf(pdf_size)
+        self._pages = dict()
+        self._counts = dict()
+        self._lock = threading.Lock()
+        self._server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread = threading.Thread(target=self._server.serve_forever, name='asx-stub', daemon=True)
+
+    # _____________________________________________________________________________
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    # _____________________________________________________________________________
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._server.shutdown()
+        self._server.server_close()
+
+    # _____________________________________________________________________________
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    # _____________________________________________________________________________
+    @property
+    def counts(self) -> dict:
+        """Requests served by path"""
+        with self._lock:
+            return dict(self._counts)
+
+    # _____________________________________________________________________________
+    def count(self, path: str):
+        with self._lock:
+            self._counts[path] = self._counts.get(path, 0) + 1
+
+    # _____________________________________________________________________________
+    def page(self, symbol: str) -> bytes:
+        with self._lock:
+            if (page := self._pages.get(symbol, None)) is None:
+                page = self._pages[symbol] = make_page(symbol, self.rows, len(self._pages))
+            return page
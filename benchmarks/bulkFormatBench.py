@@ -0,0 +1,133 @@
+"""Benchmarks bulk column formatting against formatting one value at a time, and checks the outputs are identical.
+
+Run from the repository directory:
+    python -m benchmarks.bulkFormatBench [rows]
+"""
+from contextlib import redirect_stdout
+from datetime import datetime
+from decimal import Decimal
+from io import StringIO
+import random
+import sys
+import time
+from typing import List
+
+import numpy as np
+
+import common.bulkFormat as bulk
+from common.common import multisort
+import common.metricPrefix as metricPrefix
+import prices.pricesOutput as output
+from prices.pricesTypes import Record
+
+_ROWS = 100_000
+_REPEATS = 3
+
+
+# _____________________________________________________________________________
+def make_records(count: int, ran: random.Random) -> List[Record]:
+    def price():
+        value = ran.choice([ran.uniform(0.001, 0.999), ran.uniform(1.0, 150.0)])
+        return None if ran.random() < 0.02 else Decimal(value).quantize(Decimal('0.000'))
+
+    now = datetime.now()
+    recs = []
+    for i in range(count):
+        p, ref = price(), price()
+        ref_to_price = (100 - p / ref * 100).quantize(Decimal('0.0')) if p and ref else None
+        recs.append(Record(f'S{i % 5000:04d}', p or Decimal('0.500'), price(), price(), price(), price(), ref,
+                           ref_to_price, price(), price(), int(10 ** ran.uniform(0, 12)), now.date(), now.time(),
+                           'name', int(now.timestamp())))
+    return recs
+
+
+# _____________________________________________________________________________
+def scalar_prices(recs: List[Record]) -> str:
+    """Formats prices table one value at a time, as before bulk formatting"""
+    def fmtp(prices, ref):
+        if not ref:
+            ref = prices[0]
+        if ref >= output._PRICE_FORMAT_THRESHOLD:
+            return [f'{p:8.2f} ' if p else output._BLANK for p in prices]
+        return [f'{p:9.3f}' if p else output._BLANK for p in prices]
+
+    with StringIO() as buf:
+        buf.write(f'\n {"symbol":^6s} | {"price":^9s}   {"low":^9s}   {"high":^9s}   {"ask":^9s}   {"buy":^9s}'
+                  f'  | {"volume":^9s}\n')
+        for i, r in enumerate(recs, 1):
+            prices = fmtp([r.price, r.low, r.high, r.ask, r.bid], r.low)
+            buf.write(f' {output._outsym(r.symbol)} | {prices[0]}   {prices[1]}   {prices[2]}'
+                      f'   {prices[3]}    {prices[4]} | {output._outs(metricPrefix.to_decimal_units(r.volume))}\n')
+            if i % output._LINES_PER_BLOCK == 0:
+                buf.write('\n')
+        return buf.getvalue() + '\n'
+
+
+# _____________________________________________________________________________
+def scalar_brief(recs: List[Record]) -> str:
+    """Formats brief table one value at a time, as before bulk formatting"""
+    recs = multisort(recs, ((lambda x: abs(x.refToPrice) if x.refToPrice else Decimal(0.0), True),
+                (lambda y: y.symbol, False)))
+    with StringIO() as buf:
+        buf.write(f'\n {"symbol":^6s} | {"price":^9s}   {"% ref":^9s}   {"ref":^9s} | {"L alert":^9s}'
+                  f'   {"H alert":^9s}\n')
+        for i, r in enumerate(recs, 1):
+            buf.write(f' {output._outsym(r.symbol)} | {output._outp(r.price)}   {output._outpercent(r.refToPrice)}'
+                      f'   {output._outp(r.ref)} | {output._outp(r.alertLow)}   {output._outp(r.alertHigh)}\n')
+            if i % output._LINES_PER_BLOCK == 0:
+                buf.write('\n')
+        return buf.getvalue() + '\n'
+
+
+# _____________________________________________________________________________
+def bulk_output(func, recs: List[Record]) -> str:
+    with StringIO() as buf, redirect_stdout(buf):
+        func(recs)
+        return buf.getvalue()
+
+
+# _____________________________________________________________________________
+def timed(func, *args) -> (float, object):
+    best, result = None, None
+    for _ in range(_REPEATS):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+# _____________________________________________________________________________
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else _ROWS
+    ran = random.Random(1)
+    recs = make_records(rows, ran)
+    numbers = [int(10 ** ran.uniform(0, 15)) for _ in range(rows)]
+    number_array = np.array(numbers, dtype=np.int64)
+    prices = [r.price for r in recs]
+    price_fixed = bulk.to_fixed(prices, 3)[0]
+
+    cases = [
+        ('prices table', lambda: scalar_prices(recs), lambda: bulk_output(output.output_prices, recs)),
+        ('brief table', lambda: scalar_brief(recs), lambda: bulk_output(output.output_brief, recs)),
+        ('decimal units', lambda: [metricPrefix.to_decimal_units(n) for n in numbers],
+            lambda: bulk.to_decimal_units(numbers).tolist()),
+        ('binary units', lambda: [metricPrefix.to_binary_units(n) for n in numbers],
+            lambda: bulk.to_binary_units(numbers).tolist()),
+        ('decimal units array', lambda: [metricPrefix.to_decimal_units(n) for n in number_array.tolist()],
+            lambda: bulk.to_decimal_units(number_array).tolist()),
+        ('price column fixed', lambda: [f'{p:8.2f} ' for p in prices],
+            lambda: bulk.format_fixed(price_fixed, 3, 2, 8, ' ').tolist()),
+    ]
+
+    print(f'\n {"case":20s} | {"rows":>8s} | {"scalar s":>9s} | {"bulk s":>9s} | {"speedup":>7s} | match')
+    for name, scalar_func, bulk_func in cases:
+        scalar_sec, expected = timed(scalar_func)
+        bulk_sec, actual = timed(bulk_func)
+        print(f' {name:20s} | {rows:8d} | {scalar_sec:9.3f} | {bulk_sec:9.3f} | {scalar_sec / bulk_sec:7.1f} |'
+              f' {expected == actual}')
+
+
+# _____________________________________________________________________________
+if __name__ == '__main__':
+    main()
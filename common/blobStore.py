@@ -0,0 +1,194 @@
+"""Content-addressed store of files named by their SHA-256 digest.
+
+Notes:
+    1. Files are placed in the store by rename and then linked to their user visible paths.  Links are tried in
+    order of cost: hardlink, reflink (Linux copy-on-write clone) and then copy.  The store must be on the same
+    file system as the linked paths for hardlinks and reflinks.
+    2. A key, such as a document ID, can be mapped to a digest so a known document need not be fetched again.
+    3. Each path linked to a blob is recorded, whatever the kind of link, so references do not depend on link
+    counts.  A reference lasts while its path exists.  Prune forgets keys to blobs no longer referenced and then
+    deletes blobs referenced by neither a path nor a key.  Blobs hardlinked from paths not recorded, as by earlier
+    versions, are kept.
+    4. Keys and links are persisted together as JSON.
+    5. Linked paths share the blob's modification time when hardlinked.  A path to be given a time other than the
+    blob's, while the blob is already linked elsewhere, is reflinked or copied instead so other paths keep their
+    times.
+"""
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+import shutil
+import threading
+from typing import Dict, List
+
+_logger = logging.getLogger(__name__)
+
+_FICLONE = 0x40049409  # Linux ioctl to clone (reflink) a file
+
+
+# _____________________________________________________________________________
+def new_hash():
+    return hashlib.sha256()
+
+
+# _____________________________________________________________________________
+def _reflink(src: Path, dst: Path):
+    import fcntl
+    with src.open('rb') as fsrc, dst.open('wb') as fdst:
+        fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+
+
+# _____________________________________________________________________________
+class BlobStore:
+
+    # _____________________________________________________________________________
+    def __init__(self, path: Path):
+        self._path = Path(path).resolve()
+        self._keys_fp = Path(self._path, 'keys.json')
+        self._keys: Dict[str, str] = dict()
+        self._links: Dict[str, str] = dict()  # Linked path: blob name
+        self._lock = threading.Lock()
+
+        self._path.mkdir(parents=True, exist_ok=True)
+        self.__read()
+
+    # _____________________________________________________________________________
+    def __read(self):
+        if not self._keys_fp.exists():
+            return
+        try:
+            data = json.loads(self._keys_fp.read_text())
+            if 'keys' in data and 'links' in data:
+                self._keys, self._links = data['keys'], data['links']
+            else:
+                self._keys = data
+        except (OSError, ValueError):
+            _logger.exception(f'Ignoring unreadable blob keys "{self._keys_fp.name}"')
+
+    # _____________________________________________________________________________
+    @property
+    def path(self) -> Path:
+        return self._path
+
+    # _____________________________________________________________________________
+    def blob_path(self, digest: str, suffix: str = '') -> Path:
+        return Path(self._path, digest[:2], digest + suffix)
+
+    # _____________________________________________________________________________
+    def lookup(self, key: str, suffix: str = '') -> Path:
+        """Returns the path of the blob for a key, or None if the key is unknown or its blob has gone"""
+        with self._lock:
+            digest = self._keys.get(key, None)
+        if digest and (blob_fp := self.blob_path(digest, suffix)).exists():
+            return blob_fp
+        return None
+
+    # _____________________________________________________________________________
+    def add(self, src: Path, digest: str, key: str = None, suffix: str = '') -> Path:
+        """Moves a file into the store, or discards it if the store already holds the same content
+
+        :return: blob path
+        """
+        blob_fp = self.blob_path(digest, suffix)
+        with self._lock:
+            if blob_fp.exists():
+                os.remove(src)
+            else:
+                blob_fp.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(src, blob_fp)
+            if key:
+                self._keys[key] = digest
+        return blob_fp
+
+    # _____________________________________________________________________________
+    def link(self, blob_fp: Path, dst: Path, mtime: float = None):
+        """Links a blob to a destination path, replacing any existing file, and records the reference
+
+        :param mtime: modification time of destination, default blob's
+        """
+        if dst.exists():
+            dst.unlink()
+        with self._lock:
+            st = blob_fp.stat()
+            # Hardlinks share a time, so only set the blob's time if no other path is linked to it
+            is_shared = st.st_nlink > 1 or blob_fp.name in self._links.values()
+            is_hardlink = mtime is None or st.st_mtime == mtime or not is_shared
+            if is_hardlink and mtime is not None and st.st_mtime != mtime:
+                os.utime(blob_fp, (mtime, mtime))
+            self.__link(blob_fp, dst, is_hardlink)
+            if mtime is not None and not os.path.samefile(blob_fp, dst):
+                os.utime(dst, (mtime, mtime))
+            self._links[str(Path(dst).resolve())] = blob_fp.name
+
+    # _____________________________________________________________________________
+    @staticmethod
+    def __link(blob_fp: Path, dst: Path, is_hardlink: bool = True):
+        if is_hardlink:
+            try:
+                os.link(blob_fp, dst)
+                return
+            except OSError:
+                _logger.debug(f'Cannot hardlink "{dst.name}"')
+        try:
+            _reflink(blob_fp, dst)
+            return
+        except (ImportError, OSError):
+            _logger.debug(f'Cannot reflink "{dst.name}"')
+        shutil.copy2(blob_fp, dst)
+
+    # _____________________________________________________________________________
+    def prune(self, dry_run: bool = False) -> List[Path]:
+        """Deletes blobs no longer referenced, forgetting links to missing paths and keys to unreferenced blobs
+
+        :return: List of blobs deleted
+        """
+        blobs = dict()  # Digest: blob paths
+        hardlinked = set()
+        with os.scandir(self._path) as it:
+            dirs = [e.path for e in it if e.is_dir(follow_symlinks=False)]
+        for dp in dirs:
+            with os.scandir(dp) as it:
+                for entry in it:
+                    if entry.is_file(follow_symlinks=False):
+                        digest = entry.name.split('.', 1)[0]
+                        blobs.setdefault(digest, []).append(Path(entry.path))
+                        if entry.stat().st_nlink > 1:
+                            hardlinked.add(digest)  # Possibly linked from a path not recorded
+
+        with self._lock:
+            dead_links = [path for path in self._links if not os.path.exists(path)]
+            referenced = {name.split('.', 1)[0] for path, name in self._links.items()
+                          if path not in dead_links} | hardlinked
+            dead_keys = [k for k, digest in self._keys.items() if digest not in referenced]
+            if not dry_run:
+                for path in dead_links:
+                    del self._links[path]
+                for key in dead_keys:
+                    del self._keys[key]
+
+        deleted = []
+        for digest in blobs.keys() - referenced:
+            for blob_fp in blobs[digest]:
+                if not dry_run:
+                    try:
+                        os.remove(blob_fp)
+                    except OSError:
+                        _logger.warning(f'Cannot delete blob "{blob_fp}"')
+                        continue
+                deleted.append(blob_fp)
+        _logger.debug(f'Pruned {len(deleted)} blobs, forgot {len(dead_keys)} keys')
+        return deleted
+
+    # _____________________________________________________________________________
+    def write(self):
+        with self._lock:
+            data = json.dumps({'keys': self._keys, 'links': self._links}, sort_keys=True, indent=2)
+        tmp_fp = self._keys_fp.with_suffix('.tmp')
+        try:
+            tmp_fp.write_text(data)
+            os.replace(tmp_fp, self._keys_fp)
+        except PermissionError:
+            _logger.error(f'Cannot write to "{self._keys_fp.name}"')
+            raise
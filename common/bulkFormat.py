@@ -0,0 +1,219 @@
+"""Formats whole columns of numbers as fixed width strings, for tables and reports with many rows.
+
+The results are the same as formatting each value with an f-string, or with common.metricPrefix, but the work is
+done with NumPy array operations rather than per value.
+
+Notes:
+    1. Values are converted to integers scaled to a fixed number of decimal places, through float64, then rounded
+    half-even to the places output, as for Decimal formatting.  This is exact for Decimal values with no more
+    places than the scale and magnitudes below 10**(15 - scale), such as quantized prices.  Values with more places
+    are rounded twice so may differ from f-string formatting at exact halves.
+    2. Fixed point values are formatted by computing digits arithmetically into a matrix of characters which is
+    then viewed as a string array, rather than converting each integer to a string.
+    3. Metric prefixes are selected with searchsorted.  Numbers of 2**53 or more, which float64 cannot represent
+    exactly, are formatted one at a time with common.metricPrefix.
+"""
+from typing import Iterable, Sequence, Tuple, Union
+
+import numpy as np
+
+import common.metricPrefix as metricPrefix
+
+_FLOAT_EXACT_LIMIT = 2**53
+_SPACE, _ZERO, _POINT, _MINUS = ord(' '), ord('0'), ord('.'), ord('-')
+
+_dec_threshold = np.array(metricPrefix._dec_threshold, dtype=np.float64)
+_dec_divider = np.array(metricPrefix._dec_divider, dtype=np.float64)
+_dec_prefix = np.array([f' {p}' for p in metricPrefix._dec_prefix + ['']])
+
+_bin_threshold = np.array(metricPrefix._bin_threshold, dtype=np.float64)
+_bin_divider = np.array(metricPrefix._bin_divider, dtype=np.float64)
+_bin_prefix = np.array([f' {p}' for p in metricPrefix._bin_prefix + ['']])
+
+Column = Union[Sequence, np.ndarray]
+
+
+# _____________________________________________________________________________
+def to_fixed(values: Column, scale: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns values as integers scaled by 10**scale, and whether each value is set, that is neither None nor zero.
+
+    :param values: Decimal, int or float values, or None
+    :param scale: number of decimal places kept
+    :return: int64 array of scaled values, bool array of values set
+    """
+    if not isinstance(values, np.ndarray) or values.dtype.kind not in 'iuf':
+        values = np.fromiter((v or 0 for v in values), dtype=np.float64, count=len(values))
+    if values.dtype.kind == 'f':
+        return np.rint(values * 10 ** scale).astype(np.int64), values != 0
+    return values.astype(np.int64) * 10 ** scale, values != 0
+
+
+# _____________________________________________________________________________
+def format_fixed(fixed: np.ndarray, scale: int, places: int, width: int, suffix: str = '',
+                 is_set: np.ndarray = None) -> np.ndarray:
+    """Returns scaled integers formatted as f'{value:{width}.{places}f}{suffix}'
+
+    :param fixed: integers scaled by 10**scale, as from to_fixed
+    :param scale: decimal places of fixed
+    :param places: decimal places output, rounding half-even if fewer than scale
+    :param is_set: if given, values not set are output as spaces
+    """
+    fixed = np.asarray(fixed, dtype=np.int64)
+    negative = fixed < 0
+    magnitude = np.abs(fixed)
+    if places < scale:
+        divisor = 10 ** (scale - places)
+        magnitude, remainder = np.divmod(magnitude, divisor)
+        half = divisor // 2
+        magnitude += (remainder > half) | ((remainder == half) & (magnitude % 2 == 1))
+    elif places > scale:
+        magnitude = magnitude * 10 ** (places - scale)
+
+    # Digits as a matrix of characters, with leading zeros as spaces except for the units digit
+    count = max(places + 1, len(str(int(magnitude.max()))) if len(magnitude) else 1)
+    digits = magnitude[:, None] // (10 ** np.arange(count - 1, -1, -1, dtype=np.int64)) % 10
+    is_leading = np.cumsum(digits != 0, axis=1) == 0
+    is_leading[:, count - places - 1:] = False
+    chars = np.where(is_leading, _SPACE, digits + _ZERO).astype(np.uint32)
+
+    # Layout of sign, integer digits, decimal point and fraction digits right justified to width
+    body = count + (1 if places else 0) + (1 if negative.any() else 0)
+    length = max(width, body)
+    result = np.full((len(fixed), length + len(suffix)), _SPACE, dtype=np.uint32)
+    start = length - count - (1 if places else 0)
+    result[:, start:start + count - places] = chars[:, :count - places]
+    if places:
+        result[:, length - places - 1] = _POINT
+        result[:, length - places:length] = chars[:, count - places:]
+    if negative.any():
+        rows = np.nonzero(negative)[0]
+        result[rows, start + is_leading[rows].sum(axis=1) - 1] = _MINUS
+    if suffix:
+        result[:, length:] = [ord(c) for c in suffix]
+    if is_set is not None:
+        result[~np.asarray(is_set)] = _SPACE
+
+    if length == width:
+        return result.view(f'<U{result.shape[1]}').ravel()
+
+    # Values wider than width are not padded, so justify each value to width as for f-strings
+    text = np.ascontiguousarray(result[:, :length]).view(f'<U{length}').ravel()
+    text = np.char.add(np.char.rjust(np.char.lstrip(text), width), suffix)
+    return text if is_set is None else np.where(is_set, text, ' ' * (width + len(suffix)))
+
+
+# _____________________________________________________________________________
+def format_split(fixed: np.ndarray, is_above: np.ndarray, scale: int, above: tuple, below: tuple,
+                 is_set: np.ndarray = None) -> np.ndarray:
+    """Returns scaled integers formatted with the places, width and suffix of above or below, each value formatted
+    once.
+
+    :param above: (places, width, suffix) for values where is_above
+    :param below: (places, width, suffix) for other values
+    """
+    parts = []
+    for mask, (places, width, suffix) in ((is_above, above), (~is_above, below)):
+        if mask.any():
+            parts.append((mask, format_fixed(fixed[mask], scale, places, width, suffix,
+                                             None if is_set is None else is_set[mask])))
+    result = np.empty(len(fixed), dtype=max((text.dtype for _, text in parts), default=np.dtype('<U1')))
+    for mask, text in parts:
+        result[mask] = text
+    return result
+
+
+# _____________________________________________________________________________
+def _digits_matrix(values: np.ndarray, count: int) -> np.ndarray:
+    """Returns non-negative integers of up to count digits as a matrix of right justified characters"""
+    digits = values[:, None] // (10 ** np.arange(count - 1, -1, -1, dtype=np.int64)) % 10
+    is_leading = np.cumsum(digits != 0, axis=1) == 0
+    is_leading[:, -1] = False
+    return np.where(is_leading, _SPACE, digits + _ZERO).astype(np.uint32)
+
+
+# _____________________________________________________________________________
+def _to_units(numbers: Column, small: int, thresholds: np.ndarray, dividers: np.ndarray, prefixes: np.ndarray,
+              is_decimal: bool, scalar, width: int) -> np.ndarray:
+    numbers = np.asarray(numbers)
+    if not len(numbers):
+        return np.empty(0, dtype=f'<U{max(width, 1)}')
+    if numbers.dtype.kind not in 'iu':
+        return np.char.rjust(np.array([scalar(n) for n in numbers.tolist()], dtype=str), width)
+
+    max_idx = len(thresholds) - 1
+    idx = np.minimum(np.searchsorted(thresholds, numbers, side='right'), max_idx)
+    value = np.rint(numbers / dividers[idx]).astype(np.int64)
+    is_carry = ((value == 10**4) if is_decimal else (value >= 10**4)) & (idx != max_idx)
+    is_small = numbers < small
+    value = np.where(is_small, numbers, np.where(is_carry, 10, value))
+    suffix = np.where(is_small, '  ', prefixes[np.where(is_carry, idx + 1, idx)])
+
+    is_large = np.abs(numbers) >= _FLOAT_EXACT_LIMIT
+    if len(numbers) and (numbers >= 0).all() and (np.char.str_len(suffix) == 2).all():
+        # Values are at most 5 digits and suffixes 2 characters, so justify within a matrix of characters
+        count = max(width - 2, 5)
+        chars = np.full((len(numbers), count + 2), _SPACE, dtype=np.uint32)
+        chars[:, :count] = _digits_matrix(value, count)
+        chars[:, count:] = suffix.astype('<U2').view(np.uint32).reshape(-1, 2)
+        result = chars.view(f'<U{count + 2}').ravel()
+        if width < count + 2:
+            result = np.char.rjust(np.char.lstrip(result), width)
+    else:
+        result = np.char.rjust(np.char.add(value.astype(str), suffix), width)
+    if is_large.any():
+        result = result.astype(object)
+        result[is_large] = [scalar(n).rjust(width) for n in numbers[is_large].tolist()]
+        result = result.astype(str)
+    return result
+
+
+# _____________________________________________________________________________
+def to_decimal_units(numbers: Column, width: int = 0) -> np.ndarray:
+    """Returns numbers formatted as for common.metricPrefix.to_decimal_units, right justified to width"""
+    return _to_units(numbers, 10**4, _dec_threshold, _dec_divider, _dec_prefix, True, metricPrefix.to_decimal_units,
+                     width)
+
+
+# _____________________________________________________________________________
+def to_binary_units(numbers: Column, width: int = 0) -> np.ndarray:
+    """Returns numbers formatted as for common.metricPrefix.to_binary_units, right justified to width"""
+    return _to_units(numbers, 10**3*10, _bin_threshold, _bin_divider, _bin_prefix, False, metricPrefix.to_binary_units,
+                     width)
+
+
+# _____________________________________________________________________________
+def _char_matrix(column: Union[np.ndarray, str], rows: int) -> np.ndarray:
+    """Returns a column of strings, or a string repeated for each row, as a matrix of characters, or None if the
+    strings are not all the same length"""
+    if isinstance(column, str):
+        return np.broadcast_to(np.array([ord(c) for c in column], dtype=np.uint32), (rows, len(column)))
+    column = np.ascontiguousarray(column, dtype=str)
+    width = column.dtype.itemsize // 4
+    if width and np.char.str_len(column).min() != width:
+        return None
+    return column.view(np.uint32).reshape(rows, width)
+
+
+# _____________________________________________________________________________
+def join_rows(columns: Iterable[Union[np.ndarray, str]], lines_per_block: int = 0) -> str:
+    """Returns the columns, and separators given as strings, joined into lines, with an empty line after each block
+    of lines.
+    """
+    columns = list(columns)
+    rows = next((len(c) for c in columns if not isinstance(c, str)), 0)
+    if not rows:
+        return ''
+
+    ends = np.full(rows, '\n', dtype='<U2')
+    if lines_per_block:
+        ends[lines_per_block - 1::lines_per_block] = '\n\n'
+    matrices = [_char_matrix(c, rows) for c in columns]
+    if all(m is not None for m in matrices):
+        # Fixed width columns are joined by copying characters, and the trailing padding of ends is dropped
+        matrices.append(ends.view(np.uint32).reshape(rows, 2))
+        return np.concatenate(matrices, axis=1).tobytes().decode('utf-32-le').replace('\x00', '')
+
+    lines = columns[0]
+    for column in columns[1:]:
+        lines = np.char.add(lines, column)
+    return ''.join(np.char.add(lines, ends).tolist())
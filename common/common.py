@@ -1,5 +1,6 @@
 from datetime import datetime, date, time
 import logging
+import multiprocessing
 import random
 import uuid
 import re
@@ -19,10 +20,10 @@ re_yahoo_symbol = re.compile(r'([A-Z0-9]{2,6})(?:\.AX)?', re.IGNORECASE)
 
 
 # _____________________________________________________________________________
+# Settings for connection pools, created per host by common.httpClient which retries failed requests
 url_headers = urllib3.make_headers(keep_alive=True, accept_encoding=True)
-url_retries = urllib3.Retry(total=4, backoff_factor=5, status_forcelist=[500, 502, 503, 504])
-url_client = urllib3.PoolManager(timeout=urllib3.Timeout(total=15.0), retries=url_retries, headers=url_headers,
-            block=True, maxsize=10)
+url_retries = urllib3.Retry(total=None, connect=0, read=0, status=0, other=0, redirect=5)
+url_timeout = urllib3.Timeout(total=15.0)
 
 
 # _____________________________________________________________________________
@@ -35,3 +36,12 @@ def multisort(coll: List, specs):
 # _____________________________________________________________________________
 def sleep(value: float, min_value: float = 0):
     time.sleep(ran.uniform(min_value, value))
+
+
+# _____________________________________________________________________________
+def pool_context() -> multiprocessing.context.BaseContext:
+    """Returns a multiprocessing context for process pools started while other threads run.  Forked workers would
+    copy locks held by those threads, such as of logging and connection pools, so workers are started by a fork
+    server where available, otherwise spawned."""
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    return multiprocessing.get_context(method)
@@ -0,0 +1,668 @@
+"""Shared HTTP request layer with per-host connection pools, adaptive concurrency and metrics.
+
+Notes:
+    1. Each host has its own urllib3 pool manager, sized by configure_host, whose connection pools record
+    requests, new and reused connections, and time waiting for a free connection.  Connections can be opened
+    before first use with prewarm.
+    2. Each host has an AIMD (additive-increase, multiplicative-decrease) limit on requests in flight.  A request
+    that succeeds within the latency target raises the limit by 1/limit, so by about one per round of requests.  A
+    throttled response (429, 503), a server error, a connection error or a slow response cuts the limit by the
+    decrease factor, at most once per typical request latency so that one burst of failures counts once.
+    3. Latency is measured until the response headers are received.  A response not preloaded holds its
+    connection but not its in-flight slot while the body is read, and its bytes are counted when it is passed
+    to release.
+    4. Host names are resolved once per DNS cache time-to-live.  The resolved address is only used to open the
+    socket, so TLS server name indication and certificate checks still use the host name.
+    5. Retries are made here rather than by urllib3 so that sleeping between attempts does not hold a pool
+    connection or in-flight slot, and so that retries stop at the request deadline or run deadline.  Each host has
+    a circuit breaker that fails requests fast while the host is failing.
+    6. A request can be hedged across hosts serving the same content with HedgedRequest, cutting tail latency for
+    about one extra request in twenty.
+"""
+from collections import deque
+import concurrent.futures
+from dataclasses import dataclass
+import functools
+from io import StringIO
+import logging
+import socket
+import threading
+import time
+from typing import Dict, List
+from urllib import parse
+import urllib3
+
+from common.common import ran, url_headers, url_retries, url_timeout
+from common.metricPrefix import to_binary_units
+
+_logger = logging.getLogger(__name__)
+
+_THROTTLE_STATUSES = frozenset([429, 503])
+_EWMA_WEIGHT = 0.2
+_DEFAULT_POOL_SIZE = 10
+_DNS_TTL_SEC = 300
+
+
+# _____________________________________________________________________________
+class DnsCache:
+    """Caches the first address resolved for each host and port for a time-to-live"""
+
+    # _____________________________________________________________________________
+    def __init__(self, ttl: float = _DNS_TTL_SEC):
+        self._ttl = ttl
+        self._addresses: Dict[tuple, tuple] = dict()
+        self._lock = threading.Lock()
+
+    # _____________________________________________________________________________
+    def resolve(self, host: str, port: int) -> str:
+        now = time.monotonic()
+        with self._lock:
+            if (cached := self._addresses.get((host, port), None)) and cached[1] > now:
+                return cached[0]
+        # Prefer IPv4, as used by default by urllib3 on hosts without IPv6
+        addresses = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        address = min(addresses, key=lambda a: a[0] != socket.AF_INET)[4][0]
+        with self._lock:
+            self._addresses[(host, port)] = (address, now + self._ttl)
+        _logger.debug('Resolved %s to %s', host, address)
+        return address
+
+    # _____________________________________________________________________________
+    def invalidate(self, host: str):
+        with self._lock:
+            for key in [k for k in self._addresses if k[0] == host]:
+                del self._addresses[key]
+
+
+# _____________________________________________________________________________
+@dataclass
+class HostMetrics:
+    __slots__ = ['host', 'requests', 'errors', 'new_connections', 'reused_connections', 'pool_wait_sec',
+                'pool_wait_max_sec', 'bytes']
+
+    host: str
+    requests: int
+    errors: int
+    new_connections: int
+    reused_connections: int
+    pool_wait_sec: float
+    pool_wait_max_sec: float
+    bytes: int
+
+
+_dns_cache = DnsCache()
+_metrics: Dict[str, HostMetrics] = dict()
+_metrics_lock = threading.Lock()
+
+
+# _____________________________________________________________________________
+def _host_metrics(host: str) -> HostMetrics:
+    with _metrics_lock:
+        if (metrics := _metrics.get(host, None)) is None:
+            metrics = _metrics[host] = HostMetrics(host, 0, 0, 0, 0, 0.0, 0.0, 0)
+        return metrics
+
+
+# _____________________________________________________________________________
+class _MetricsPoolMixin:
+    """Records connection metrics for a connection pool and opens sockets to cached DNS addresses"""
+
+    # _____________________________________________________________________________
+    def _new_conn(self):
+        conn = super()._new_conn()
+        try:
+            conn._dns_host = _dns_cache.resolve(self.host, self.port)
+        except OSError:
+            _logger.debug(f'Cannot resolve {self.host}, deferring to connection')
+        return conn
+
+    # _____________________________________________________________________________
+    def _get_conn(self, timeout=None):
+        start = time.monotonic()
+        conn = super()._get_conn(timeout)
+        wait = time.monotonic() - start
+        is_new = getattr(conn, 'sock', None) is None
+        metrics = _host_metrics(self.host)
+        with _metrics_lock:
+            metrics.pool_wait_sec += wait
+            metrics.pool_wait_max_sec = max(metrics.pool_wait_max_sec, wait)
+            if is_new:
+                metrics.new_connections += 1
+            else:
+                metrics.reused_connections += 1
+        return conn
+
+
+# _____________________________________________________________________________
+class _MetricsHTTPConnectionPool(_MetricsPoolMixin, urllib3.HTTPConnectionPool):
+    pass
+
+
+# _____________________________________________________________________________
+class _MetricsHTTPSConnectionPool(_MetricsPoolMixin, urllib3.HTTPSConnectionPool):
+    pass
+
+
+_pool_sizes: Dict[str, int] = dict()
+_managers: Dict[str, urllib3.PoolManager] = dict()
+_managers_lock = threading.Lock()
+
+
+# _____________________________________________________________________________
+def configure_host(host: str, maxsize: int = _DEFAULT_POOL_SIZE):
+    """Sets the connection pool size for a host, before its first request"""
+    with _managers_lock:
+        _pool_sizes[host] = maxsize
+
+
+# _____________________________________________________________________________
+def _get_manager(host: str) -> urllib3.PoolManager:
+    with _managers_lock:
+        if (manager := _managers.get(host, None)) is None:
+            manager = urllib3.PoolManager(timeout=url_timeout, retries=url_retries, headers=url_headers,
+                        block=True, maxsize=_pool_sizes.get(host, _DEFAULT_POOL_SIZE))
+            manager.pool_classes_by_scheme = {'http': _MetricsHTTPConnectionPool,
+                                              'https': _MetricsHTTPSConnectionPool}
+            _managers[host] = manager
+        return manager
+
+
+# _____________________________________________________________________________
+def prewarm(url: str, count: int = 1):
+    """Opens connections to a URL's host ahead of use and returns them to its pool"""
+    urlp = parse.urlsplit(url)
+    pool = _get_manager(urlp.hostname).connection_from_host(urlp.hostname, urlp.port, urlp.scheme)
+    conns = []
+    try:
+        # Take free slots from the pool, so connections are not reused, then connect
+        for _ in range(count):
+            conns.append(pool._get_conn())
+        for conn in conns:
+            if getattr(conn, 'sock', None) is None:
+                conn.connect()
+    except (OSError, urllib3.exceptions.HTTPError):
+        _logger.warning(f'Cannot prewarm connection to {urlp.hostname}')
+    finally:
+        for conn in conns:
+            pool._put_conn(conn)
+
+
+# _____________________________________________________________________________
+class AimdLimiter:
+    """Additive-increase, multiplicative-decrease limit on requests in flight to a host"""
+
+    # _____________________________________________________________________________
+    def __init__(self, host: str, initial: float = 2, minimum: float = 1, maximum: float = 16,
+                decrease: float = 0.5, latency_target: float = 3.0):
+        self._host = host
+        self._limit = float(initial)
+        self._minimum = minimum
+        self._maximum = maximum
+        self._decrease = decrease
+        self._latency_target = latency_target
+        self._in_flight = 0
+        self._latency = None
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+
+    # _____________________________________________________________________________
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    # _____________________________________________________________________________
+    @property
+    def latency(self) -> float:
+        return self._latency
+
+    # _____________________________________________________________________________
+    def acquire(self):
+        with self._cond:
+            while self._in_flight >= int(self._limit):
+                self._cond.wait()
+            self._in_flight += 1
+
+    # _____________________________________________________________________________
+    def release(self, latency: float, status: int = None):
+        """Releases an in-flight slot and adjusts the limit from the request outcome
+        :param latency: seconds to response, or to failure
+        :param status: response status, or None if the request failed
+        """
+        with self._cond:
+            self._in_flight -= 1
+            previous = int(self._limit)
+            now = time.monotonic()
+
+            if status is None or status in _THROTTLE_STATUSES or status >= 500:
+                reason = 'error' if status is None else str(status)
+            elif latency > self._latency_target:
+                reason = f'latency {latency:.1f}s'
+            else:
+                reason = None
+                self._latency = latency if self._latency is None else \
+                    (1 - _EWMA_WEIGHT) * self._latency + _EWMA_WEIGHT * latency
+                self._limit = min(self._maximum, self._limit + 1 / self._limit)
+
+            if reason and now - self._last_decrease > (self._latency or latency):
+                self._limit = max(self._minimum, self._limit * self._decrease)
+                self._last_decrease = now
+
+            if (current := int(self._limit)) != previous:
+                if reason:
+                    _logger.info('%s concurrency %d -> %d (%s)', self._host, previous, current, reason)
+                else:
+                    _logger.debug('%s concurrency %d -> %d', self._host, previous, current)
+            self._cond.notify_all()
+
+
+_limiters: Dict[str, AimdLimiter] = dict()
+_limiters_lock = threading.Lock()
+
+
+# _____________________________________________________________________________
+def get_limiter(host: str) -> AimdLimiter:
+    with _limiters_lock:
+        if (limiter := _limiters.get(host, None)) is None:
+            limiter = _limiters[host] = AimdLimiter(host)
+        return limiter
+
+
+# _____________________________________________________________________________
+class CircuitOpenError(urllib3.exceptions.HTTPError):
+    """Raised, without a request being made, while a host's circuit breaker is open"""
+
+    # _____________________________________________________________________________
+    def __init__(self, host: str, retry_after: float):
+        super().__init__(f'Circuit open for {host}, retry after {retry_after:.0f}s')
+        self.host = host
+
+
+# _____________________________________________________________________________
+class DeadlineExceededError(urllib3.exceptions.HTTPError):
+    """Raised when no time remains before the request or run deadline"""
+
+
+# _____________________________________________________________________________
+class CircuitBreaker:
+    """Stops requests to a host after consecutive failures until a cooldown passes, then allows one trial request
+    whose outcome closes or reopens the circuit"""
+
+    # _____________________________________________________________________________
+    def __init__(self, host: str, failure_threshold: int = 5, cooldown: float = 60.0):
+        self._host = host
+        self._failure_threshold = failure_threshold
+        self._cooldown = cooldown
+        self._failures = 0
+        self._open_until = None
+        self._is_trial = False
+        self._lock = threading.Lock()
+
+    # _____________________________________________________________________________
+    def check(self) -> bool:
+        """Raises CircuitOpenError if requests to the host are not allowed
+
+        :return: True if the request allowed is the trial request, whose outcome must be recorded or abandoned
+        """
+        with self._lock:
+            if self._open_until is None:
+                return False
+            if (now := time.monotonic()) < self._open_until or self._is_trial:
+                raise CircuitOpenError(self._host, max(0.0, self._open_until - now))
+            self._is_trial = True
+            _logger.info(f'{self._host} circuit half-open, trial request')
+            return True
+
+    # _____________________________________________________________________________
+    def abandon(self):
+        """Ends a trial request with no outcome, so a later request is the trial"""
+        with self._lock:
+            self._is_trial = False
+
+    # _____________________________________________________________________________
+    def record(self, is_success: bool):
+        with self._lock:
+            if is_success:
+                if self._open_until is not None:
+                    _logger.info(f'{self._host} circuit closed')
+                self._failures, self._open_until, self._is_trial = 0, None, False
+                return
+            self._failures += 1
+            if self._is_trial or (self._open_until is None and self._failures >= self._failure_threshold):
+                self._open_until, self._is_trial = time.monotonic() + self._cooldown, False
+                _logger.warning(f'{self._host} circuit open for {self._cooldown:.0f}s after {self._failures} failures')
+
+
+# _____________________________________________________________________________
+@dataclass
+class RetryPolicy:
+    __slots__ = ['attempts', 'base_delay', 'max_delay', 'request_deadline', 'statuses']
+
+    attempts: int
+    base_delay: float
+    max_delay: float
+    request_deadline: float
+    statuses: frozenset
+
+    # _____________________________________________________________________________
+    def backoff(self, attempt: int) -> float:
+        """Returns delay before a retry with full jitter on exponential backoff"""
+        return ran.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+retry_policy = RetryPolicy(4, 0.5, 8.0, 45.0, frozenset([429, 500, 502, 503, 504]))
+_run_deadline = None
+_breakers: Dict[str, CircuitBreaker] = dict()
+_breakers_lock = threading.Lock()
+
+
+# _____________________________________________________________________________
+def set_run_deadline(seconds: float):
+    """Sets a deadline, from now, for all requests, or clears it if seconds is None"""
+    global _run_deadline
+    _run_deadline = time.monotonic() + seconds if seconds else None
+
+
+# _____________________________________________________________________________
+def skip_reason(ex: Exception) -> str:
+    """Returns a short reason for a request not made, as for CircuitOpenError and DeadlineExceededError"""
+    return 'circuit open' if isinstance(ex, CircuitOpenError) else 'deadline'
+
+
+# _____________________________________________________________________________
+def get_breaker(host: str) -> CircuitBreaker:
+    with _breakers_lock:
+        if (breaker := _breakers.get(host, None)) is None:
+            breaker = _breakers[host] = CircuitBreaker(host)
+        return breaker
+
+
+# _____________________________________________________________________________
+def _attempt(host: str, method: str, url: str, remaining: float, **kwargs) -> urllib3.HTTPResponse:
+    limiter, metrics = get_limiter(host), _host_metrics(host)
+    limiter.acquire()
+    start, status = time.monotonic(), None
+    try:
+        kwargs.setdefault('timeout', urllib3.Timeout(total=min(url_timeout.total or remaining, remaining)))
+        kwargs.setdefault('pool_timeout', remaining)
+        rsp = _get_manager(host).request(method, url, **kwargs)
+        status = rsp.status
+        rsp.metrics_host = host
+        if kwargs.get('preload_content', True):
+            with _metrics_lock:
+                metrics.bytes += len(rsp.data or b'')
+        return rsp
+    except urllib3.exceptions.HTTPError as ex:
+        if isinstance(getattr(ex, 'reason', ex), urllib3.exceptions.NewConnectionError):
+            _dns_cache.invalidate(host)
+        raise
+    finally:
+        limiter.release(time.monotonic() - start, status)
+        with _metrics_lock:
+            metrics.requests += 1
+            metrics.errors += 1 if status is None or status >= 400 else 0
+
+
+# _____________________________________________________________________________
+def request(method: str, url: str, deadline: float = None, **kwargs) -> urllib3.HTTPResponse:
+    """Makes a request, as for urllib3 PoolManager.request, once the host's concurrency limit allows.  A response
+    not preloaded should be passed to release once read.
+
+    :param deadline: seconds allowed for the request including retries, defaulting to the retry policy, and
+    limited by any run deadline
+    :raises CircuitOpenError: if the host's circuit breaker is open
+    :raises DeadlineExceededError: if no time remains for the request
+
+    Failed requests, and responses with a retry status, are retried with jittered backoff while attempts and
+    time remain.  The last response with a retry status is returned rather than raising.
+    """
+    host = parse.urlsplit(url).hostname
+    breaker = get_breaker(host)
+    end = time.monotonic() + (deadline or retry_policy.request_deadline)
+    if _run_deadline is not None:
+        end = min(end, _run_deadline)
+
+    for attempt in range(retry_policy.attempts):
+        if (remaining := end - time.monotonic()) <= 0:
+            raise DeadlineExceededError(f'Deadline exceeded for {url}')
+        is_trial, is_recorded = breaker.check(), False
+        is_last = attempt == retry_policy.attempts - 1
+        try:
+            rsp = _attempt(host, method, url, remaining, **kwargs)
+        except urllib3.exceptions.HTTPError as ex:
+            breaker.record(False)
+            is_recorded = True
+            delay = retry_policy.backoff(attempt)
+            if is_last or time.monotonic() + delay >= end:
+                raise
+            _logger.debug('Retry %d in %.1fs after %s: %s', attempt + 1, delay, type(ex).__name__, url)
+        else:
+            # Throttling and other retry statuses are failures, so persistent throttling opens the circuit
+            breaker.record(rsp.status < 500 and rsp.status not in retry_policy.statuses)
+            is_recorded = True
+            if rsp.status not in retry_policy.statuses or is_last:
+                return rsp
+            delay = retry_policy.backoff(attempt)
+            if (retry_after := rsp.headers.get('Retry-After', '')).isdigit():
+                delay = max(delay, float(retry_after))
+            if time.monotonic() + delay >= end:
+                return rsp
+            _logger.debug('Retry %d in %.1fs after status %d: %s', attempt + 1, delay, rsp.status, url)
+            rsp.drain_conn()
+            release(rsp)
+        finally:
+            if is_trial and not is_recorded:
+                breaker.abandon()
+        time.sleep(delay)
+
+
+# _____________________________________________________________________________
+def release(rsp: urllib3.HTTPResponse):
+    """Releases the connection of a response not preloaded, counting the bytes read"""
+    if (host := getattr(rsp, 'metrics_host', None)) and not getattr(rsp, 'metrics_counted', False):
+        rsp.metrics_counted = True
+        metrics = _host_metrics(host)
+        with _metrics_lock:
+            metrics.bytes += rsp.tell()
+    rsp.release_conn()
+
+
+# _____________________________________________________________________________
+@dataclass
+class HedgeMetrics:
+    __slots__ = ['name', 'requests', 'hedged', 'primary_wins', 'hedge_wins', 'delay_sec']
+
+    name: str
+    requests: int
+    hedged: int
+    primary_wins: int
+    hedge_wins: int
+    delay_sec: float
+
+
+_hedge_metrics: Dict[str, HedgeMetrics] = dict()
+
+
+# _____________________________________________________________________________
+class HedgedRequest:
+    """Sends a request to a primary URL and, if there is no response within a delay, or the primary fails, the same
+    request to an alternate URL, returning the first good response.
+
+    The delay is the 95th percentile of recent primary latencies, so about one request in twenty is hedged, and
+    hedging is skipped while the hedge rate is above max_hedge_rate so that a slow primary does not double load.  A
+    primary losing to the hedge is sampled at its latency so far, so slow primaries still raise the delay.  The
+    samples and the request and hedge counts, over about the last max_samples requests, may be carried between runs
+    so the delay and the hedge rate are not reset each run.  A response arriving after another has been returned is
+    discarded and its connection closed.  Requests run on daemon threads, so a losing request still in flight does
+    not delay the process exiting.
+    """
+
+    # _____________________________________________________________________________
+    def __init__(self, name: str, samples: List[float] = None, requests: int = 0, hedged: int = 0,
+                 default_delay: float = 1.0, min_delay: float = 0.1, max_hedge_rate: float = 0.2,
+                 max_samples: int = 200):
+        self._name = name
+        self._samples = deque(samples or [], maxlen=max_samples)
+        self._requests = requests
+        self._hedged = hedged
+        self._max_samples = max_samples
+        self._default_delay = default_delay
+        self._min_delay = min_delay
+        self._max_hedge_rate = max_hedge_rate
+        self._lock = threading.Lock()
+        with _metrics_lock:
+            self._metrics = _hedge_metrics.setdefault(name, HedgeMetrics(name, 0, 0, 0, 0, self.delay))
+
+    # _____________________________________________________________________________
+    @property
+    def samples(self) -> List[float]:
+        """Recent primary latencies in seconds, for persisting between runs"""
+        with self._lock:
+            return list(self._samples)
+
+    # _____________________________________________________________________________
+    @property
+    def counts(self) -> (int, int):
+        """Recent requests and hedged requests, for persisting between runs"""
+        with self._lock:
+            return self._requests, self._hedged
+
+    # _____________________________________________________________________________
+    @property
+    def delay(self) -> float:
+        with self._lock:
+            if len(self._samples) < 20:
+                return self._default_delay
+            ordered = sorted(self._samples)
+            return max(self._min_delay, ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))])
+
+    # _____________________________________________________________________________
+    def __record_primary(self, start: float, recorded: threading.Event, future: concurrent.futures.Future):
+        if not future.cancelled() and future.exception() is None:
+            self.__record_latency(recorded, time.monotonic() - start)
+
+    # _____________________________________________________________________________
+    def __record_latency(self, recorded: threading.Event, latency: float):
+        """Records a primary latency once, whether on completion or when the hedge has won"""
+        with self._lock:
+            if not recorded.is_set():
+                recorded.set()
+                self._samples.append(latency)
+
+    # _____________________________________________________________________________
+    def __count(self, is_hedged: bool):
+        with self._lock:
+            self._requests += 1
+            self._hedged += 1 if is_hedged else 0
+            if self._requests > self._max_samples:
+                # Halve the counts so the hedge rate follows recent requests
+                self._requests //= 2
+                self._hedged //= 2
+
+    # _____________________________________________________________________________
+    def __may_hedge(self) -> bool:
+        with self._lock:
+            return self._hedged < self._max_hedge_rate * self._requests + 1
+
+    # _____________________________________________________________________________
+    @staticmethod
+    def __is_good(future: concurrent.futures.Future) -> bool:
+        return future.done() and future.exception() is None and future.result().status < 500
+
+    # _____________________________________________________________________________
+    @staticmethod
+    def __discard(future: concurrent.futures.Future):
+        if not future.cancelled() and future.exception() is None:
+            # Close rather than return the connection to the pool, as the body may not have been read
+            rsp = future.result()
+            rsp.close()
+            release(rsp)
+
+    # _____________________________________________________________________________
+    @staticmethod
+    def __submit(method: str, url: str, **kwargs) -> concurrent.futures.Future:
+        """Makes the request on a daemon thread, returning its future"""
+        future = concurrent.futures.Future()
+
+        # _____________________________________________________________________________
+        def run():
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(request(method, url, **kwargs))
+                except BaseException as ex:
+                    future.set_exception(ex)
+
+        threading.Thread(target=run, name='hedge', daemon=True).start()
+        return future
+
+    # _____________________________________________________________________________
+    def request(self, method: str, urls: List[str], **kwargs) -> urllib3.HTTPResponse:
+        """Makes the request, as for request, to the first URL, hedged with the second URL if given
+
+        :raises urllib3.exceptions.HTTPError: if neither request returns a response
+        """
+        start, delay = time.monotonic(), self.delay
+        primary = self.__submit(method, urls[0], **kwargs)
+        recorded = threading.Event()
+        primary.add_done_callback(functools.partial(self.__record_primary, start, recorded))
+        futures = [primary]
+
+        concurrent.futures.wait(futures, timeout=delay)
+        is_hedged = len(urls) > 1 and not self.__is_good(primary) and self.__may_hedge()
+        if is_hedged:
+            _logger.debug('%s hedging after %.2fs: %s', self._name, time.monotonic() - start, urls[1])
+            futures.append(self.__submit(method, urls[1], **kwargs))
+        self.__count(is_hedged)
+        with _metrics_lock:
+            self._metrics.requests += 1
+            self._metrics.hedged += 1 if is_hedged else 0
+            self._metrics.delay_sec = delay
+
+        winner, pending = None, set(futures)
+        while pending and winner is None:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            winner = next((f for f in futures if f in done and self.__is_good(f)), None)
+        if winner is None:
+            # No good response so return or raise the result of the primary, discarding the hedge
+            winner = primary
+        elif winner is not primary and not primary.done():
+            # Primary is at least this slow, so sample it now rather than drop it if it fails or never completes
+            self.__record_latency(recorded, time.monotonic() - start)
+        for future in futures:
+            if future is not winner:
+                future.cancel()
+                future.add_done_callback(self.__discard)
+        if is_hedged:
+            with _metrics_lock:
+                self._metrics.primary_wins += 1 if winner is primary else 0
+                self._metrics.hedge_wins += 0 if winner is primary else 1
+        return winner.result()
+
+
+# _____________________________________________________________________________
+def get_metrics() -> Dict[str, HostMetrics]:
+    with _metrics_lock:
+        return {k: HostMetrics(*(getattr(v, a) for a in HostMetrics.__slots__)) for k, v in _metrics.items()}
+
+
+# _____________________________________________________________________________
+def output_metrics():
+    """Prints per-host request and connection metrics"""
+    if not (metrics := get_metrics()):
+        return
+    with StringIO() as buf:
+        buf.write(f'\n {"host":<28s} | {"requests":>8s} {"errors":>6s} | {"new":>5s} {"reused":>6s} | '
+                  f'{"wait s":>7s} {"max s":>6s} | {"bytes":>9s}\n')
+        for m in sorted(metrics.values(), key=lambda x: x.host):
+            buf.write(f' {m.host:<28s} | {m.requests:8d} {m.errors:6d} | {m.new_connections:5d} '
+                      f'{m.reused_connections:6d} | {m.pool_wait_sec:7.2f} {m.pool_wait_max_sec:6.2f} | '
+                      f'{to_binary_units(m.bytes) + "B":>9s}\n')
+        with _metrics_lock:
+            hedges = [HedgeMetrics(*(getattr(v, a) for a in HedgeMetrics.__slots__)) for v in _hedge_metrics.values()]
+        if hedges:
+            buf.write(f'\n {"hedged requests":<28s} | {"requests":>8s} {"hedged":>6s} | {"primary":>7s} {"hedge":>5s}'
+                      f' | {"delay s":>7s}\n')
+            for h in sorted(hedges, key=lambda x: x.name):
+                buf.write(f' {h.name:<28s} | {h.requests:8d} {h.hedged:6d} | {h.primary_wins:7d} {h.hedge_wins:5d}'
+                          f' | {h.delay_sec:7.2f}\n')
+        _logger.debug(buf.getvalue())
+        print(buf.getvalue())
@@ -5,22 +5,56 @@ Notes:
 formating and caching.  Subsequent calls to logging handlers use the same cached exception text.  The cached exception
 string is stored in LogRecord record.exec_text and must be cleared if a different exception format is required.  Thus
 custom logging formatters should be added after standard Logging formatters.
+- Loggers put records on a queue and a single listener thread formats and writes them, so log calls in worker
+threads do not block on file or console output.  Use %-style arguments rather than f-strings in frequently called
+code so that formatting is deferred to the listener thread and skipped for disabled levels.
+- By default debug records are kept in memory per task and only written to the debug log file when the task logs a
+warning or error, so that the debug log holds the context of failures rather than every step of every run.  Info
+and higher records are always written.
 """
+import atexit
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+import json
 import logging
 import logging.config
+from logging.handlers import QueueHandler, QueueListener
 from os import environ, PathLike
 from pathlib import Path
+import queue
 from sys import exc_info, stdout
+from typing import Any, Deque, Dict, Optional
 
 _logger = logging.getLogger(__name__)
 
+_DEBUG_CAPACITY = 500   # Debug records kept per task
+_DEBUG_TASKS = 256      # Tasks with debug records kept
+
+_task_id: ContextVar = ContextVar('log_task_id', default=None)
+
+_queue: Optional[queue.Queue] = None
+_listener: Optional[QueueListener] = None
+
 
 # _____________________________________________________________________________
-def initialize_logger(logger_dp: PathLike, log_basename: str):
+def initialize_logger(logger_dp: PathLike, log_basename: str, is_json: bool = None,
+            debug_capacity: int = _DEBUG_CAPACITY, is_debug_full: bool = False):
+    """Logs to console, log file and debug log file, and optionally a JSON lines file, from a single background
+    thread so that callers do not format messages or write files.
+
+    :param logger_dp: directory for log files
+    :param log_basename: log file names without suffix
+    :param is_json: also log to a JSON lines file, defaulting to environment variable LOGJSON being set
+    :param debug_capacity: debug records kept in memory per task, written to the debug log file only when the task
+    logs a warning or error.  If 0 all debug records are written.
+    :param is_debug_full: write all debug records, as for debug_capacity 0
+    """
+    global _queue, _listener
     Path(logger_dp).mkdir(parents=True, exist_ok=True)
 
-    console_formatter = logging.Formatter(fmt='%(msg)s')
-    context_formatter = logging.Formatter(fmt='%(levelname)-6s %(msg)s')
+    console_formatter = logging.Formatter(fmt='%(message)s')
+    context_formatter = logging.Formatter(fmt='%(levelname)-6s %(message)s')
 
     console_handler = logging.StreamHandler(stdout)
     console_handler.setFormatter(console_formatter)
@@ -37,16 +71,133 @@ def initialize_logger(logger_dp: PathLike, log_basename: str):
     debug_handler = PathFileHandler(debug_fp, mode='w')
     debug_handler.setFormatter(context_formatter)
     debug_handler.setLevel(logging.DEBUG)
+    if debug_capacity and not is_debug_full:
+        debug_handler = TaskBufferHandler(debug_handler, debug_capacity)
+
+    handlers = [output_handler, debug_handler, console_handler]
+    if is_json if is_json is not None else bool(environ.get('LOGJSON')):
+        json_handler = PathFileHandler(Path(logger_dp, log_basename).with_suffix('.jsonl'), mode='w')
+        json_handler.setFormatter(JsonLinesFormatter())
+        json_handler.setLevel(logging.DEBUG)
+        handlers.append(json_handler)
+
+    stop_logger()
+    _queue = queue.Queue()
+    _listener = QueueListener(_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logger)
 
     root = logging.getLogger()
     root.propagate = False
     root.setLevel(environ.get('LOGLEVEL', logging.DEBUG))
-    root.addHandler(output_handler)
-    root.addHandler(debug_handler)
-    root.addHandler(console_handler)
+    for handler in [h for h in root.handlers if isinstance(h, DeferredQueueHandler)]:
+        root.removeHandler(handler)
+    root.addHandler(DeferredQueueHandler(_queue))
 
     logging.captureWarnings(True)
-    _logger.debug(f'initialize_logger "{log_basename}" "{logger_dp}"')
+    _logger.debug('initialize_logger "%s" "%s"', log_basename, logger_dp)
+
+
+# _____________________________________________________________________________
+def flush_logger():
+    """Waits until queued log records are written, such as before printing output that should follow them"""
+    if _listener is not None:
+        _queue.join()
+
+
+# _____________________________________________________________________________
+def stop_logger():
+    """Writes queued log records and stops the background logging thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+# _____________________________________________________________________________
+@contextmanager
+def log_task(task_id: Any):
+    """Tags records logged within the context, on this thread, with a task ID such as an announcement ID, so that
+    debug records are kept and written per task"""
+    token = _task_id.set(task_id)
+    try:
+        yield
+    finally:
+        _task_id.reset(token)
+
+
+# _____________________________________________________________________________
+class DeferredQueueHandler(QueueHandler):
+    """Queues log records as logged, without formatting, so that %-style arguments and exceptions are formatted
+    on the listener thread.
+
+    Records are only suitable for a queue within the process and arguments should not be changed after logging.
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.task = _task_id.get()
+        return record
+
+
+# _____________________________________________________________________________
+class TaskBufferHandler(logging.Handler):
+    """Keeps the most recent records below the buffer level for each task, or thread if not in a task, and writes
+    them to the target handler only when the task logs a record at or above the flush level.  Records at or above
+    the buffer level are written as logged.  The least recently used tasks are discarded when too many are kept.
+    """
+    def __init__(self, target: logging.Handler, capacity: int, flush_level: int = logging.WARNING,
+                 buffer_level: int = logging.INFO):
+        super().__init__(target.level)
+        self._target = target
+        self._capacity = capacity
+        self._flush_level = flush_level
+        self._buffer_level = buffer_level
+        self._buffers: Dict[Any, Deque[logging.LogRecord]] = OrderedDict()
+
+    def emit(self, record: logging.LogRecord):
+        if record.levelno >= self._buffer_level and record.levelno < self._flush_level and not record.exc_info:
+            self._target.handle(record)
+            return
+        key = task if (task := getattr(record, 'task', None)) is not None else record.threadName
+        if (buffer := self._buffers.get(key, None)) is None:
+            buffer = self._buffers[key] = deque(maxlen=self._capacity)
+            if len(self._buffers) > _DEBUG_TASKS:
+                self._buffers.popitem(last=False)
+        else:
+            self._buffers.move_to_end(key)
+        buffer.append(record)
+        if record.levelno >= self._flush_level or record.exc_info:
+            self.__write(buffer)
+
+    def __write(self, buffer: Deque[logging.LogRecord]):
+        while buffer:
+            self._target.handle(buffer.popleft())
+        self._target.flush()
+
+    def close(self):
+        self._buffers.clear()
+        self._target.close()
+        super().close()
+
+
+# _____________________________________________________________________________
+class JsonLinesFormatter(logging.Formatter):
+    """Formats a log record as a single line JSON object for log processing tools
+    """
+    def format(self, record: logging.LogRecord):
+        entry = {
+            'time': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'msecs': int(record.msecs),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'task': getattr(record, 'task', None),
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exception'] = record.exc_text or self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
 
 
 # _____________________________________________________________________________
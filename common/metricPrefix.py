@@ -10,6 +10,8 @@ Notes:
     https://docs.python.org/3/tutorial/floatingpoint.html#tut-fp-issues
 """
 
+import re
+
 _dec_prefix = ['k', 'M', 'G', 'T', 'P', 'E', 'Z', 'Y']
 _dec_divider = [10**3, 10**6, 10**9, 10**12, 10**15, 10**18, 10**21, 10**24]
 _dec_threshold = [10**7, 10**10, 10**13, 10**16, 10**19, 10**22, 10**25, 10**28]
@@ -20,6 +22,8 @@ _bin_divider = [2**10, 2**20, 2**30, 2**40, 2**50, 2**60, 2**70, 2**80]
 _bin_threshold = [2**20*10, 2**30*10, 2**40*10, 2**50*10, 2**60*10, 2**70*10, 2**80*10, 2**90*10]
 _bin_max_idx = len(_bin_prefix) - 1
 
+_re_file_size = re.compile(r'(\d+(?:\.\d*)?)\s*([kmgtpezy]?)i?b(?:ytes?)?', re.IGNORECASE)
+
 
 # _____________________________________________________________________________
 def to_binary_units(number) -> str:
@@ -43,4 +47,13 @@ def to_decimal_units(number) -> str:
     return f'{value} {_dec_prefix[i]}' if value != 10**4 or i == _dec_max_idx else f'10 {_dec_prefix[i + 1]}'
 
 
-
+# _____________________________________________________________________________
+def from_file_size(text: str) -> int:
+    """Returns the number of bytes for a file size such as "345.6KB" or "1.2 MB", or None if not a file size.
+
+    Prefixes are taken as binary, as is the convention for file sizes, whether or not written with "i".
+    """
+    if not text or not (match := _re_file_size.fullmatch(text.strip())):
+        return None
+    prefix = match.group(2).upper()
+    return round(float(match.group(1)) * (_bin_divider[_bin_prefix.index(prefix + 'i')] if prefix else 1))
@@ -1,12 +1,23 @@
+from collections import OrderedDict
+import concurrent.futures
+import contextlib
+from dataclasses import dataclass
 from datetime import timedelta, date, datetime, time
+import gzip
 import io
+import itertools
+import mmap
 import os
 from pathlib import Path
 import string
-from typing import List, Tuple
+import tarfile
+import threading
+import time as _time
+from typing import Any, Callable, Dict, IO, Iterable, Iterator, List, Optional, Set, Tuple
 import unicodedata
 from urllib import parse
 import zipfile
+import zlib
 
 # https://docs.microsoft.com/en-us/windows/win32/fileio/naming-a-file
 _FOLDER_SEPARATOR_CHARS = ['\\', '/']
@@ -18,6 +29,226 @@ _PATHNAME_REPLACE_CHARS = _WINDOWS_INVALID_CHARS + _DASH_CHARS
 _URL_STRIP_CHARS = string.whitespace + '/'
 _SPACE_CHARS = ['\u00A0', '\u2002', '\u2003']  # Does not include HTML specialized spaces
 
+_ZIP_SUFFIXES = ('.zip',)
+_TAR_SUFFIXES = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+_GZIP_SUFFIXES = ('.gz', '.gzip')
+
+_LOCK_TIMEOUT_SEC = 120.0
+_ZIPS_OPEN_PER_THREAD = 2
+_LOCK_POLL_SEC = 0.05
+
+_archive_locks: Dict[str, threading.Lock] = dict()
+_archive_locks_lock = threading.Lock()
+
+
+# _____________________________________________________________________________
+@dataclass
+class FileEntry:
+    __slots__ = ['path', 'name', 'size', 'mtime']
+
+    path: str
+    name: str
+    size: int
+    mtime: float
+
+
+# _____________________________________________________________________________
+@dataclass
+class SweepRecord:
+    __slots__ = ['path', 'is_dir', 'size', 'mtime', 'is_deleted', 'error', 'archive']
+
+    path: str
+    is_dir: bool
+    size: int
+    mtime: float
+    is_deleted: bool
+    error: str
+    archive: str
+
+
+# _____________________________________________________________________________
+def _scan_tree(root: str, files: Dict[str, FileEntry], dirs: Set[str]):
+    """Walks a directory tree with scandir adding files, with their cached stat, and directories"""
+    stack = [root]
+    while stack:
+        dp = stack.pop()
+        try:
+            it = os.scandir(dp)
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+        dirs.add(dp)
+        with it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file():
+                    st = entry.stat()
+                    files[entry.path] = FileEntry(entry.path, entry.name, st.st_size, st.st_mtime)
+
+
+# _____________________________________________________________________________
+class DirectoryIndex:
+    """Index of the files and directories under a root directory built by a single scandir walk.
+
+    File size and modified time are taken from the cached DirEntry stat so the index can answer existence, size
+    and age queries without further system calls.  Paths are keyed by their string form under the resolved root.
+    The index is only as current as the changes recorded through add, add_dir and remove.
+    """
+
+    # _____________________________________________________________________________
+    def __init__(self, path: os.PathLike):
+        self._root = Path(path).resolve()
+        self._files: Dict[str, FileEntry] = dict()
+        self._dirs: Set[str] = set()
+        self._lock = threading.Lock()
+        _scan_tree(str(self._root), self._files, self._dirs)
+
+    # _____________________________________________________________________________
+    @property
+    def root(self) -> Path:
+        return self._root
+
+    # _____________________________________________________________________________
+    def __contains__(self, path: os.PathLike) -> bool:
+        return str(path) in self._files
+
+    # _____________________________________________________________________________
+    def __len__(self) -> int:
+        return len(self._files)
+
+    # _____________________________________________________________________________
+    def get(self, path: os.PathLike) -> FileEntry:
+        return self._files.get(str(path), None)
+
+    # _____________________________________________________________________________
+    def files(self) -> List[FileEntry]:
+        with self._lock:
+            return list(self._files.values())
+
+    # _____________________________________________________________________________
+    def dirs(self) -> List[str]:
+        with self._lock:
+            return list(self._dirs)
+
+    # _____________________________________________________________________________
+    def has_dir(self, path: os.PathLike) -> bool:
+        return str(path) in self._dirs
+
+    # _____________________________________________________________________________
+    def make_dirs(self, paths: Iterable[os.PathLike]):
+        """Creates directories not already in the index"""
+        for path in paths:
+            if str(path) not in self._dirs:
+                Path(path).mkdir(parents=True, exist_ok=True)
+                self.add_dir(path)
+
+    # _____________________________________________________________________________
+    def add_dir(self, path: os.PathLike):
+        with self._lock:
+            root, p = str(self._root), Path(path)
+            while str(p).startswith(root) and str(p) not in self._dirs:
+                self._dirs.add(str(p))
+                p = p.parent
+
+    # _____________________________________________________________________________
+    def add(self, path: os.PathLike) -> FileEntry:
+        """Adds or refreshes an index entry from the file system"""
+        st = os.stat(path)
+        entry = FileEntry(str(path), os.path.basename(path), st.st_size, st.st_mtime)
+        with self._lock:
+            self._files[entry.path] = entry
+        return entry
+
+    # _____________________________________________________________________________
+    def remove(self, path: os.PathLike):
+        with self._lock:
+            key = str(path)
+            self._files.pop(key, None)
+            self._dirs.discard(key)
+
+
+# _____________________________________________________________________________
+class FileLock:
+    """Advisory lock between processes on a lock file, exclusive for a writer or shared for readers.
+
+    Locks use flock on POSIX and msvcrt on Windows.  Windows has no shared lock, so a shared lock there is not
+    taken and readers rely on writers replacing files atomically.  Lock files are left in place, as deleting them
+    would let two processes lock different files of the same name.
+
+    :param path: lock file, created if it does not exist
+    :param is_shared: if True, a shared lock allowing other shared locks
+    :param timeout: seconds to wait for the lock before raising TimeoutError
+    """
+
+    # _____________________________________________________________________________
+    def __init__(self, path: os.PathLike, is_shared: bool = False, timeout: float = _LOCK_TIMEOUT_SEC):
+        self._path = Path(path)
+        self._is_shared = is_shared
+        self._timeout = timeout
+        self._fp = None
+
+    # _____________________________________________________________________________
+    def __try_lock(self) -> bool:
+        try:
+            if os.name == 'nt':
+                import msvcrt
+                self._fp.seek(0)
+                msvcrt.locking(self._fp.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self._fp.fileno(), (fcntl.LOCK_SH if self._is_shared else fcntl.LOCK_EX) | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            return False
+
+    # _____________________________________________________________________________
+    def __enter__(self):
+        if self._is_shared and os.name == 'nt':
+            return self
+        self._fp = self._path.open('a+b')
+        end = _time.monotonic() + self._timeout
+        while not self.__try_lock():
+            if _time.monotonic() >= end:
+                self._fp.close()
+                self._fp = None
+                raise TimeoutError(f'Timed out waiting for lock "{self._path.name}"')
+            _time.sleep(_LOCK_POLL_SEC)
+        return self
+
+    # _____________________________________________________________________________
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._fp is None:
+            return
+        try:
+            if os.name == 'nt':
+                import msvcrt
+                self._fp.seek(0)
+                msvcrt.locking(self._fp.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self._fp.fileno(), fcntl.LOCK_UN)
+        finally:
+            self._fp.close()
+            self._fp = None
+
+
+# _____________________________________________________________________________
+def write_atomic(path: os.PathLike, data: str or bytes, encoding: str = None):
+    """Writes data to a temporary file in the same directory then renames it over path, so readers see either the
+    old or new file complete.  Text is encoded as for Path.write_text.
+    """
+    path = Path(path)
+    tmp_path = path.with_name(f'.{path.name}.{os.getpid()}-{threading.get_ident()}.tmp')
+    try:
+        if isinstance(data, str):
+            tmp_path.write_text(data, encoding=encoding)
+        else:
+            tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
 
 # _____________________________________________________________________________
 def file_suffix(fp: str) -> str:
@@ -63,35 +294,198 @@ def delete_empty_directories(path: os.PathLike) -> List[str]:
 
 
 # _____________________________________________________________________________
-def delete_empty_old_files(path: os.PathLike, age: timedelta = None) -> (List[str], List[str]):
-    """Deletes all empty child folders under a parent folder
+def _file_crc(path: str) -> int:
+    crc = 0
+    with open(path, 'rb') as f:
+        while chunk := f.read(1 << 20):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+# _____________________________________________________________________________
+def _archive_name(zp: zipfile.ZipFile, names: Set[str], entry: FileEntry) -> Optional[str]:
+    """Returns the name to archive a file under, or None if the same content is already archived under its name.
+    A different file archived under the name is kept, and the file archived under a numbered name.
+    """
+    if entry.name not in names:
+        return entry.name
+    info = zp.getinfo(entry.name)
+    if info.file_size == entry.size and info.CRC == _file_crc(entry.path):
+        return None
+    stem, suffix = os.path.splitext(entry.name)
+    for n in itertools.count(1):
+        if (name := f'{stem}.{n}{suffix}') not in names:
+            return name
+
+
+# _____________________________________________________________________________
+def _archive_files(archive_fp: str, entries: List[FileEntry]) -> Dict[str, str]:
+    """Appends files to a zip archive, skipping files already archived with the same content
+    :return: Dictionary of file path to error for files not archived
+    """
+    errors = dict()
+    with _archive_locks_lock:
+        lock = _archive_locks.setdefault(archive_fp, threading.Lock())
+    with lock:
+        try:
+            Path(archive_fp).parent.mkdir(parents=True, exist_ok=True)
+            with zipfile.ZipFile(archive_fp, mode='a', compression=zipfile.ZIP_DEFLATED) as zp:
+                names = set(zp.namelist())
+                for entry in entries:
+                    try:
+                        if name := _archive_name(zp, names, entry):
+                            zp.write(entry.path, arcname=name)
+                            names.add(name)
+                    except OSError as ex:
+                        errors[entry.path] = str(ex)
+        except (OSError, zipfile.BadZipFile) as ex:
+            errors.update({entry.path: str(ex) for entry in entries})
+    return errors
+
+
+# _____________________________________________________________________________
+def _sweep_subtree(root: str, files: List[FileEntry], dirs: List[str], cutoff: float, dry_run: bool,
+            index: DirectoryIndex, archive_for: Callable[[FileEntry], str]) -> List[SweepRecord]:
+    """Deletes, or archives then deletes, old and empty files, then directories left empty, in a subtree.  Without
+    files and dirs the subtree is scanned first.
+    """
+    if files is None:
+        found_files, found_dirs = dict(), set()
+        _scan_tree(root, found_files, found_dirs)
+        files, dirs = list(found_files.values()), list(found_dirs)
+
+    # Select empty and old files, grouping old files by archive
+    records, kept, archives = [], [], dict()
+    for entry in files:
+        if entry.size == 0 or (cutoff is not None and entry.mtime < cutoff):
+            archive_fp = archive_for(entry) if archive_for and entry.size else None
+            records.append(SweepRecord(entry.path, False, entry.size, entry.mtime, False, None, archive_fp))
+            if archive_fp:
+                archives.setdefault(archive_fp, []).append(entry)
+        else:
+            kept.append(entry)
+
+    # Archive old files, then delete selected files
+    errors = dict()
+    if not dry_run:
+        for archive_fp, entries in archives.items():
+            errors.update(_archive_files(archive_fp, entries))
+    for record in records:
+        if dry_run:
+            continue
+        if error := errors.get(record.path, None):
+            record.error = error
+        else:
+            try:
+                os.remove(record.path)
+                record.is_deleted = True
+                if index is not None:
+                    index.remove(record.path)
+            except OSError as ex:
+                record.error = str(ex)
+        if record.error:
+            kept.append(FileEntry(record.path, os.path.basename(record.path), record.size, record.mtime))
+
+    # Delete directories holding no kept files, deepest first
+    occupied = set()
+    parent = os.path.dirname(root)
+    for entry in kept:
+        dp = os.path.dirname(entry.path)
+        while dp not in occupied and dp != parent:
+            occupied.add(dp)
+            dp = os.path.dirname(dp)
+    for dp in sorted(set(dirs) - occupied, key=len, reverse=True):
+        if dp in occupied:
+            continue
+        record = SweepRecord(dp, True, 0, 0.0, False, None, None)
+        if not dry_run:
+            try:
+                os.rmdir(dp)
+                record.is_deleted = True
+                if index is not None:
+                    index.remove(dp)
+            except OSError as ex:
+                # Keep parent directories as they are not empty
+                record.error = str(ex)
+                while (dp := os.path.dirname(dp)) != parent:
+                    occupied.add(dp)
+        records.append(record)
+
+    return records
+
+
+# _____________________________________________________________________________
+def sweep_tree(path: os.PathLike, cutoff: float = None, dry_run: bool = False, max_workers: int = None,
+            index: DirectoryIndex = None, archive_for: Callable[[FileEntry], str] = None) -> List[SweepRecord]:
+    """Deletes files older than cutoff or empty, then empty directories, under a parent folder
+    :param path: parent folder, which is not deleted
+    :param cutoff: timestamp before which files are deleted, or None to only delete empty files
+    :param dry_run: if True, records what would be deleted without deleting
+    :param max_workers: number of threads processing child subtrees in parallel
+    :param index: index of path used instead of scanning, and updated with deletions
+    :param archive_for: returns the zip archive path for an old file, or None, to archive the file before deleting
+    :return: List of files and directories deleted, or to be deleted if a dry run, with any error
+
+    Each child directory of path is swept as a separate task.  File stats come from the scandir entries, or the
+    index, so each file costs no more than one stat.
+    """
+    root = str(Path(path).resolve()) if index is None else str(index.root)
+
+    # Partition work by child of root, with files directly under root kept as one task
+    subtrees = dict()
+    if index is None:
+        try:
+            with os.scandir(root) as it:
+                top_files = []
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        subtrees[entry.path] = (None, None)
+                    elif entry.is_file():
+                        st = entry.stat()
+                        top_files.append(FileEntry(entry.path, entry.name, st.st_size, st.st_mtime))
+        except FileNotFoundError:
+            return []
+    else:
+        top_files, tree_files, tree_dirs = [], dict(), dict()
+        for entry in index.files():
+            top, sep, _ = entry.path[len(root) + 1:].partition(os.sep)
+            if sep:
+                tree_files.setdefault(os.path.join(root, top), []).append(entry)
+            else:
+                top_files.append(entry)
+        for dp in index.dirs():
+            if dp != root:
+                top = dp[len(root) + 1:].partition(os.sep)[0]
+                tree_dirs.setdefault(os.path.join(root, top), []).append(dp)
+        subtrees = {dp: (tree_files.get(dp, []), dirs) for dp, dirs in tree_dirs.items()}
+
+    records = _sweep_subtree(root, top_files, [], cutoff, dry_run, index, archive_for)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_sweep_subtree, dp, files, dirs, cutoff, dry_run, index, archive_for)
+                   for dp, (files, dirs) in subtrees.items()]
+        for future in concurrent.futures.as_completed(futures):
+            records.extend(future.result())
+
+    return records
+
+
+# _____________________________________________________________________________
+def delete_empty_old_files(path: os.PathLike, age: timedelta = None) -> (List[str], List[str], List[str]):
+    """Deletes old and empty files, and then empty child folders, under a parent folder
     :param path: parent folder
-    :param age:
-    :param include_empty:
+    :param age: age of files to delete, from midnight, or None to only delete empty files
     :return: Tuple of deleted files, deleted folders and errors
     """
     cutoff = (datetime.now() - age).replace(hour=0, minute=0, second=0).timestamp() if age else None
 
-    deleted_folders, deleted_files, errors = [], [], []
-    for parent, dirs, files in os.walk(str(path), topdown=False):
-        # Delete empty and old files
-        for file in [os.path.join(parent, f) for f in files]:
-            if (cutoff and os.path.getmtime(file) < cutoff) or os.path.getsize(file) == 0:
-                try:
-                    os.remove(file)
-                    deleted_files.append(file)
-                except PermissionError:
-                    errors.append(file)
-
-        # Delete empty directories
-        for dir in [os.path.join(parent, d) for d in dirs]:
-            with os.scandir(dir) as it:
-                if next(it, None) is None:
-                    try:
-                        os.rmdir(dir)
-                        deleted_folders.append(dir)
-                    except PermissionError:
-                        errors.append(dir)
+    deleted_files, deleted_folders, errors = [], [], []
+    for record in sweep_tree(path, cutoff):
+        if record.error:
+            errors.append(record.path)
+        elif record.is_dir:
+            deleted_folders.append(record.path)
+        else:
+            deleted_files.append(record.path)
 
     return deleted_files, deleted_folders, errors
 
@@ -178,24 +572,198 @@ def url_suffix(url: str) -> str:
 
 
 # _____________________________________________________________________________
-def open_files(path: str or os.PathLike) -> Tuple[str, int]:
+def archive_type(filename: str) -> str:
+    """Returns the archive type of a file from its suffix
+    :return: 'zip', 'tar', 'gzip' or None if not an archive
+    """
+    name = filename.lower()
+    if name.endswith(_ZIP_SUFFIXES):
+        return 'zip'
+    if name.endswith(_TAR_SUFFIXES):
+        return 'tar'
+    if name.endswith(_GZIP_SUFFIXES):
+        return 'gzip'
+    return None
+
+
+# _____________________________________________________________________________
+class _MmapReader(io.RawIOBase):
+    """Read-only seekable file over a memory map, as mmap objects are not file objects before Python 3.13"""
+
+    # _____________________________________________________________________________
+    def __init__(self, mm: mmap.mmap):
+        super().__init__()
+        self._mm = mm
+
+    # _____________________________________________________________________________
+    def readable(self) -> bool:
+        return True
+
+    # _____________________________________________________________________________
+    def seekable(self) -> bool:
+        return True
+
+    # _____________________________________________________________________________
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        self._mm.seek(offset, whence)
+        return self._mm.tell()
+
+    # _____________________________________________________________________________
+    def tell(self) -> int:
+        return self._mm.tell()
+
+    # _____________________________________________________________________________
+    def read(self, size: int = -1) -> bytes:
+        return self._mm.read(size if size is not None and size >= 0 else None)
+
+    # _____________________________________________________________________________
+    def readinto(self, buffer) -> int:
+        data = self._mm.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+# _____________________________________________________________________________
+def _open_zip(path: os.PathLike, use_mmap: bool, stack: contextlib.ExitStack) -> zipfile.ZipFile:
+    """Opens a zip archive directly from file, or a read-only memory map of the file, closing it with stack"""
+    fp = stack.enter_context(open(path, 'rb'))
+    if use_mmap and os.fstat(fp.fileno()).st_size:
+        fp = _MmapReader(stack.enter_context(mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)))
+    return stack.enter_context(zipfile.ZipFile(fp))
+
+
+# _____________________________________________________________________________
+def iter_archive(path: os.PathLike, rel_path_str: str = None, use_mmap: bool = False) -> Iterator[Tuple[str, IO]]:
+    """Iterates over the files in an archive returning an open binary file handle for each file
+    :param path: zip, tar or gzip archive
+    :param rel_path_str: name of archive used in returned names, defaults to archive filename
+    :param use_mmap: if True, read zip archives through a memory map
+    :return: Tuple[name:str,file handle:IO] where name is "archive|member"
+
+    Members are opened lazily, one at a time, and each handle is only valid until the next is returned.  Tar
+    archives are read as a stream, so compressed tar archives are never decompressed to memory or disk.
+    """
+    rel_path_str = rel_path_str or os.path.basename(path)
+    kind = archive_type(os.path.basename(path))
+    if kind == 'zip':
+        with contextlib.ExitStack() as stack:
+            zp = _open_zip(path, use_mmap, stack)
+            for zipinfo in filter(lambda z: not z.is_dir(), zp.infolist()):
+                with zp.open(zipinfo) as file_handle:
+                    yield f'{rel_path_str}|{zipinfo.filename}', file_handle
+    elif kind == 'tar':
+        with tarfile.open(path, mode='r|*') as tp:
+            for tarinfo in tp:
+                if tarinfo.isfile():
+                    with tp.extractfile(tarinfo) as file_handle:
+                        yield f'{rel_path_str}|{tarinfo.name}', file_handle
+    elif kind == 'gzip':
+        name = os.path.basename(path)
+        with gzip.open(path, 'rb') as file_handle:
+            yield f'{rel_path_str}|{name[:name.rfind(".")]}', file_handle
+    else:
+        raise ValueError(f'Not an archive: {path}')
+
+
+# _____________________________________________________________________________
+def open_files(path: str or os.PathLike, use_mmap: bool = False) -> Iterator[Tuple[str, IO]]:
     """Iterate over a root path returning an open file handle for each file found - including file in archives
-    :return: Tuple[filename:str,file handle:int]
+    :return: Tuple[filename:str,file handle:IO] where filename is relative to path
+
+    Files are opened in text mode and archive members in binary mode.
     """
-    for root, _, filenames in os.walk(str(path)):
+    root = Path(path).resolve()
+    for parent, _, filenames in os.walk(str(root)):
         # Iterate over files found in directory
         for filename in filenames:
-            path = Path(root, filename).resolve()
-            rel_path_str = str(Path(path.relative_to(path), path.name))
+            file_path = Path(parent, filename)
+            rel_path_str = str(file_path.relative_to(root))
 
             # Test if file is an archive
-            if file_suffix(filename) in ['.zip', '.gzip', '.gz']:
-                with zipfile.ZipFile(io.BytesIO(path.read_bytes())) as zp:
-                    # Iterate over files inside archive
-                    for zipinfo in filter(lambda z: not z.is_dir(), zp.infolist()):
-                        with zp.open(zipinfo) as file_handle:
-                            yield f'{rel_path_str}|{zipinfo.filename}', file_handle
+            if archive_type(filename):
+                yield from iter_archive(file_path, rel_path_str, use_mmap)
             else:
                 # Yield non-archive file
-                with open(path) as file_handle:
+                with open(file_path) as file_handle:
                     yield rel_path_str, file_handle
+
+
+# _____________________________________________________________________________
+def process_files(path: str or os.PathLike, func: Callable[[str, IO], Any], max_workers: int = None,
+            use_mmap: bool = False) -> Iterator[Tuple[str, Any]]:
+    """Applies a function to an open file handle for each file found, including files in archives, using a thread
+    pool
+    :param path: root path
+    :param func: called with the relative name and file handle, as for open_files
+    :param max_workers: number of threads, defaulting as for ThreadPoolExecutor
+    :param use_mmap: if True, read zip archives through a memory map
+    :return: Tuple[filename:str,result] in completion order
+
+    Plain files and zip members are spread across the pool with each thread keeping its own handles for the zip
+    archives it most recently read, closing the least recently used, so open files and memory maps are bounded by
+    the number of threads.  Tar and gzip archives can only be read sequentially so are processed on the calling
+    thread.  Work is submitted no faster than it completes so memory use does not grow with the number of files.
+    """
+    max_workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+    root = Path(path).resolve()
+    local, lock = threading.local(), threading.Lock()
+    thread_zips: List[OrderedDict] = []
+
+    # _____________________________________________________________________________
+    def close_zips():
+        for zips in thread_zips:
+            for _, zip_stack in zips.values():
+                zip_stack.close()
+            zips.clear()
+
+    with contextlib.ExitStack() as stack, concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        stack.callback(close_zips)
+
+        # _____________________________________________________________________________
+        def run(file_path: Path, member: str, rel_path_str: str):
+            if member is None:
+                with open(file_path) as file_handle:
+                    return rel_path_str, func(rel_path_str, file_handle)
+            if not hasattr(local, 'zips'):
+                local.zips = OrderedDict()  # Archive path: (zip, stack closing it), least recently used first
+                with lock:
+                    thread_zips.append(local.zips)
+            if (entry := local.zips.get(file_path, None)) is None:
+                with contextlib.ExitStack() as zip_stack:
+                    entry = _open_zip(file_path, use_mmap, zip_stack), zip_stack.pop_all()
+                local.zips[file_path] = entry
+                while len(local.zips) > _ZIPS_OPEN_PER_THREAD:
+                    local.zips.popitem(last=False)[1][1].close()
+            else:
+                local.zips.move_to_end(file_path)
+            with entry[0].open(member) as file_handle:
+                return rel_path_str, func(rel_path_str, file_handle)
+
+        pending = set()
+        for parent, _, filenames in os.walk(str(root)):
+            for filename in filenames:
+                file_path = Path(parent, filename)
+                rel_path_str = str(file_path.relative_to(root))
+                kind = archive_type(filename)
+                if kind in ('tar', 'gzip'):
+                    for name, file_handle in iter_archive(file_path, rel_path_str):
+                        yield name, func(name, file_handle)
+                    continue
+
+                if kind == 'zip':
+                    with zipfile.ZipFile(file_path) as zp:
+                        members = [z.filename for z in zp.infolist() if not z.is_dir()]
+                    tasks = [(file_path, m, f'{rel_path_str}|{m}') for m in members]
+                else:
+                    tasks = [(file_path, None, rel_path_str)]
+
+                for task in tasks:
+                    pending.add(executor.submit(run, *task))
+                    if len(pending) >= 2 * max_workers:
+                        done, pending = concurrent.futures.wait(pending,
+                                    return_when=concurrent.futures.FIRST_COMPLETED)
+                        for future in done:
+                            yield future.result()
+
+        for future in concurrent.futures.as_completed(pending):
+            yield future.result()
@@ -3,8 +3,13 @@
 Notes:
      1. Key to data is by managled url path and used for local cache parh and filename.
      2. Caching usage is time-based and set on cache instance.
-     3. Data is formated, by default, before being written to cache and returned.
+     3. Data is formated, by default, before being written to cache and returned.  In raw mode bytes are cached
+     and returned unparsed.
      4. Data encoding for xml/html files are not inspected or changed (caches should not transform).
+     5. Several processes, or hosts sharing a volume, can use one cache directory.  Entries are written to a
+     temporary file and renamed into place, so are never read part written.  Each entry has an advisory lock file,
+     held exclusively while fetching and writing the entry, and shared while reading it.  A process that waited
+     for the lock checks the cache again, so uses an entry another process has just fetched.
 """
 from abc import ABC, abstractmethod
 from bs4 import BeautifulSoup
@@ -18,11 +23,13 @@ from typing import Union, Dict
 from urllib import parse
 from urllib3 import exceptions
 
-from common.common import url_client
+import common.httpClient as httpClient
 import common.pathTools as pathTools
 
 _logger = logging.getLogger(__name__)
 
+_LOCK_SUFFIX = '.lock'
+
 
 # _____________________________________________________________________________
 class UrlCache(ABC):
@@ -46,70 +53,70 @@ class UrlCache(ABC):
 
     # _____________________________________________________________________________
     def __write_cached_text(self, data: Union[str, bytes], local_path: Path) -> str:
-        _logger.debug(f'cache write text "{local_path.name}"')
+        _logger.debug('cache write text "%s"', local_path.name)
         data_text = None
         try:
             data_text = data.decode('utf-8') if isinstance(data, bytes) else data
-            local_path.write_text(data_text)
+            pathTools.write_atomic(local_path, data_text)
         except (UnicodeError, OSError):
             path = local_path.with_suffix('.raw.txt')
             _logger.exception(f'Decode error: {path.name}')
-            path.write_bytes(data)
+            pathTools.write_atomic(path, data)
 
         return data_text
 
     # _____________________________________________________________________________
     def __write_cached_json(self, data: Union[str, bytes], local_path: Path):
-        _logger.debug(f'cache write json "{local_path.name}"')
+        _logger.debug('cache write json "%s"', local_path.name)
         data_json = None
         try:
             data_decoded = data.decode('utf-8') if isinstance(data, bytes) else data
             data_json = json.loads(data_decoded)
             if self._format_on_write:
-                local_path.write_text(json.dumps(data_json, sort_keys=True, indent=2))
+                pathTools.write_atomic(local_path, json.dumps(data_json, sort_keys=True, indent=2))
             else:
-                local_path.write_text(data_decoded)
+                pathTools.write_atomic(local_path, data_decoded)
         except (UnicodeError, OSError, json.JSONDecodeError):
             path = local_path.with_suffix('.raw.json')
             _logger.exception(f'JSON parse error: {path.name}')
-            path.write_bytes(data)
+            pathTools.write_atomic(path, data)
 
         return data_json
 
     # _____________________________________________________________________________
     def __write_cached_xml(self, data: bytes, local_path: Path):
-        _logger.debug(f'cache write xml "{local_path.name}"')
+        _logger.debug('cache write xml "%s"', local_path.name)
         data_xml = None
         try:
             parser = etree.XMLParser(no_network=True, ns_clean=True, recover=True, remove_blank_text=True)
             data_xml = etree.parse(BytesIO(data), parser)
             if self._format_on_write:
                 tos = etree.tostring(data_xml, pretty_print=True, method='xml', xml_declaration=True).decode()
-                local_path.write_text(tos)
+                pathTools.write_atomic(local_path, tos)
             else:
-                local_path.write_bytes(data)
+                pathTools.write_atomic(local_path, data)
         except (UnicodeError, etree.SerialisationError, etree.ParseError) as ex:
             path = local_path.with_suffix('.raw.xml')
             _logger.exception(f'XML parse error: {path.name}')
-            path.write_bytes(data)
+            pathTools.write_atomic(path, data)
 
         return data_xml
 
     # _____________________________________________________________________________
     def __write_cached_html(self, data: bytes, local_path: Path):
-        _logger.debug(f'cache write html "{local_path.name}"')
+        _logger.debug('cache write html "%s"', local_path.name)
         soup = None
         try:
             soup = BeautifulSoup(data, 'lxml')
             if self._format_on_write:
                 tos = soup.prettify(formatter='html')
-                local_path.write_text(tos)
+                pathTools.write_atomic(local_path, tos)
             else:
-                local_path.write_bytes(data)
+                pathTools.write_atomic(local_path, data)
         except (UnicodeError, Exception) as ex:
             path = local_path.with_suffix('.raw.html')
             _logger.exception(f'HTML parse error: {path.name}')
-            path.write_bytes(data)
+            pathTools.write_atomic(path, data)
 
         return soup
 
@@ -123,7 +130,7 @@ class UrlCache(ABC):
         if self._max_age_sec > 0 and local_path.exists():
             is_cached = local_path.stat().st_mtime > (time.time() - self._max_age_sec)
 
-        _logger.debug(f'Cache tag, is cached: "{local_path.name}", {str(is_cached)}')
+        _logger.debug('Cache tag, is cached: "%s", %s', local_path.name, is_cached)
         return is_cached
 
     # _____________________________________________________________________________
@@ -139,43 +146,90 @@ class UrlCache(ABC):
         return local_path, self.__is_cached(local_path)
 
     # _____________________________________________________________________________
-    def get(self, url: str, fields: Dict[str, str] = None, cache_tag: str = None) -> (str, str, bool):
+    @staticmethod
+    def __lock_path(filepath: Path) -> Path:
+        return filepath.with_name(filepath.name + _LOCK_SUFFIX)
+
+    # _____________________________________________________________________________
+    @staticmethod
+    def __read_cached(filepath: Path, suffix: str, is_raw: bool):
+        data = None
+        try:
+            if is_raw:
+                data = filepath.read_bytes()
+            elif suffix == '.xml':
+                data = etree.parse(str(filepath))
+            elif suffix in ('.html', '.xhtml'):
+                data = BeautifulSoup(filepath.read_bytes(), 'lxml')
+            elif suffix == '.json':
+                data = json.loads(filepath.read_bytes())
+            else:
+                data = filepath.read_text()
+        except (TypeError, OSError, json.JSONDecodeError, etree.ParseError) as ex:
+            _logger.exception(f'Error reading cache')
+        return data
+
+    # _____________________________________________________________________________
+    def __fetch(self, url: str, fields: Dict[str, str], filepath: Path, suffix: str, is_raw: bool):
+        """Fetches url and writes response to cache, returning the data"""
+        data = None
+        try:
+            rsp = httpClient.request('GET', url, fields=fields)
+            if rsp.status == 200:
+                if is_raw:
+                    _logger.debug('cache write raw "%s"', filepath.name)
+                    pathTools.write_atomic(filepath, rsp.data)
+                    data = rsp.data
+                elif suffix in ('.xml', '.xhtml'):
+                    data = self.__write_cached_xml(rsp.data, filepath)
+                elif suffix == '.html':
+                    data = self.__write_cached_html(rsp.data, filepath)
+                elif suffix == '.json':
+                    data = self.__write_cached_json(rsp.data, filepath)
+                else:
+                    data = self.__write_cached_text(rsp.data, filepath)
+            else:
+                _logger.debug('Bad response status %d for %s', rsp.status, url)
+        except (httpClient.CircuitOpenError, httpClient.DeadlineExceededError):
+            raise
+        except (exceptions.HTTPError, exceptions.SSLError):
+            _logger.exception(f'GET error: {url}')
+        return data
+
+    # _____________________________________________________________________________
+    def get(self, url: str, fields: Dict[str, str] = None, cache_tag: str = None,
+            is_raw: bool = False) -> (str, str, bool):
+        """Returns data for url, from cache if cached, otherwise fetched and cached, with the cache file suffix and
+        if cached
+
+        :param is_raw: if True, returns the bytes of the response or cache file, and caches responses unformatted,
+        so data can be parsed elsewhere
+        :raises CircuitOpenError, DeadlineExceededError: if not cached and the request was not made
+        """
         _logger.debug('get')
 
         filepath, is_cached = self.__make_path_from_subpath(cache_tag) if cache_tag else self.__make_path_from_url(url)
-        _logger.debug(f'get filepath {filepath.relative_to(UrlCache._base_path)}')
+        _logger.debug('get filepath %s', filepath)
         suffix = filepath.suffix.lower()
 
         data = None
         if is_cached:
             try:
-                if suffix == '.xml':
-                    data = etree.parse(str(filepath))
-                elif suffix in ('.html', '.xhtml'):
-                    data = BeautifulSoup(filepath.read_bytes(), 'lxml')
-                elif suffix == '.json':
-                    data = json.loads(filepath.read_bytes())
-                else:
-                    data = filepath.read_text()
-            except (TypeError, json.JSONDecodeError, etree.ParseError) as ex:
-                _logger.exception(f'Error reading cache')
+                with pathTools.FileLock(self.__lock_path(filepath), is_shared=True):
+                    data = self.__read_cached(filepath, suffix, is_raw)
+            except TimeoutError as ex:
+                _logger.warning(f'Cache read skipped: {ex}')
         else:
             if not filepath.parent.exists():
                 filepath.parent.mkdir(parents=True, exist_ok=True)
             try:
-                rsp = url_client.request('GET', url, fields=fields)
-                if rsp.status == 200:
-                    if suffix in ('.xml', '.xhtml'):
-                        data = self.__write_cached_xml(rsp.data, filepath)
-                    elif suffix == '.html':
-                        data = self.__write_cached_html(rsp.data, filepath)
-                    elif suffix == '.json':
-                        data = self.__write_cached_json(rsp.data, filepath)
+                with pathTools.FileLock(self.__lock_path(filepath)):
+                    # Another process may have written the entry while this one waited for the lock
+                    if is_cached := self.__is_cached(filepath):
+                        data = self.__read_cached(filepath, suffix, is_raw)
                     else:
-                        data = self.__write_cached_text(rsp.data, filepath)
-                else:
-                    _logger.debug(f'Bad response status {rsp.status} for {url}')
-            except (exceptions.HTTPError, exceptions.SSLError):
-                _logger.exception(f'GET error: {url}')
+                        data = self.__fetch(url, fields, filepath, suffix, is_raw)
+            except TimeoutError as ex:
+                _logger.warning(f'GET skipped: {ex}')
 
         return data, suffix, is_cached
@@ -0,0 +1,5 @@
+@echo off
+setlocal
+
+call .venv\scripts\activate
+python.exe unitprices %*
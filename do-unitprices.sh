@@ -0,0 +1,7 @@
+#!/bin/bash
+
+set -e
+PYTHON="python3.8"
+
+source venv/bin/activate
+$PYTHON unitprices "$@"
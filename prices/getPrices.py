@@ -1,18 +1,24 @@
 import argparse
 from datetime import datetime
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
 import logging
 from pathlib import Path
+import time
 from typing import Dict, Iterable, List
+from urllib import parse
 import urllib3
 
-from common.common import url_client, local_tz, re_yahoo_symbol
-from common.logTools import initialize_logger
+from common.common import local_tz, re_yahoo_symbol, today
+import common.httpClient as httpClient
+from common.logTools import flush_logger, initialize_logger
 
+import prices.pricesBars as bars
 import prices.pricesLoader as loader
 import prices.pricesConfig as config
+import prices.pricesDelta as delta
 import prices.pricesTypes as common
 import prices.pricesOutput as output
+import prices.pricesSnapshot as snapshot
 
 _logger = logging.getLogger(__name__)
 
@@ -24,11 +30,11 @@ def load_symbols(symbols_fp: Path) -> loader.ValuesLoader:
 
 
 # _____________________________________________________________________________
-def fetch_data(values: loader.ValuesLoader, basename: str) -> (Dict[str, common.Record]):
+def fetch_data(values: loader.ValuesLoader, basename: str, is_hedged: bool = False) -> (Dict[str, common.Record]):
     _logger.debug('fetch_data')
 
     # Fetch
-    data_json = fetch_remote_data(values.symbols, basename)
+    data_json = fetch_remote_data(values.symbols, basename, is_hedged)
     recs = transform_data(data_json, values)
 
     # Check for missing codes from retrieved data
@@ -39,7 +45,7 @@ def fetch_data(values: loader.ValuesLoader, basename: str) -> (Dict[str, common.
 
 
 # _____________________________________________________________________________
-def fetch_remote_data(symbols: Iterable[str], basename: str):
+def fetch_remote_data(symbols: Iterable[str], basename: str, is_hedged: bool = False):
     _logger.debug(f'fetch_remote_data')
 
     yahoo_symbols = set(map(lambda x: x + '.AX', symbols))  # Yahoo stock symbols have suffix '.AX'
@@ -48,7 +54,12 @@ def fetch_remote_data(symbols: Iterable[str], basename: str):
 
     data_json = None
     try:
-        rsp = url_client.request('GET', config.URL, fields=fields)
+        httpClient.configure_host(parse.urlsplit(config.URL).hostname, config.POOL_SIZE)
+        if is_hedged:
+            httpClient.configure_host(parse.urlsplit(config.HEDGE_URL).hostname, config.POOL_SIZE)
+            rsp = hedged_request(fields)
+        else:
+            rsp = httpClient.request('GET', config.URL, fields=fields)
         _logger.debug(f'response status  {rsp.status}')
         if rsp.status == 200:
             data_json = output.write_json(rsp.data, basename)
@@ -59,6 +70,17 @@ def fetch_remote_data(symbols: Iterable[str], basename: str):
     return data_json
 
 
+# _____________________________________________________________________________
+def hedged_request(fields: Dict[str, str]) -> urllib3.HTTPResponse:
+    """Requests quotes from the primary host, hedged with the alternate host, using primary latencies and the hedge
+    rate from previous runs for the hedge delay and cap"""
+    hedged = httpClient.HedgedRequest('quotes', *output.read_hedge_state(config.HEDGE_STATE_NAME))
+    try:
+        return hedged.request('GET', [config.URL, config.HEDGE_URL], fields=fields)
+    finally:
+        output.write_hedge_state(hedged.samples, *hedged.counts, config.HEDGE_STATE_NAME)
+
+
 # _____________________________________________________________________________
 def transform_data(data_json: Dict, values: loader.ValuesLoader) -> List[common.Record]:
     _logger.debug(f'transform_data')
@@ -72,7 +94,8 @@ def transform_data(data_json: Dict, values: loader.ValuesLoader) -> List[common.
         bid = Decimal(data["bid"]).quantize(config.quant)
         ask = Decimal(data["ask"]).quantize(config.quant)
         volume = int(data["regularMarketVolume"])
-        dt = datetime.fromtimestamp(data['regularMarketTime'], local_tz)
+        epoch = int(data['regularMarketTime'])
+        dt = datetime.fromtimestamp(epoch, local_tz)
         name = data['longName']
         if ref := values.price_ref(symbol):
             ref_to_price = (dec100 - price / ref * dec100).quantize(Decimal('0.0'))
@@ -81,7 +104,7 @@ def transform_data(data_json: Dict, values: loader.ValuesLoader) -> List[common.
         alert_low = values.alert_low(symbol)
         alert_high = values.alert_high(symbol)
         recs.append(common.Record(symbol, price, low, high, bid, ask, ref, ref_to_price, alert_low, alert_high,
-                    volume, dt.date(), dt.time(), name))
+                    volume, dt.date(), dt.time(), name, epoch))
     return recs
 
 
@@ -100,50 +123,146 @@ def process_data(recs: List[common.Record], values: loader.ValuesLoader) -> List
 
 
 # _____________________________________________________________________________
-def main():
-    start_datetime = datetime.now(tz=local_tz)
-    current_dp = Path(__file__).parent
-    base_dp = current_dp.parent
-    initialize_logger(Path(base_dp, 'logs'), current_dp.stem)
-    _logger.info(f'Now: {start_datetime.strftime("%a  %d-%b-%y  %I:%M:%S %p")}')
+def poll(args: argparse.Namespace, values: loader.ValuesLoader, basename: str, tracker: delta.DeltaTracker = None,
+         bar_store: bars.BarStore = None) -> (List[common.Record], List[common.Alert]):
+    """Fetches, records and outputs quotes once, only those changed since last poll if tracker, adding quotes to
+    bars if bar_store
 
-    # Configure commandline parser
+    :return: records and alerts output
+    """
+    _logger.debug('poll')
+
+    recs, alerts = [], []
+    try:
+        recs = fetch_data(values, basename, args.hedge)
+        if args.snapshot:
+            with snapshot.SnapshotWriter() as writer:
+                _logger.info(f'Published {writer.publish(recs)} quotes to snapshot')
+        if bar_store:
+            bar_store.update(recs)
+            bar_store.save()
+            if args.bars_csv:
+                bar_store.write_csv(Path(Path(__file__).parent, 'data',
+                                         f'{basename}.bars-{today.strftime("%Y-%m-%d")}.csv'))
+        alerts = process_data(recs, values)
+        if tracker:
+            recs, alerts = tracker.changes(recs, alerts)
+        output.write_report(recs, basename, is_append=bool(tracker))
+        output.write_alerts(alerts, basename, is_append=bool(tracker))
+        if tracker:
+            tracker.save()
+        flush_logger()
+
+        to_report_all = not(args.prices or args.brief)
+        if args.prices or to_report_all:
+            output.output_prices(recs, values.symbols)
+        if args.brief or to_report_all:
+            output.output_brief(recs, bar_store)
+    finally:
+        output.output_alerts(alerts)
+
+    return recs, alerts
+
+
+# _____________________________________________________________________________
+def _percent(text: str) -> Decimal:
+    try:
+        return Decimal(text)
+    except InvalidOperation:
+        raise argparse.ArgumentTypeError(f'invalid percent: {text}')
+
+
+# _____________________________________________________________________________
+def create_parser() -> argparse.ArgumentParser:
     argp = argparse.ArgumentParser(description='Retrieve stock prices from Yahoo Finance website')
     argp.add_argument('-s', '--symbols', action='store_true', help='Output symbols to be processed and exit')
     argp.add_argument('-b', '--brief', action='store_true', help='Run and output brief')
     argp.add_argument('-p', '--prices', action='store_true', help='Run and output prices')
     argp.add_argument('-f', '--file', action='store', nargs=1, default=['symbols.csv'],
                 help='Input file name for symbols')
+    argp.add_argument('--deadline', action='store', type=float, metavar='SECONDS',
+                help='Stop retrying and making requests after time limit for each poll')
+    argp.add_argument('--hedge', action='store_true',
+                help='Also request quotes from the alternate host if the primary host is slow')
+    argp.add_argument('--snapshot', action='store_true',
+                help=f'Publish quotes to shared memory snapshot file "{config.SNAPSHOT_NAME}" for other processes')
+    argp.add_argument('--delta', action='store_true',
+                help='Output, write and alert only quotes changed since last run')
+    argp.add_argument('--delta-price', action='store', type=_percent, default=Decimal(0), metavar='PERCENT',
+                help='With --delta, percent price move for a price to have changed, default any move')
+    argp.add_argument('--delta-volume', action='store', type=int, default=0, metavar='VOLUME',
+                help='With --delta, volume change for volume to have changed, default any change')
+    argp.add_argument('--bars', action='store_true',
+                help='Aggregate quotes into 1, 5 and 15 minute bars, kept between runs, and output bar changes in '
+                     'brief')
+    argp.add_argument('--bars-csv', action='store_true', help='With --bars, also write bars to CSV file')
+    argp.add_argument('-i', '--interval', action='store', type=float, metavar='SECONDS',
+                help='Poll repeatedly at interval until interrupted')
+    argp.add_argument('--debug-full', action='store_true',
+                help='Write all debug log records, not only those before warnings and errors')
 
-    try:
-        args = argp.parse_args()
-        symbols_basename = Path(args.file[0]).stem
-        values, recs = [], []
+    return argp
 
-        try:
-            values = load_symbols(Path(Path(__file__).parent, args.file[0]))  # Expecting exactly 1 filename in list
-        finally:
-            if args.symbols and values:
-                output.output_symbols(values)
-                return
 
-        alerts = []
+# _____________________________________________________________________________
+def run(args: argparse.Namespace, values: loader.ValuesLoader = None) -> (List[common.Record], List[common.Alert]):
+    """Fetches and outputs prices for the parsed arguments, polling until interrupted if an interval is set
+
+    :param values: symbols already loaded, otherwise loaded from the symbols file
+    :return: records and alerts of the last poll
+    """
+    _logger.debug('run')
+
+    symbols_basename = Path(args.file[0]).stem
+    if values is None:
+        values = load_symbols(Path(Path(__file__).parent, args.file[0]))  # Expecting exactly 1 filename in list
+    if args.symbols:
+        output.output_symbols(values)
+        return [], []
+
+    tracker = None
+    if args.delta:
+        tracker = delta.DeltaTracker(Path(Path(__file__).parent, 'data', f'{symbols_basename}.delta.json'),
+                                     args.delta_price, args.delta_volume)
+    bar_store = None
+    if args.bars:
+        bar_store = bars.BarStore(Path(Path(__file__).parent, 'data', f'{symbols_basename}.bars.npz'))
+    recs, alerts = [], []
+    while True:
+        httpClient.set_run_deadline(args.deadline)
+        try:
+            recs, alerts = poll(args, values, symbols_basename, tracker, bar_store)
+        except Exception as ex:
+            if not args.interval:
+                raise
+            _logger.exception('Poll failed')
+        if not args.interval:
+            break
         try:
-            recs = fetch_data(values, symbols_basename)
-            alerts = process_data(recs, values)
-            output.write_report(recs, symbols_basename)
-            output.write_alerts(alerts, symbols_basename)
-
-            to_report_all = not(args.prices or args.brief)
-            if args.prices or to_report_all:
-                output.output_prices(recs, values.symbols)
-            if args.brief or to_report_all:
-                output.output_brief(recs)
-        finally:
-            output.output_alerts(alerts)
+            time.sleep(args.interval)
+        except KeyboardInterrupt:
+            break
+
+    return recs, alerts
+
+
+# _____________________________________________________________________________
+def main():
+    start_datetime = datetime.now(tz=local_tz)
+    current_dp = Path(__file__).parent
+    base_dp = current_dp.parent
+    # Configure commandline parser
+    argp = create_parser()
+
+    try:
+        args = argp.parse_args()
+        initialize_logger(Path(base_dp, 'logs'), current_dp.stem, is_debug_full=args.debug_full)
+        _logger.info(f'Now: {start_datetime.strftime("%a  %d-%b-%y  %I:%M:%S %p")}')
+        run(args)
     except Exception as ex:
         _logger.exception('Catch all exception')
     finally:
+        httpClient.output_metrics()
         _logger.debug("done")
 
 
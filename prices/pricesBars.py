@@ -0,0 +1,206 @@
+"""Aggregates polled quotes into OHLCV bars of 1, 5 and 15 minutes for each symbol.
+
+Notes:
+    1. Bars for each time frame are held in a fixed capacity ring buffer per symbol, a row of a NumPy array, so
+    memory per symbol is constant and the oldest bars are overwritten.  Each poll's quotes are appended to all
+    symbols at once with array operations, without creating objects per quote.
+    2. A quote updates the latest bar if its market time falls in that bar, or starts a new bar if later.  Quotes
+    older than the latest bar are ignored.
+    3. Yahoo volumes are cumulative for the day, so bar volume is the increase in volume since the previous quote.
+    A decrease is taken as a new day's volume.  The first quote for a symbol adds no volume.
+    4. Bars are persisted to a NumPy .npz file, replaced atomically, and can be exported to CSV.
+"""
+import csv
+from datetime import datetime
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .pricesTypes import Record
+
+_logger = logging.getLogger(__name__)
+
+# Time frame: (seconds, bars kept), finest first
+time_frames = {'1m': (60, 480), '5m': (300, 288), '15m': (900, 192)}
+
+bar_dtype = np.dtype([('start', '<i8'), ('open', '<f8'), ('high', '<f8'), ('low', '<f8'), ('close', '<f8'),
+                      ('volume', '<i8')])
+
+
+# _____________________________________________________________________________
+class _Ring:
+    """Ring buffers of bars of one time frame, a row per symbol"""
+
+    # _____________________________________________________________________________
+    def __init__(self, period: int, capacity: int, rows: int = 0):
+        self.period = period
+        self.capacity = capacity
+        self.bars = np.zeros((rows, capacity), dtype=bar_dtype)
+        self.head = np.full(rows, -1, dtype=np.int64)   # Index of latest bar, -1 if none
+        self.count = np.zeros(rows, dtype=np.int64)
+
+    # _____________________________________________________________________________
+    def grow(self, rows: int):
+        added = rows - len(self.head)
+        self.bars = np.concatenate([self.bars, np.zeros((added, self.capacity), dtype=bar_dtype)])
+        self.head = np.concatenate([self.head, np.full(added, -1, dtype=np.int64)])
+        self.count = np.concatenate([self.count, np.zeros(added, dtype=np.int64)])
+
+    # _____________________________________________________________________________
+    def append(self, rows: np.ndarray, times: np.ndarray, prices: np.ndarray, volumes: np.ndarray) -> np.ndarray:
+        """Adds quotes to the bars of rows, each row once
+
+        :return: mask of quotes added, that is not older than the latest bar
+        """
+        starts = times - times % self.period
+        has_bar = self.head[rows] >= 0
+        head = np.maximum(self.head[rows], 0)
+        latest = self.bars['start'][rows, head]
+        is_same = has_bar & (starts == latest)
+        is_new = ~has_bar | (starts > latest)
+
+        r, h, p = rows[is_same], head[is_same], prices[is_same]
+        self.bars['high'][r, h] = np.maximum(self.bars['high'][r, h], p)
+        self.bars['low'][r, h] = np.minimum(self.bars['low'][r, h], p)
+        self.bars['close'][r, h] = p
+        self.bars['volume'][r, h] += volumes[is_same]
+
+        r, p = rows[is_new], prices[is_new]
+        h = np.where(has_bar[is_new], (head[is_new] + 1) % self.capacity, 0)
+        self.head[r] = h
+        self.count[r] = np.minimum(self.count[r] + 1, self.capacity)
+        self.bars['start'][r, h] = starts[is_new]
+        for field in ('open', 'high', 'low', 'close'):
+            self.bars[field][r, h] = p
+        self.bars['volume'][r, h] = volumes[is_new]
+        return is_same | is_new
+
+    # _____________________________________________________________________________
+    def latest(self, row: int, count: int = None) -> np.ndarray:
+        """Returns up to count latest bars of row, oldest first"""
+        count = self.count[row] if count is None else min(count, self.count[row])
+        idx = (self.head[row] - np.arange(count - 1, -1, -1)) % self.capacity
+        return self.bars[row, idx]
+
+
+# _____________________________________________________________________________
+class BarStore:
+    """Bars of all time frames for symbols, persisted to a file
+
+    :param bars_fp: .npz file bars are read from and saved to, or None if not persisted
+    """
+
+    # _____________________________________________________________________________
+    def __init__(self, bars_fp: Path = None):
+        self._bars_fp = bars_fp
+        self._rows: Dict[str, int] = dict()
+        self._last_volume = np.zeros(0, dtype=np.int64)   # Cumulative volume of last quote, -1 if none
+        self._rings = {tf: _Ring(period, capacity) for tf, (period, capacity) in time_frames.items()}
+        if bars_fp and bars_fp.exists():
+            self.__read()
+
+    # _____________________________________________________________________________
+    def __read(self):
+        try:
+            with np.load(self._bars_fp) as data:
+                rings = dict()
+                for tf, (period, capacity) in time_frames.items():
+                    ring = _Ring(period, capacity)
+                    ring.bars, ring.head, ring.count = data[f'{tf}_bars'], data[f'{tf}_head'], data[f'{tf}_count']
+                    if ring.bars.dtype != bar_dtype or ring.bars.shape[1] != capacity:
+                        raise ValueError(f'{tf} bars have a different layout')
+                    rings[tf] = ring
+                symbols, last_volume = data['symbols'].tolist(), data['last_volume']
+        except (OSError, KeyError, ValueError) as ex:
+            _logger.warning(f'Cannot read bars "{self._bars_fp.name}", starting new bars: {ex}')
+            return
+        self._rings = rings
+        self._rows = {s: i for i, s in enumerate(symbols)}
+        self._last_volume = last_volume
+
+    # _____________________________________________________________________________
+    @property
+    def symbols(self) -> List[str]:
+        return list(self._rows)
+
+    # _____________________________________________________________________________
+    def update(self, recs: List[Record]):
+        """Adds the records' prices and volumes to the bars of their symbols"""
+        _logger.debug('update')
+
+        recs = [r for r in recs if r.price]
+        for r in recs:
+            if r.symbol not in self._rows:
+                self._rows[r.symbol] = len(self._rows)
+        if len(self._rows) > len(self._last_volume):
+            added = len(self._rows) - len(self._last_volume)
+            self._last_volume = np.concatenate([self._last_volume, np.full(added, -1, dtype=np.int64)])
+            for ring in self._rings.values():
+                ring.grow(len(self._rows))
+        if not recs:
+            return
+
+        rows = np.fromiter((self._rows[r.symbol] for r in recs), dtype=np.int64, count=len(recs))
+        times = np.fromiter((r.epoch for r in recs), dtype=np.int64, count=len(recs))
+        prices = np.fromiter((r.price for r in recs), dtype=np.float64, count=len(recs))
+        cumulative = np.fromiter((r.volume or 0 for r in recs), dtype=np.int64, count=len(recs))
+        last = self._last_volume[rows]
+        volumes = np.where(last < 0, 0, np.where(cumulative >= last, cumulative - last, cumulative))
+
+        # Time frames are finest first, so quotes not older than the latest finest bar are not older than any
+        rings = iter(self._rings.values())
+        is_added = next(rings).append(rows, times, prices, volumes)
+        rows, times, prices, volumes = rows[is_added], times[is_added], prices[is_added], volumes[is_added]
+        for ring in rings:
+            ring.append(rows, times, prices, volumes)
+        self._last_volume[rows] = cumulative[is_added]
+
+    # _____________________________________________________________________________
+    def bars(self, symbol: str, time_frame: str, count: int = None) -> np.ndarray:
+        """Returns up to count latest bars, of bar_dtype, oldest first"""
+        if (row := self._rows.get(symbol, None)) is None:
+            return np.zeros(0, dtype=bar_dtype)
+        return self._rings[time_frame].latest(row, count)
+
+    # _____________________________________________________________________________
+    def change_percent(self, symbol: str, time_frame: str) -> Optional[float]:
+        """Returns percent change from open to close of latest bar, or None if no bars"""
+        bars = self.bars(symbol, time_frame, 1)
+        if not len(bars) or not bars['open'][0]:
+            return None
+        return (bars['close'][0] / bars['open'][0] - 1) * 100
+
+    # _____________________________________________________________________________
+    def save(self):
+        if not self._bars_fp:
+            return
+        arrays = {'symbols': np.array(self.symbols, dtype=str), 'last_volume': self._last_volume}
+        for tf, ring in self._rings.items():
+            arrays.update({f'{tf}_bars': ring.bars, f'{tf}_head': ring.head, f'{tf}_count': ring.count})
+        tmp_fp = self._bars_fp.with_suffix('.tmp')
+        try:
+            with tmp_fp.open('wb') as f:
+                np.savez(f, **arrays)
+            os.replace(tmp_fp, self._bars_fp)
+        except OSError:
+            _logger.warning(f'Cannot write bars "{self._bars_fp.name}"')
+
+    # _____________________________________________________________________________
+    def write_csv(self, csv_fp: Path, time_frames_output: List[str] = None):
+        """Writes bars of time frames, default all, oldest first for each symbol"""
+        _logger.debug(f'write_csv "{csv_fp.name}"')
+
+        try:
+            with csv_fp.open(mode='wt', newline='') as out:
+                csv_writer = csv.writer(out, quoting=csv.QUOTE_MINIMAL)
+                csv_writer.writerow(['symbol', 'frame', 'start'] + list(bar_dtype.names[1:]))
+                for tf in time_frames_output or time_frames:
+                    for symbol in self._rows:
+                        for start, *ohlcv in self.bars(symbol, tf).tolist():
+                            csv_writer.writerow([symbol, tf, datetime.fromtimestamp(start).isoformat()] + ohlcv)
+        except PermissionError:
+            _logger.error(f'Cannot write to "{csv_fp.name}"')
+            raise
@@ -3,4 +3,7 @@ from decimal import Decimal
 quant = Decimal('0.000')
 
 URL = 'https://query1.finance.yahoo.com/v7/finance/quote'
-
+HEDGE_URL = 'https://query2.finance.yahoo.com/v7/finance/quote'
+HEDGE_STATE_NAME = 'hedge-latency.json'
+SNAPSHOT_NAME = 'quotes.snapshot'
+POOL_SIZE = 2
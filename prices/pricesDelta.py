@@ -0,0 +1,91 @@
+"""Tracks quotes last output for each symbol so that only changes are output.
+
+Notes:
+    1. A symbol has changed if it is new, its alert state has changed, or its price or volume has moved by more than
+    the thresholds since it was last output.  Changes are measured from the last quote output, not the last quote
+    fetched, so slow drift below the thresholds is still output once it accumulates.
+    2. State is kept in memory between polls and persisted compactly as JSON of symbol to [price, volume, alert],
+    replaced atomically.
+    3. Changes are only recorded as output by save, called once they have been written, so changes that fail to be
+    written are selected again by the next poll.
+"""
+from decimal import Decimal
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from .pricesTypes import Alert, Record
+
+_logger = logging.getLogger(__name__)
+
+_dec100 = Decimal(100)
+
+
+# _____________________________________________________________________________
+class DeltaTracker:
+    """Selects records and alerts changed since last output
+
+    :param state_fp: file state is read from and saved to
+    :param price_percent: percent price move above which a price has changed, 0 for any move
+    :param volume: volume change above which volume has changed, 0 for any change
+    """
+
+    # _____________________________________________________________________________
+    def __init__(self, state_fp: Path, price_percent: Decimal = Decimal(0), volume: int = 0):
+        self._state_fp = state_fp
+        self._price_percent = price_percent
+        self._volume = volume
+        self._state: Dict[str, list] = dict()
+        self._pending: Dict[str, list] = dict()
+        if state_fp.exists():
+            try:
+                self._state = json.loads(state_fp.read_text())
+            except (json.JSONDecodeError, OSError):
+                _logger.warning(f'Cannot read delta state "{state_fp.name}", outputting all quotes')
+
+    # _____________________________________________________________________________
+    def __is_changed(self, r: Record, alert: str) -> bool:
+        if (previous := self._state.get(r.symbol, None)) is None:
+            return True
+        price, volume, previous_alert = previous
+        if alert != previous_alert:
+            return True
+        price = Decimal(price)
+        if r.price != price and (not price or abs(r.price - price) / price * _dec100 > self._price_percent):
+            return True
+        return (r.volume or 0) != volume and abs((r.volume or 0) - volume) > self._volume
+
+    # _____________________________________________________________________________
+    def changes(self, recs: List[Record], alerts: List[Alert]) -> Tuple[List[Record], List[Alert]]:
+        """Returns records changed and alerts new since last output, to be recorded as output by save
+
+        :return: changed records, new alerts
+        """
+        _logger.debug('changes')
+
+        alert_states = {a.symbol: a.alertType.name for a in alerts}
+        previous_alerts = {s: v[2] for s, v in self._state.items()}
+        changed = []
+        self._pending = dict()
+        for r in recs:
+            alert = alert_states.get(r.symbol, '')
+            if self.__is_changed(r, alert):
+                changed.append(r)
+                self._pending[r.symbol] = [str(r.price), r.volume or 0, alert]
+        new_alerts = [a for a in alerts if previous_alerts.get(a.symbol, '') != a.alertType.name]
+        _logger.info(f'Delta: {len(changed)} of {len(recs)} quotes changed, {len(new_alerts)} new alerts')
+        return changed, new_alerts
+
+    # _____________________________________________________________________________
+    def save(self):
+        """Records the last changes as output and persists the state"""
+        self._state.update(self._pending)
+        self._pending = dict()
+        tmp_fp = self._state_fp.with_suffix('.tmp')
+        try:
+            tmp_fp.write_text(json.dumps(self._state, separators=(',', ':')))
+            os.replace(tmp_fp, self._state_fp)
+        except OSError:
+            _logger.warning(f'Cannot write delta state "{self._state_fp.name}"')
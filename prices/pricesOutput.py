@@ -3,12 +3,14 @@ from decimal import Decimal, getcontext, InvalidOperation
 from io import StringIO
 import json
 import logging
+import numpy as np
 import os
 from pathlib import Path
 from typing import Union, Sequence, List
 
+import common.bulkFormat as bulk
 from common.common import multisort, today
-from common.metricPrefix import to_decimal_units
+from .pricesBars import BarStore
 from .pricesLoader import ValuesLoader
 from .pricesTypes import Alert, AlertType, Record
 
@@ -18,6 +20,7 @@ _PRICE_FORMAT_THRESHOLD = Decimal(1.0)
 _PERCENT_FORMAT_THRESHOLD = Decimal(10.0)
 _BLANK = f'{"":9s}'
 _LINES_PER_BLOCK = 5
+_SCALE = 3  # Decimal places of prices, as quantized on loading
 
 _base_path = Path(Path(__file__).parent)
 _data_base_path = Path(_base_path, 'data')
@@ -36,19 +39,35 @@ def _outsym(symbol: str):
 
 
 # _____________________________________________________________________________
-def _fmtp(prices: Sequence[Decimal], ref=None) -> Sequence[str]:
-    """Returns transformed sequence of decimal prices as formatted strings with two/three decimal places
-    by testing if reference number is less than threshold
+def _is_above(values: Sequence[Decimal], threshold: Decimal) -> np.ndarray:
+    """Returns whether each value is set and at least threshold, compared before rounding as for _outp"""
+    return np.fromiter((v is not None and v >= threshold for v in values), dtype=bool, count=len(values))
+
+
+# _____________________________________________________________________________
+def _fmtp_column(prices: Sequence[Decimal], is_above: np.ndarray = None) -> np.ndarray:
+    """Returns column of decimal prices as formatted strings with two/three decimal places by testing if the
+    reference price, or each price if no references, is less than threshold
+
+    :param is_above: reference prices at least threshold, from _is_above
     """
-    if prices is None:
-        raise ValueError('prices')
-    if not ref and len(prices):
-        ref = prices[0]
+    fixed, is_set = bulk.to_fixed(prices, _SCALE)
+    if is_above is None:
+        is_above = _is_above(prices, _PRICE_FORMAT_THRESHOLD)
+    return bulk.format_split(fixed, is_above, _SCALE, (2, 8, ' '), (3, 9, ''), is_set)
 
-    if ref >= _PRICE_FORMAT_THRESHOLD:
-        return list(map(lambda p: f'{p:8.2f} ' if p else _BLANK, prices))
-    else:
-        return list(map(lambda p: f'{p:9.3f}' if p else _BLANK, prices))
+
+# _____________________________________________________________________________
+def _fmtpercent_column(percents: Sequence[Decimal]) -> np.ndarray:
+    """Returns column of decimal percentages as formatted strings, as for _outpercent"""
+    fixed, is_set = bulk.to_fixed(percents, _SCALE)
+    is_above = _is_above(percents, _PERCENT_FORMAT_THRESHOLD)
+    return bulk.format_split(fixed, is_above, _SCALE, (1, 8, ' '), (2, 9, ''), is_set)
+
+
+# _____________________________________________________________________________
+def _sym_column(symbols: Sequence[str]) -> np.ndarray:
+    return np.char.ljust(np.array(symbols, dtype=str), 6)
 
 
 # _____________________________________________________________________________
@@ -81,13 +100,15 @@ def _outs(s: str):
 def output_symbols(values: ValuesLoader):
     _logger.debug('output_symbols')
 
+    symbols = values.symbols
     with StringIO() as buf:
         buf.write(f'\n {"symbol":^6s} | {"low":^9s}   {"high":^9s}   {"ref":^9s}\n')
-        for i, s in enumerate(values.symbols, 1):
-            buf.write(f' {_outsym(s)} | {_outp(values.alert_low(s))}   {_outp(values.alert_high(s))}'
-                      f'   {_outp(values.price_ref(s))}\n')
-            if i % _LINES_PER_BLOCK == 0:
-                buf.write('\n')
+        if symbols:
+            buf.write(bulk.join_rows([
+                ' ', _sym_column(symbols),
+                ' | ', _fmtp_column([values.alert_low(s) for s in symbols]),
+                '   ', _fmtp_column([values.alert_high(s) for s in symbols]),
+                '   ', _fmtp_column([values.price_ref(s) for s in symbols])], _LINES_PER_BLOCK))
         print(buf.getvalue())
 
 
@@ -118,17 +139,22 @@ def output_prices(recs: List[Record], symbols: List[str] = None):
     with StringIO() as buf:
         buf.write(f'\n {"symbol":^6s} | {"price":^9s}   {"low":^9s}   {"high":^9s}   {"ask":^9s}   {"buy":^9s}'
                   f'  | {"volume":^9s}\n')
-        for i, r in enumerate(recs, 1):
-            prices = _fmtp([r.price, r.low, r.high, r.ask, r.bid], r.low)
-            buf.write(f' {_outsym(r.symbol)} | {prices[0]}   {prices[1]}   {prices[2]}'
-                      f'   {prices[3]}    {prices[4]} | {_outs(to_decimal_units(r.volume))}\n')
-            if i % _LINES_PER_BLOCK == 0:
-                buf.write('\n')
+        prices, lows = [r.price for r in recs], [r.low for r in recs]
+        refs = _is_above([low or price for low, price in zip(lows, prices)], _PRICE_FORMAT_THRESHOLD)
+        buf.write(bulk.join_rows([
+            ' ', _sym_column([r.symbol for r in recs]),
+            ' | ', _fmtp_column(prices, refs),
+            '   ', _fmtp_column(lows, refs),
+            '   ', _fmtp_column([r.high for r in recs], refs),
+            '   ', _fmtp_column([r.ask for r in recs], refs),
+            '    ', _fmtp_column([r.bid for r in recs], refs),
+            ' | ', bulk.to_decimal_units([r.volume for r in recs], 9)], _LINES_PER_BLOCK))
         print(buf.getvalue())
 
 
 # _____________________________________________________________________________
-def output_brief(recs: List[Record]):
+def output_brief(recs: List[Record], bars: BarStore = None):
+    """Outputs brief table, with percent change over the latest 5 and 15 minute bars if bars given"""
     _logger.debug('output_brief')
 
     if not recs:
@@ -137,12 +163,20 @@ def output_brief(recs: List[Record]):
                 (lambda y: y.symbol, False)))
     with StringIO() as buf:
         buf.write(f'\n {"symbol":^6s} | {"price":^9s}   {"% ref":^9s}   {"ref":^9s} | {"L alert":^9s}'
-                  f'   {"H alert":^9s}\n')
-        for i, r in enumerate(recs, 1):
-            buf.write(f' {_outsym(r.symbol)} | {_outp(r.price)}   {_outpercent(r.refToPrice)}   {_outp(r.ref)}'
-                      f' | {_outp(r.alertLow)}   {_outp(r.alertHigh)}\n')
-            if i % _LINES_PER_BLOCK == 0:
-                buf.write('\n')
+                  f'   {"H alert":^9s}')
+        buf.write(f' | {"% 5m":^9s}   {"% 15m":^9s}\n' if bars else '\n')
+        columns = [
+            ' ', _sym_column([r.symbol for r in recs]),
+            ' | ', _fmtp_column([r.price for r in recs]),
+            '   ', _fmtpercent_column([r.refToPrice for r in recs]),
+            '   ', _fmtp_column([r.ref for r in recs]),
+            ' | ', _fmtp_column([r.alertLow for r in recs]),
+            '   ', _fmtp_column([r.alertHigh for r in recs])]
+        if bars:
+            columns += [
+                ' | ', _fmtpercent_column([bars.change_percent(r.symbol, '5m') for r in recs]),
+                '   ', _fmtpercent_column([bars.change_percent(r.symbol, '15m') for r in recs])]
+        buf.write(bulk.join_rows(columns, _LINES_PER_BLOCK))
         print(buf.getvalue())
 
 
@@ -167,14 +201,44 @@ def write_json(data: Union[str, bytes], basename: str):
 
 
 # _____________________________________________________________________________
-def write_alerts(alerts: List[Alert], basename: str):
+def read_hedge_state(name: str) -> (List[float], int, int):
+    """Reads hedged request state from previous runs
+
+    :return: primary latency samples, requests and hedged requests
+    """
+    state_fp = Path(_data_base_path, name)
+    try:
+        state = json.loads(state_fp.read_text()) if state_fp.exists() else {}
+        if isinstance(state, list):
+            # Samples only, as written before the counts were kept
+            state = {'samples': state}
+        return state.get('samples', []), state.get('requests', 0), state.get('hedged', 0)
+    except (json.JSONDecodeError, OSError, AttributeError):
+        _logger.warning(f'Cannot read hedge state "{state_fp.name}"')
+        return [], 0, 0
+
+
+# _____________________________________________________________________________
+def write_hedge_state(samples: List[float], requests: int, hedged: int, name: str):
+    state_fp = Path(_data_base_path, name)
+    try:
+        state_fp.write_text(json.dumps({'samples': [round(s, 4) for s in samples], 'requests': requests,
+                                        'hedged': hedged}))
+    except OSError:
+        _logger.warning(f'Cannot write hedge state "{state_fp.name}"')
+
+
+# _____________________________________________________________________________
+def write_alerts(alerts: List[Alert], basename: str, is_append: bool = False):
+    """Writes alerts to today's alerts file, replacing the file or, if is_append, adding to it"""
     alert_fp = Path(f'{basename}.alerts-{today.strftime("%Y-%m-%d")}.csv').resolve()
     _logger.debug(f'write_alerts "{alert_fp.name}"')
 
     # Write alerts
     if alerts:
+        is_append = is_append and alert_fp.exists()
         # Backup alerts
-        if alert_fp.exists():
+        if alert_fp.exists() and not is_append:
             backup_fp = _make_backup_path(alert_fp)
             try:
                 backup_fp.write_text(alert_fp.read_text())
@@ -183,9 +247,10 @@ def write_alerts(alerts: List[Alert], basename: str):
 
         # Write alerts
         try:
-            with alert_fp.open(mode='wt', newline='') as out:
+            with alert_fp.open(mode='at' if is_append else 'wt', newline='') as out:
                 csv_writer = csv.writer(out, quoting=csv.QUOTE_MINIMAL)
-                csv_writer.writerow(Record.__slots__)
+                if not is_append:
+                    csv_writer.writerow(Record.__slots__)
                 for alert in alerts:
                     csv_writer.writerow(alert.to_list())
         except PermissionError:
@@ -205,12 +270,16 @@ def write_alerts(alerts: List[Alert], basename: str):
 
 
 # _____________________________________________________________________________
-def write_report(recs: List[Record], basename: str):
+def write_report(recs: List[Record], basename: str, is_append: bool = False):
+    """Writes records to today's report file, replacing the file or, if is_append, adding to it"""
     report_fp = Path(_data_base_path, f'{basename}.report-{today.strftime("%Y-%m-%d")}.csv').resolve()
     _logger.debug(f'write_report "{report_fp.name}"')
+    is_append = is_append and report_fp.exists()
+    if is_append and not recs:
+        return
 
     # Backup report
-    if report_fp.exists():
+    if report_fp.exists() and not is_append:
         backup_fp = _make_backup_path(report_fp)
         try:
             backup_fp.write_text(report_fp.read_text())
@@ -219,9 +288,10 @@ def write_report(recs: List[Record], basename: str):
 
     # Write report
     try:
-        with report_fp.open(mode='wt', newline='') as out:
+        with report_fp.open(mode='at' if is_append else 'wt', newline='') as out:
             csv_writer = csv.writer(out, quoting=csv.QUOTE_MINIMAL)
-            csv_writer.writerow(Record.__slots__)
+            if not is_append:
+                csv_writer.writerow(Record.__slots__)
             for rec in recs:
                 csv_writer.writerow(rec.to_list())
     except PermissionError:
@@ -0,0 +1,287 @@
+"""Publishes the latest quotes to a memory-mapped snapshot file that other local processes read without locks.
+
+Notes:
+    1. The file has a fixed layout: a 64 byte header followed by an array of fixed size records, one slot per
+    symbol.  Slots are assigned in the order symbols are first published and are kept, so a reader's index of
+    symbol to slot stays valid until the header index version changes.
+    2. Writes are guarded by a sequence lock.  The writer makes the sequence number odd before changing records and
+    even after.  A reader copies what it needs, then retries if the sequence number was odd or has changed.
+    Readers never block the writer.  Only one writer process is supported.
+    3. view returns a NumPy array over the mapped records, without copying, for readers that can tolerate values
+    changing while read.  get and read return consistent copies.
+    4. The sequence lock relies on stores to the mapping becoming visible in order, as on x86.
+    5. Symbols are stored as ASCII in a fixed width field.  Symbols that do not fit are not published.
+    6. A missing price, bid or ask is published as NaN and a missing volume as -1, so they are distinct from zero.
+    7. A file with a different layout or capacity is replaced by renaming a new file over it.  The writer then sets
+    the replaced flag in the old file's header, which readers still mapping it check on each read, reopening the
+    path so they do not go on returning stale quotes.
+"""
+import contextlib
+from dataclasses import dataclass
+from datetime import datetime
+import logging
+import math
+import mmap
+import os
+from pathlib import Path
+import struct
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+import prices.pricesConfig as config
+from prices.pricesTypes import Record
+
+_logger = logging.getLogger(__name__)
+
+_MAGIC = b'PSNP'
+_LAYOUT_VERSION = 2
+_HEADER = struct.Struct('<4sIQIIQq')    # magic, layout version, sequence, capacity, count, index version, time ns
+_HEADER_SIZE = 64
+_SEQ_OFFSET = 8
+_REPLACED = struct.Struct('<I')         # replaced flag, after the header fields in the padding
+_REPLACED_OFFSET = _HEADER.size
+_DEFAULT_CAPACITY = 1024
+_READ_ATTEMPTS = 1000
+_NO_VOLUME = -1
+
+record_dtype = np.dtype([('symbol', 'S12'), ('price', '<f8'), ('bid', '<f8'), ('ask', '<f8'), ('volume', '<i8'),
+                         ('time', '<i8')])
+_SYMBOL_SIZE = record_dtype['symbol'].itemsize
+
+default_path = Path(Path(__file__).parent, 'data', config.SNAPSHOT_NAME)
+
+
+# _____________________________________________________________________________
+@dataclass
+class Quote:
+    """Quote read from the snapshot, with NaN for a missing price, bid or ask and -1 for a missing volume"""
+    __slots__ = ['symbol', 'price', 'bid', 'ask', 'volume', 'time']
+
+    symbol: str
+    price: float
+    bid: float
+    ask: float
+    volume: int
+    time: datetime
+
+
+# _____________________________________________________________________________
+def _file_size(capacity: int) -> int:
+    return _HEADER_SIZE + capacity * record_dtype.itemsize
+
+
+# _____________________________________________________________________________
+def _to_float(value) -> float:
+    return math.nan if value is None else float(value)
+
+
+# _____________________________________________________________________________
+def _to_quote(rec: np.void) -> Quote:
+    return Quote(rec['symbol'].decode('ascii'), float(rec['price']), float(rec['bid']), float(rec['ask']),
+                 int(rec['volume']), datetime.fromtimestamp(int(rec['time'])))
+
+
+# _____________________________________________________________________________
+class SnapshotWriter:
+    """Publishes batches of quote records to the snapshot file, creating the file if it does not exist or has a
+    different layout
+    """
+
+    # _____________________________________________________________________________
+    def __init__(self, path: Path = default_path, capacity: int = _DEFAULT_CAPACITY):
+        self._path = Path(path)
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        self.__open(capacity)
+        self._slots: Dict[str, int] = {s.decode('ascii'): i
+                                       for i, s in enumerate(self._records['symbol'][:self._count].tolist())}
+        self._rejected = set()
+
+    # _____________________________________________________________________________
+    def __open(self, capacity: int):
+        size = _file_size(capacity)
+        is_valid = is_snapshot = False
+        if self._path.exists() and self._path.stat().st_size >= _HEADER_SIZE:
+            with self._path.open('rb') as f:
+                magic, version, seq, file_capacity, count, index_version, _ = _HEADER.unpack(f.read(_HEADER.size))
+            is_snapshot = magic == _MAGIC
+            is_valid = is_snapshot and version == _LAYOUT_VERSION and file_capacity == capacity \
+                and self._path.stat().st_size == size
+        if not is_valid:
+            # Write whole file then rename, so readers never map a partial file
+            tmp_fp = self._path.with_suffix('.tmp')
+            with tmp_fp.open('wb') as f:
+                f.write(_HEADER.pack(_MAGIC, _LAYOUT_VERSION, 0, capacity, 0, 0, 0).ljust(size, b'\0'))
+            with self._path.open('r+b') if is_snapshot else contextlib.nullcontext() as old_file:
+                os.replace(tmp_fp, self._path)
+                if old_file:
+                    # Tell readers still mapping the old file to reopen the path
+                    old_file.seek(_REPLACED_OFFSET)
+                    old_file.write(_REPLACED.pack(1))
+            seq, count, index_version = 0, 0, 0
+
+        self._file = self._path.open('r+b')
+        self._mm = mmap.mmap(self._file.fileno(), size)
+        self._records = np.frombuffer(self._mm, dtype=record_dtype, count=capacity, offset=_HEADER_SIZE)
+        self._capacity, self._count, self._index_version = capacity, count, index_version
+        self._seq = seq + 1 if seq % 2 else seq
+
+    # _____________________________________________________________________________
+    def __enter__(self):
+        return self
+
+    # _____________________________________________________________________________
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # _____________________________________________________________________________
+    def close(self):
+        del self._records
+        self._mm.close()
+        self._file.close()
+
+    # _____________________________________________________________________________
+    def __write_header(self, time_ns: int = 0):
+        _HEADER.pack_into(self._mm, 0, _MAGIC, _LAYOUT_VERSION, self._seq, self._capacity, self._count,
+                          self._index_version, time_ns)
+
+    # _____________________________________________________________________________
+    def publish(self, recs: List[Record]) -> int:
+        """Writes the records' quotes to their slots, adding slots for new symbols.
+
+        :return: number of quotes published
+        """
+        _logger.debug('publish')
+
+        rows = []
+        for r in recs:
+            if (slot := self._slots.get(r.symbol, None)) is None:
+                if r.symbol in self._rejected:
+                    continue
+                if not r.symbol.isascii() or len(r.symbol) > _SYMBOL_SIZE:
+                    _logger.warning(f'Symbol {r.symbol} does not fit snapshot, not publishing')
+                    self._rejected.add(r.symbol)
+                    continue
+                if len(self._slots) >= self._capacity:
+                    _logger.warning(f'Snapshot full, not publishing {r.symbol}')
+                    continue
+                slot = self._slots[r.symbol] = len(self._slots)
+            rows.append((slot, (r.symbol.encode('ascii'), _to_float(r.price), _to_float(r.bid), _to_float(r.ask),
+                                _NO_VOLUME if r.volume is None else r.volume, r.epoch)))
+
+        # Sequence lock: odd while records change
+        self._seq += 1
+        struct.pack_into('<Q', self._mm, _SEQ_OFFSET, self._seq)
+        for slot, values in rows:
+            self._records[slot] = values
+        if len(self._slots) != self._count:
+            self._count = len(self._slots)
+            self._index_version += 1
+        self._seq += 1
+        self.__write_header(time.time_ns())
+        return len(rows)
+
+
+# _____________________________________________________________________________
+class SnapshotReader:
+    """Reads quotes from the snapshot file without locking
+    """
+
+    # _____________________________________________________________________________
+    def __init__(self, path: Path = default_path):
+        self._path = Path(path)
+        self.__open()
+
+    # _____________________________________________________________________________
+    def __open(self):
+        self._file = self._path.open('rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, capacity, _, _, _ = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC or version != _LAYOUT_VERSION:
+            self.close()
+            raise ValueError(f'Not a quote snapshot file, or unsupported layout: "{self._path}"')
+        self._records = np.frombuffer(self._mm, dtype=record_dtype, count=capacity, offset=_HEADER_SIZE)
+        self._slots: Dict[str, int] = dict()
+        self._index_version = None
+
+    # _____________________________________________________________________________
+    def __reopen_if_replaced(self):
+        if _REPLACED.unpack_from(self._mm, _REPLACED_OFFSET)[0]:
+            _logger.debug(f'Snapshot replaced, reopening "{self._path.name}"')
+            old_mm, old_file = self._mm, self._file
+            self.__open()
+            old_file.close()
+            try:
+                old_mm.close()
+            except BufferError:
+                # Arrays returned by view still map the old file, which is unmapped once they are released
+                pass
+
+    # _____________________________________________________________________________
+    def __enter__(self):
+        return self
+
+    # _____________________________________________________________________________
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # _____________________________________________________________________________
+    def close(self):
+        self._records = None
+        self._mm.close()
+        self._file.close()
+
+    # _____________________________________________________________________________
+    def __header(self) -> tuple:
+        return _HEADER.unpack_from(self._mm, 0)
+
+    # _____________________________________________________________________________
+    def __consistent(self, read):
+        """Returns result of read once made with no write in progress or made during the read"""
+        self.__reopen_if_replaced()
+        for _ in range(_READ_ATTEMPTS):
+            _, _, seq, _, count, index_version, time_ns = self.__header()
+            if seq % 2 == 0:
+                result = read(count, index_version, time_ns)
+                if struct.unpack_from('<Q', self._mm, _SEQ_OFFSET)[0] == seq:
+                    return result
+            time.sleep(0)
+        raise TimeoutError('Quote snapshot is being written continuously')
+
+    # _____________________________________________________________________________
+    def __slot(self, symbol: str, count: int, index_version: int) -> Optional[int]:
+        if index_version != self._index_version:
+            self._slots = {s.decode('ascii'): i for i, s in enumerate(self._records['symbol'][:count].tolist())}
+            self._index_version = index_version
+        return self._slots.get(symbol, None)
+
+    # _____________________________________________________________________________
+    @property
+    def updated(self) -> Optional[datetime]:
+        """Time of last publish"""
+        time_ns = self.__consistent(lambda count, index_version, time_ns: time_ns)
+        return datetime.fromtimestamp(time_ns / 1e9) if time_ns else None
+
+    # _____________________________________________________________________________
+    def get(self, symbol: str) -> Optional[Quote]:
+        """Returns latest quote for symbol, or None if not published"""
+        def read(count, index_version, time_ns):
+            slot = self.__slot(symbol, count, index_version)
+            return None if slot is None else self._records[slot].copy()
+
+        rec = self.__consistent(read)
+        return None if rec is None else _to_quote(rec)
+
+    # _____________________________________________________________________________
+    def read(self) -> Dict[str, Quote]:
+        """Returns latest quotes for all symbols"""
+        recs = self.__consistent(lambda count, index_version, time_ns: self._records[:count].copy())
+        return {q.symbol: q for q in map(_to_quote, recs)}
+
+    # _____________________________________________________________________________
+    def view(self) -> np.ndarray:
+        """Returns the records, of record_dtype, as an array over the mapped file.  Values may change while read."""
+        self.__reopen_if_replaced()
+        count = self.__header()[4]
+        return self._records[:count]
@@ -12,7 +12,7 @@ _logger = logging.getLogger(__name__)
 # Records
 @dataclass
 class Record:
-    __slots__ = ['symbol', 'price', 'low', 'high', 'bid', 'ask', 'ref', 'refToPrice', 'alertLow', 'alertHigh', 'volume', 'date', 'time', 'name']
+    __slots__ = ['symbol', 'price', 'low', 'high', 'bid', 'ask', 'ref', 'refToPrice', 'alertLow', 'alertHigh', 'volume', 'date', 'time', 'name', 'epoch']
 
     symbol: str
     price: Decimal
@@ -28,12 +28,13 @@ class Record:
     date: date
     time: time
     name: str
+    epoch: int      # quote time as seconds since epoch, as date and time are ambiguous when clocks go back
 
     # _____________________________________________________________________________
     def to_list(self) -> List[Any]:
         return [self.symbol, self.price, self.low, self.high, self.bid, self.ask,
                     self.ref, self.refToPrice, self.alertLow, self.alertHigh, self.volume,
-                    self.date.strftime('%d-%m-%y'), self.time.strftime('%H:%M'), self.name]
+                    self.date.strftime('%d-%m-%y'), self.time.strftime('%H:%M'), self.name, self.epoch]
 
 
 # _____________________________________________________________________________
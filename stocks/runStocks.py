@@ -0,0 +1,147 @@
+"""Runs the prices and announcements pipelines at the same time in one process.
+
+Notes:
+    1. The watchlist is loaded once, from a prices symbols file, and announcements are fetched for its ASX share
+    codes.
+    2. Both pipelines share the HTTP client's connection pools, concurrency limits and metrics, and one log listener
+    writing to logs/stocks.  The run deadline applies to both.
+    3. Each pipeline prints its tables as it finishes, so prices are not held back by announcements.  A combined
+    summary and the host metrics are printed once both have finished.
+"""
+import argparse
+from collections import Counter
+import concurrent.futures
+from dataclasses import dataclass
+from datetime import datetime
+from io import StringIO
+import logging
+from pathlib import Path
+import shlex
+import time
+from typing import Callable, List
+
+from common.common import local_tz, re_asx_shares_symbol
+import common.httpClient as httpClient
+from common.logTools import flush_logger, initialize_logger
+
+import announcements.annTypes as annTypes
+import announcements.getAnn as getAnn
+import prices.getPrices as getPrices
+
+_logger = logging.getLogger(__name__)
+
+
+# _____________________________________________________________________________
+@dataclass
+class PipelineResult:
+    __slots__ = ['name', 'seconds', 'summary', 'error']
+
+    name: str
+    seconds: float
+    summary: str
+    error: str
+
+
+# _____________________________________________________________________________
+def _run_pipeline(name: str, func: Callable, summarize: Callable) -> PipelineResult:
+    start = time.monotonic()
+    try:
+        summary = summarize(func())
+        return PipelineResult(name, time.monotonic() - start, summary, None)
+    except Exception as ex:
+        _logger.exception(f'{name} failed')
+        return PipelineResult(name, time.monotonic() - start, '', f'{type(ex).__name__}: {ex}')
+
+
+# _____________________________________________________________________________
+def _prices_summary(result) -> str:
+    recs, alerts = result
+    return f'{len(recs)} quotes, {len(alerts)} alerts'
+
+
+# _____________________________________________________________________________
+def _announcements_summary(anns: List[annTypes.Announcement]) -> str:
+    counts = Counter(a.outcome.name for a in anns)
+    outcomes = ', '.join(f'{n} {outcome}' for outcome, n in sorted(counts.items()))
+    return f'{len(anns)} announcements' + (f': {outcomes}' if outcomes else '')
+
+
+# _____________________________________________________________________________
+def output_summary(results: List[PipelineResult]):
+    _logger.debug('output_summary')
+
+    with StringIO() as buf:
+        buf.write(f'\n {"pipeline":^13s} | {"seconds":>8s} | result\n')
+        for r in results:
+            buf.write(f' {r.name:13s} | {r.seconds:8.1f} | {r.summary if r.error is None else "FAILED " + r.error}\n')
+        print(buf.getvalue())
+
+
+# _____________________________________________________________________________
+def run(args: argparse.Namespace, base_dp: Path) -> List[PipelineResult]:
+    """Runs prices and announcements for the watchlist concurrently
+
+    :param base_dp: directory of announcements cache, output and data directories
+    :return: result of each pipeline
+    """
+    _logger.debug('run')
+
+    prices_args = getPrices.create_parser().parse_args(shlex.split(args.prices_args))
+    ann_args = getAnn.create_parser().parse_args(shlex.split(args.ann_args))
+    if prices_args.interval:
+        raise ValueError('Prices polling interval not supported when run with announcements')
+    if ann_args.command:
+        raise ValueError(f'Announcements command {ann_args.command} not supported when run with prices')
+    prices_args.file = [args.file]
+    prices_args.deadline = ann_args.deadline = args.deadline
+
+    # Load watchlist once for both pipelines
+    values = getPrices.load_symbols(Path(Path(getPrices.__file__).parent, args.file))
+    share_codes = [annTypes.SharesAnnouncement(s, 0, None) for s in values.symbols
+                   if re_asx_shares_symbol.fullmatch(s)]
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix='pipeline') as executor:
+        futures = [
+            executor.submit(_run_pipeline, 'prices', lambda: getPrices.run(prices_args, values), _prices_summary),
+            executor.submit(_run_pipeline, 'announcements', lambda: getAnn.run(ann_args, base_dp, share_codes),
+                            _announcements_summary)]
+    return [f.result() for f in futures]
+
+
+# _____________________________________________________________________________
+def main():
+    start_datetime = datetime.now(tz=local_tz)
+    current_dp = Path(__file__).parent
+    base_dp = current_dp.parent
+    # Configure commandline parser
+    argp = argparse.ArgumentParser(description='Run stock prices and announcements pipelines')
+    subparsers = argp.add_subparsers(dest='command', metavar='command', required=True)
+    run_argp = subparsers.add_parser('run', help='Run prices and announcements at the same time in one process')
+    run_argp.add_argument('-f', '--file', action='store', default='symbols.csv',
+                help='Watchlist symbols file name, in the prices directory')
+    run_argp.add_argument('--prices-args', action='store', default='', metavar='ARGS',
+                help='Arguments for prices, such as --prices-args="-b --hedge"')
+    run_argp.add_argument('--ann-args', action='store', default='', metavar='ARGS',
+                help='Arguments for announcements, such as --ann-args="--budget 600"')
+    run_argp.add_argument('--deadline', action='store', type=float, metavar='SECONDS',
+                help='Stop retrying and making requests after time limit')
+    run_argp.add_argument('--debug-full', action='store_true',
+                help='Write all debug log records, not only those before warnings and errors')
+
+    try:
+        args = argp.parse_args()
+        initialize_logger(Path(base_dp, 'logs'), current_dp.stem, is_debug_full=args.debug_full)
+        _logger.info(f'Now: {start_datetime.strftime("%a  %d-%b-%y  %I:%M:%S %p")}')
+        results = run(args, base_dp)
+        flush_logger()
+        output_summary(results)
+    except Exception as ex:
+        _logger.exception('Catch all exception')
+    finally:
+        httpClient.output_metrics()
+        _logger.debug("done")
+
+
+# _____________________________________________________________________________
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,7 @@
+#!/usr/bin/python3
+import sys
+
+sys.path.append(".")
+if __name__ == '__main__':
+    from unitprices import getUnitPrices
+    getUnitPrices.main()
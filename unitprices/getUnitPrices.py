@@ -0,0 +1,65 @@
+import argparse
+from datetime import datetime
+from io import StringIO
+import logging
+from pathlib import Path
+from typing import List
+
+from common.common import local_tz
+from common.logTools import flush_logger, initialize_logger
+
+import unitprices.unitPricesConfig as config
+import unitprices.unitPricesIngest as ingest
+
+_logger = logging.getLogger(__name__)
+
+
+# _____________________________________________________________________________
+def output_results(results: List[ingest.FundResult]):
+    _logger.debug('output_results')
+
+    with StringIO() as buf:
+        buf.write(f'\n {"fund":^6s} | {"files":>5s} {"parsed":>6s} {"errors":>6s} | {"prices":>7s} {"added":>7s}'
+                  f' {"updated":>7s} {"total":>7s} | name\n')
+        for r in results:
+            buf.write(f' {r.fund.code:6s} | {r.files:5d} {r.ingested:6d} {r.errors:6d} | {r.prices:7d} {r.added:7d}'
+                      f' {r.updated:7d} {r.total:7d} | {r.fund.name}\n')
+        print(buf.getvalue())
+
+
+# _____________________________________________________________________________
+def main():
+    start_datetime = datetime.now(tz=local_tz)
+    current_dp = Path(__file__).parent
+    base_dp = current_dp.parent
+
+    # Configure commandline parser
+    argp = argparse.ArgumentParser(description='Ingest fund unit prices from text exports of unit price files')
+    argp.add_argument('fund', nargs='*', help='Codes of funds to ingest, default all funds')
+    argp.add_argument('-d', '--data', action='store', type=Path, default=config.data_path,
+                help='Directory of exports and unit price files')
+    argp.add_argument('-w', '--workers', action='store', type=int, help='Parsing processes, default CPU count')
+    argp.add_argument('--full', action='store_true', help='Ingest all exports, including those unchanged')
+
+    try:
+        args = argp.parse_args()
+        initialize_logger(Path(base_dp, 'logs'), current_dp.stem)
+        _logger.info(f'Now: {start_datetime.strftime("%a  %d-%b-%y  %I:%M:%S %p")}')
+
+        codes = {c.upper() for c in args.fund}
+        funds = [f for f in config.funds if not codes or f.code in codes]
+        for code in codes - {f.code for f in funds}:
+            _logger.error(f'Fund {code} not configured')
+
+        results = ingest.UnitPricesIngest(args.data, args.workers).process(funds, args.full)
+        flush_logger()
+        output_results(results)
+    except Exception as ex:
+        _logger.exception('Catch all exception')
+    finally:
+        _logger.debug("done")
+
+
+# _____________________________________________________________________________
+if __name__ == '__main__':
+    main()
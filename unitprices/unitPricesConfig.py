@@ -0,0 +1,25 @@
+from dataclasses import dataclass
+from pathlib import Path
+
+data_path = Path(Path(__file__).parent, 'data')
+state_name = 'ingested.json'
+
+
+# _____________________________________________________________________________
+@dataclass
+class Fund:
+    """Fund unit prices are ingested from text exports, matching pattern in the data directory, by the named parser
+    and merged into the fund's CSV file of unit prices by date"""
+    __slots__ = ['code', 'name', 'pattern', 'parser', 'csv_name']
+
+    code: str
+    name: str
+    pattern: str
+    parser: str
+    csv_name: str
+
+
+funds = [
+    Fund('ECF', 'Eley Griffiths Emerging Companies Fund', 'Historical-Unit-Prices-ECF*.txt', 'eleyGriffiths',
+         'Historical-Unit-Prices-ECF.csv'),
+]
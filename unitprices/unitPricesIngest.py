@@ -0,0 +1,167 @@
+"""Ingests text exports of unit prices into a CSV file of unit prices by date for each fund.
+
+Notes:
+    1. Exports are parsed in a pool of processes as parsing is CPU bound.  Lines are streamed from each file rather
+    than loaded whole.  Rows without prices are returned from the workers and logged here.
+    2. The SHA-256 digest of each export is recorded once ingested, and exports with an unchanged digest are not
+    parsed again.
+    3. Prices are merged into the fund's series by date in file name order, so prices from later exports replace
+    those of the same date.  When an export changes, it and all later exports are merged again, so a changed older
+    export does not replace prices from newer ones.  Series are written in date order and replaced atomically.
+"""
+import concurrent.futures
+import csv
+from dataclasses import dataclass
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from common.blobStore import new_hash
+from common.common import pool_context
+
+import unitprices.unitPricesConfig as config
+import unitprices.unitPricesParsers as parsers
+
+_logger = logging.getLogger(__name__)
+
+_CHUNK_SIZE = 64 * 1024
+
+
+# _____________________________________________________________________________
+@dataclass
+class FundResult:
+    __slots__ = ['fund', 'files', 'ingested', 'prices', 'added', 'updated', 'total', 'errors']
+
+    fund: config.Fund
+    files: int
+    ingested: int
+    prices: int
+    added: int
+    updated: int
+    total: int
+    errors: int
+
+
+# _____________________________________________________________________________
+def file_digest(path: Path) -> str:
+    hasher = new_hash()
+    with path.open('rb') as f:
+        while chunk := f.read(_CHUNK_SIZE):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+# _____________________________________________________________________________
+def parse_file(parser_name: str, path: str) -> (List[Tuple[str, str]], List[str]):
+    """Returns (date, price) tuples parsed from an export, and dates of rows without prices.  Run in pool worker
+    processes."""
+    parser = parsers.get_parser(parser_name)
+    rows, skipped = [], []
+    with open(path, encoding='utf-8', errors='replace') as f:
+        for date, price in parser(f):
+            if price is None:
+                skipped.append(date)
+            else:
+                rows.append((date, price))
+    return rows, skipped
+
+
+# _____________________________________________________________________________
+def read_series(csv_fp: Path) -> Dict[str, str]:
+    series = dict()
+    if csv_fp.exists():
+        with csv_fp.open(newline='') as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            for row in reader:
+                if len(row) > 1:
+                    series[row[0]] = row[1]
+    return series
+
+
+# _____________________________________________________________________________
+def write_series(csv_fp: Path, series: Dict[str, str]):
+    tmp_fp = csv_fp.with_suffix(csv_fp.suffix + '.tmp')
+    with tmp_fp.open('wt', newline='') as out:
+        csv_writer = csv.writer(out, quoting=csv.QUOTE_MINIMAL, lineterminator='\n')
+        csv_writer.writerow(['date', 'redeem'])
+        for date in sorted(series):
+            csv_writer.writerow([date, series[date]])
+    os.replace(tmp_fp, csv_fp)
+
+
+# _____________________________________________________________________________
+class UnitPricesIngest:
+    """Ingests exports for funds, recording digests of exports ingested in the data directory
+    """
+
+    # _____________________________________________________________________________
+    def __init__(self, data_path: Path = config.data_path, max_workers: int = None):
+        self._data_path = data_path
+        self._state_fp = Path(data_path, config.state_name)
+        self._max_workers = max_workers or os.cpu_count()
+        data_path.mkdir(parents=True, exist_ok=True)
+        self._digests: Dict[str, str] = dict()
+        if self._state_fp.exists():
+            self._digests = json.loads(self._state_fp.read_text())
+
+    # _____________________________________________________________________________
+    def __write_state(self):
+        tmp_fp = self._state_fp.with_suffix('.tmp')
+        tmp_fp.write_text(json.dumps(self._digests, sort_keys=True, indent=2))
+        os.replace(tmp_fp, self._state_fp)
+
+    # _____________________________________________________________________________
+    def __changed_files(self, fund: config.Fund, is_full: bool) -> (List[Path], Dict[str, str], int):
+        files = sorted(self._data_path.glob(fund.pattern))
+        digests = {fp.name: file_digest(fp) for fp in files}
+        first = next((i for i, fp in enumerate(files)
+                      if is_full or self._digests.get(fp.name, None) != digests[fp.name]), len(files))
+        for fp in files[:first]:
+            _logger.debug(f'Unchanged "{fp.name}"')
+        # Later exports take precedence, so those after a changed export are merged again
+        return files[first:], digests, len(files)
+
+    # _____________________________________________________________________________
+    def process(self, funds: List[config.Fund], is_full: bool = False) -> List[FundResult]:
+        _logger.debug('process')
+
+        work = [(fund, *self.__changed_files(fund, is_full)) for fund in funds]
+        results = []
+        with concurrent.futures.ProcessPoolExecutor(max_workers=self._max_workers,
+                    mp_context=pool_context()) as executor:
+            futures = {fund.code: [(fp, executor.submit(parse_file, fund.parser, str(fp))) for fp in changed]
+                       for fund, changed, _, _ in work}
+
+            for fund, changed, digests, file_count in work:
+                csv_fp = Path(self._data_path, fund.csv_name)
+                series = read_series(csv_fp)
+                previous = dict(series)
+                ingested = prices = errors = 0
+
+                # Merge in file name order so later exports take precedence
+                for fp, future in futures[fund.code]:
+                    try:
+                        rows, skipped = future.result()
+                    except Exception as ex:
+                        _logger.exception(f'Error parsing "{fp.name}"')
+                        errors += 1
+                        continue
+                    for date in skipped:
+                        _logger.warning(f'{fund.code}: no redeem price for {date} in "{fp.name}"')
+                    _logger.info(f'{fund.code}: ingested {len(rows)} prices from "{fp.name}"')
+                    series.update(rows)
+                    self._digests[fp.name] = digests[fp.name]
+                    ingested += 1
+                    prices += len(rows)
+
+                added = len(series.keys() - previous.keys())
+                updated = sum(1 for d, p in previous.items() if series[d] != p)
+                if added or updated:
+                    write_series(csv_fp, series)
+                results.append(FundResult(fund, file_count, ingested, prices, added, updated, len(series), errors))
+
+        self.__write_state()
+        return results
@@ -0,0 +1,66 @@
+"""Parsers of unit prices from text exports of fund unit price PDF files.
+
+Prices are provided in PDF files.  To extract unit prices:
+1. Load PDF and use "File > Save as text ..." to create text file
+2. Save text file in the unit prices data directory with a name matching the fund's pattern
+
+A parser takes an iterable of lines and yields (date, price) tuples with the date as an ISO date string and the
+price as written in the export, or None for a row without a price.  Parsers run in pool worker processes, so do not
+log; rows without prices are reported by the caller.  Parsers are registered by name, at import, so that pool worker
+processes find them.
+"""
+import re
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+Parser = Callable[[Iterable[str]], Iterator[Tuple[str, Optional[str]]]]
+
+_parsers: Dict[str, Parser] = dict()
+
+_re_eg_date = re.compile(r'(20[\d]{6})')
+_re_eg_price = re.compile(r'(\d+(?:\.\d+))')
+
+
+# _____________________________________________________________________________
+def register_parser(name: str):
+    """Decorator registering a parser by name"""
+    def register(parser: Parser) -> Parser:
+        _parsers[name] = parser
+        return parser
+    return register
+
+
+# _____________________________________________________________________________
+def get_parser(name: str) -> Parser:
+    if (parser := _parsers.get(name, None)) is None:
+        raise ValueError(f'Unknown unit price parser "{name}"')
+    return parser
+
+
+# _____________________________________________________________________________
+def _strip_lines(iterator: Iterable[str]) -> Iterator[str]:
+    for ln in iterator:
+        # Skip lines with no content and not starting with a digit
+        if (ln := ln.strip()) and ln[0].isdigit():
+            yield ln
+
+
+# _____________________________________________________________________________
+@register_parser('eleyGriffiths')
+def parse_eley_griffiths(lines: Iterable[str]) -> Iterator[Tuple[str, Optional[str]]]:
+    """Yields redeem prices from Eley Griffiths exports.  Each row is a line with a date as YYYYMMDD followed by
+    lines of prices, of which the second is the redeem price.
+    """
+    def make_price(row):
+        date = row[0]
+        return f'{date[0:4]}-{date[4:6]}-{date[6:8]}', row[2] if len(row) > 2 else None
+
+    row = list()
+    for line in _strip_lines(lines):
+        if _re_eg_date.match(line):
+            if len(row) > 1:
+                yield make_price(row)
+            row = [line]
+        elif _re_eg_price.match(line):
+            row.append(line)
+    if len(row) > 1:
+        yield make_price(row)